@@ -4,8 +4,10 @@ from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+from app.database import RoutingSession, configure_engines, install_pragmas
 
-db = SQLAlchemy()
+# GET 請求的查詢由 RoutingSession 送到讀取連線 (見 app/database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'auth.login'
@@ -14,10 +16,46 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # 依資料庫設定檔建立主資料庫與讀取連線的引擎
+    pragmas = configure_engines(app)
     db.init_app(app)
+    with app.app_context():
+        install_pragmas(db, pragmas)
+    # 每個請求的查詢次數、耗時與 N+1 偵測
+    from app.sql_instrumentation import SqlInstrumentation
+    SqlInstrumentation().init_app(app, db)
+    # 請求延遲與熱點函式耗時 (/metrics)
+    from app.metrics import Metrics
+    Metrics().init_app(app)
+    # 管理員觸發的單一請求剖析 (X-Profile 標頭或 ?_profile=1)
+    from app.profiling import RequestProfiler
+    RequestProfiler().init_app(app)
     migrate.init_app(app, db)
     login.init_app(app) # <--- 確認這行存在
 
+    # 食材名稱自動完成服務 (每個 app 各自一份)，啟動時預先載入 TFDA 名稱索引
+    from app.search import AutocompleteService
+    autocomplete = AutocompleteService(
+        app.config.get('TFDA_IMPORT_STAMP'),
+        cache_ttl=app.config.get('AUTOCOMPLETE_CACHE_TTL', 30.0),
+        shared_stamp_path=app.config.get('AUTOCOMPLETE_STAMP')
+    )
+    autocomplete.init_app(app)
+    with app.app_context():
+        autocomplete.warm()
+
+    # 食譜營養與成本計算結果的快取，由 ORM 寫入事件維持一致
+    from app.nutrition_cache import NutritionCache
+    NutritionCache(
+        app.config.get('TFDA_IMPORT_STAMP'),
+        max_size=app.config.get('NUTRITION_CACHE_SIZE', 1024),
+        shared_stamp_path=app.config.get('NUTRITION_CACHE_STAMP')
+    ).init_app(app)
+
+    # 食材價格試算的成本模型 (每位使用者一份)，食譜、價格或產品異動時重新建立
+    from app.what_if import PortfolioModelCache
+    PortfolioModelCache(max_size=app.config.get('WHAT_IF_MODEL_CACHE_SIZE', 16)).init_app(app)
+
     # 註冊藍圖
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
@@ -36,6 +74,14 @@ def create_app(config_class=Config):
     from app.pricing import bp as pricing_bp #
     app.register_blueprint(pricing_bp, url_prefix='/pricing') #
 
+    # 銷售訂單 (收銀機批次寫入)
+    from app.orders import bp as orders_bp
+    app.register_blueprint(orders_bp, url_prefix='/orders')
+
+    # 管理員頁面 (請求剖析結果)
+    from app.admin import bp as admin_bp
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+
     return app
 
 # --- 確認這行在檔案的最底部 ---
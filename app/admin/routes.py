@@ -0,0 +1,52 @@
+# app/admin/routes.py
+# --- 管理員頁面 (帳號列在 ADMIN_USERNAMES) ---
+import functools
+import os
+
+from flask import abort, render_template, request, send_from_directory
+from flask_login import current_user, login_required
+
+from app.admin import bp
+from app.profiling import get_request_profiler
+
+# 剖析報表可選的排序方式
+PROFILE_SORTS = {'cumulative': '累計時間', 'tottime': '函式本身時間', 'calls': '呼叫次數'}
+
+
+def admin_required(view):
+    @functools.wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@bp.route('/profiles')
+@admin_required
+def profiles():
+    """最近的請求剖析結果。"""
+    return render_template('admin/profiles.html', title='請求剖析', profiles=get_request_profiler().recent())
+
+
+@bp.route('/profiles/<profile_id>')
+@admin_required
+def profile_detail(profile_id):
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in PROFILE_SORTS:
+        sort = 'cumulative'
+    report = get_request_profiler().report(profile_id, sort=sort)
+    if report is None:
+        abort(404)
+    return render_template('admin/profile_detail.html', title=f'剖析結果 {profile_id}',
+                           profile_id=profile_id, report=report, sort=sort, sorts=PROFILE_SORTS)
+
+
+@bp.route('/profiles/<profile_id>/download')
+@admin_required
+def download_profile(profile_id):
+    path = get_request_profiler().profile_path(profile_id)
+    if path is None:
+        abort(404)
+    return send_from_directory(os.path.dirname(path), os.path.basename(path), as_attachment=True)
@@ -0,0 +1,38 @@
+# app/cache_stamps.py
+# --- 跨行程的快取失效通知 ---
+# 營養計算快取與自動完成索引都存在各個行程 (gunicorn worker) 自己的記憶體中，
+# ORM 寫入事件只能讓「執行寫入的那個行程」的快取失效。
+# 因此每種快取另外使用一個共用的標記檔：任何行程提交了會讓快取失效的異動後更新檔案的修改時間，
+# 其他行程在查詢時比對修改時間 (一次 stat)，發現改變就捨棄自己的內容。
+# 與 TFDA_IMPORT_STAMP 的作法相同，只是改由 app 本身更新。
+import os
+import time
+
+
+class GenerationStamp:
+    """以檔案修改時間 (奈秒) 表示的共用世代；path 為 None 時停用 (只有單一行程)。"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        if not self.path:
+            return None
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def touch(self):
+        """更新檔案時間並回傳新的值；無法寫入時回傳 None。"""
+        if not self.path:
+            return None
+        # 同一個時間單位內連續更新時仍要讓時間改變
+        now = max(time.time_ns(), (self.read() or 0) + 1)
+        try:
+            with open(self.path, 'a'):
+                pass
+            os.utime(self.path, ns=(now, now))
+        except OSError:
+            return None
+        return self.read()
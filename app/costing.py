@@ -0,0 +1,296 @@
+# app/costing.py
+# --- 產品成本計算與自動重新計算 ---
+# Product.calculated_cost 是儲存下來的平均單位成本，食材或價格變動時必須重新計算
+# (食譜的營養與成本快照也在同一個事件中更新，見 app.recipe_snapshots)：
+#   1. 價格、食材或食譜的寫入會在 commit 前找出受影響的產品 (食材 → 食譜 → 產品 的反向依賴)，
+#      數量不多時直接在同一個交易中重新計算
+#   2. 受影響的產品太多時 (例如 TFDA 重新同步) 先標記為待計算 (cost_computed_at = NULL)，
+#      再由 recompute_stale_products() 以多個行程平行計算
+# 這裡的計算函式 (product_cost_breakdown、compute_product_costs) 都是純函式，
+# 不依賴資料庫，可以直接交給 ProcessPoolExecutor 執行。
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session, joinedload
+
+# 以多行程計算時，每批從資料庫載入的產品數
+RECOMPUTE_CHUNK_SIZE = 2000
+
+# 食材每公克成本的計算方式：代碼 -> (顯示名稱, ingredient_latest_price 中對應的彙總欄位)
+# 彙總欄位由 app.models.refresh_price_aggregates() 在價格異動時維護，成本計算只需讀取一個欄位
+COSTING_STRATEGIES = {
+    'latest': ('最新價格', 'latest_cost_per_gram'),
+    'moving_average': ('近期移動平均', 'moving_avg_cost_per_gram'),
+    'weighted_average': ('依購買量加權平均', 'weighted_avg_cost_per_gram'),
+    'recent_minimum': ('最近幾次購買的最低價', 'recent_min_cost_per_gram'),
+}
+DEFAULT_COSTING_STRATEGY = 'latest'
+
+
+def product_cost_breakdown(total_ingredient_cost, servings_count, batch_size, bake_power_w,
+                           bake_time_min, production_time_hr, electricity_cost_per_kwh, labor_cost_per_hour):
+    """由食譜的食材總成本與產品的生產參數，計算一批產品的各項成本與平均單位成本。"""
+    electricity_cost_total = 0
+    if bake_power_w and bake_time_min and bake_time_min > 0:
+        total_bake_time_hr = bake_time_min / 60.0
+        total_electricity_kwh = (bake_power_w * total_bake_time_hr) / 1000.0
+        electricity_cost_total = total_electricity_kwh * electricity_cost_per_kwh
+
+    labor_cost_total = 0
+    if production_time_hr:
+        labor_cost_total = production_time_hr * labor_cost_per_hour
+
+    batch_ingredient_cost = (total_ingredient_cost / (servings_count or 1)) * (batch_size or 1)
+
+    total_batch_cost = batch_ingredient_cost + electricity_cost_total + labor_cost_total
+
+    average_cost_per_product = 0
+    if batch_size and batch_size > 0:
+        average_cost_per_product = total_batch_cost / batch_size
+
+    return {
+        'total_ingredient_cost_for_recipe': total_ingredient_cost,
+        'batch_ingredient_cost': batch_ingredient_cost,
+        'electricity_cost_total': electricity_cost_total,
+        'labor_cost_total': labor_cost_total,
+        'total_batch_cost': total_batch_cost,
+        'average_cost_per_product': average_cost_per_product
+    }
+
+
+def compute_product_costs(jobs):
+    """
+    計算一批產品的平均單位成本，回傳 [(product_id, average_cost), ...]。
+    每個 job 只包含基本型別的資料 (見 load_cost_jobs)，因此可以在其他行程中執行。
+    食材成本的算法與 Recipe.calculate_nutrition() 相同：依使用者的計算方式有每公克成本時使用它，否則使用食材的預設成本。
+    """
+    results = []
+    for job in jobs:
+        total_ingredient_cost = 0
+        for _, quantity_g, unit_cost, default_cost_per_unit in job['items']:
+            if unit_cost is None:
+                unit_cost = default_cost_per_unit / 100.0
+            total_ingredient_cost += unit_cost * quantity_g
+        breakdown = product_cost_breakdown(total_ingredient_cost, **job['parameters'])
+        results.append((job['product_id'], breakdown['average_cost_per_product']))
+    return results
+
+
+# --- 依賴查詢 ---
+
+def affected_recipe_ids(keys):
+    """
+    由異動的依賴鍵 (格式同 app.nutrition_cache) 找出營養與成本會受影響的食譜 id。
+    查詢從 recipe_items.ingredient_id 的索引出發找到直接使用的食譜，
+    再以遞迴 CTE 加上把這些食譜當作子食譜 (直接或間接) 使用的食譜。
+    """
+    from app import db
+    from app.models import Recipe, RecipeItem
+    from app.recipe_graph import ancestor_recipe_ids
+
+    recipe_ids = {key[1] for key in keys if key[0] == 'recipe'}
+    ingredient_ids = {key[1] for key in keys if key[0] == 'ingredient'}
+    ingredients_by_user = {}
+    for key in keys:
+        if key[0] == 'price':
+            ingredients_by_user.setdefault(key[1], set()).add(key[2])
+
+    if ingredient_ids:
+        recipe_ids |= set(db.session.scalars(
+            select(RecipeItem.recipe_id).where(RecipeItem.ingredient_id.in_(ingredient_ids))
+        ))
+    for user_id, user_ingredient_ids in ingredients_by_user.items():
+        # 成本使用的是食譜作者的價格，因此只影響該使用者的食譜
+        recipe_ids |= set(db.session.scalars(
+            select(RecipeItem.recipe_id).join(Recipe, Recipe.id == RecipeItem.recipe_id).where(
+                Recipe.user_id == user_id,
+                RecipeItem.ingredient_id.in_(user_ingredient_ids)
+            )
+        ))
+    if recipe_ids:
+        recipe_ids |= ancestor_recipe_ids(recipe_ids)
+    return recipe_ids
+
+
+def affected_product_ids(keys, recipe_ids=None):
+    """由異動的依賴鍵找出成本會受影響的產品 id (已知受影響的食譜時可直接傳入 recipe_ids)。"""
+    from app import db
+    from app.models import Product
+
+    if recipe_ids is None:
+        recipe_ids = affected_recipe_ids(keys)
+    if not recipe_ids:
+        return set()
+    return set(db.session.scalars(select(Product.id).where(Product.recipe_id.in_(recipe_ids))))
+
+
+# --- 重新計算 ---
+
+def _cost_rates():
+    return {
+        'electricity_cost_per_kwh': current_app.config['ELECTRICITY_COST_PER_KWH'],
+        'labor_cost_per_hour': current_app.config['LABOR_COST_PER_HOUR'],
+    }
+
+
+def refresh_product_costs(product_ids):
+    """在目前的交易中重新計算並寫入指定產品的成本 (不 commit)。適合少量產品。"""
+    from app import db
+    from app.models import Product, calculate_nutrition_bulk
+
+    products = Product.query.options(joinedload(Product.recipe)).filter(Product.id.in_(product_ids)).all()
+    # 食譜已在同一個交易中被刪除的產品無法計算
+    products = [product for product in products if product.recipe is not None]
+    if not products:
+        return
+    nutrition_by_recipe = calculate_nutrition_bulk({product.recipe for product in products})
+    now = datetime.now(timezone.utc)
+    for product in products:
+        cost_data = product.calculate_total_product_cost(
+            recipe_cost_details=nutrition_by_recipe[product.recipe_id], **_cost_rates()
+        )
+        product.calculated_cost = cost_data['average_cost_per_product']
+        product.cost_computed_at = now
+    db.session.flush()
+
+
+def mark_products_stale(product_ids):
+    """將產品標記為成本待重新計算。"""
+    from app import db
+    from app.models import Product
+    db.session.execute(
+        update(Product).where(Product.id.in_(product_ids)).values(cost_computed_at=None)
+    )
+
+
+def recompute_stale_products(product_ids=None, workers=None):
+    """
+    重新計算待計算 (或指定) 產品的成本並 commit，回傳處理的產品數。
+    數量達 COST_RECOMPUTE_POOL_THRESHOLD 時，資料以集合式查詢載入後交由多個行程平行計算。
+    """
+    from app import db
+    from app.models import Product
+
+    query = select(Product.id).order_by(Product.id)
+    if product_ids is None:
+        query = query.where(Product.cost_computed_at.is_(None))
+    else:
+        query = query.where(Product.id.in_(product_ids))
+    ids = db.session.scalars(query).all()
+    if not ids:
+        return 0
+
+    if len(ids) < current_app.config.get('COST_RECOMPUTE_POOL_THRESHOLD', 2000):
+        for start in range(0, len(ids), RECOMPUTE_CHUNK_SIZE):
+            refresh_product_costs(ids[start:start + RECOMPUTE_CHUNK_SIZE])
+            db.session.commit()
+        return len(ids)
+
+    workers = workers or current_app.config.get('COST_RECOMPUTE_WORKERS') or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(ids), RECOMPUTE_CHUNK_SIZE):
+            jobs = load_cost_jobs(ids[start:start + RECOMPUTE_CHUNK_SIZE])
+            batch_size = -(-len(jobs) // workers)
+            batches = [jobs[offset:offset + batch_size] for offset in range(0, len(jobs), batch_size)]
+            now = datetime.now(timezone.utc)
+            db.session.execute(update(Product), [
+                {'id': product_id, 'calculated_cost': cost, 'cost_computed_at': now}
+                for results in pool.map(compute_product_costs, batches)
+                for product_id, cost in results
+            ])
+            db.session.commit()
+    return len(ids)
+
+
+def load_cost_jobs(product_ids):
+    """
+    以固定次數的查詢載入一批產品的計算資料，轉成只含基本型別的 job：
+    items 為 [(ingredient_id, quantity_g, 依食譜作者的計算方式得到的每公克成本或 None, 食材預設成本), ...]
+    (子食譜已展開成食材，同一食材可能出現多次)，
+    parameters 為 product_cost_breakdown() 除食材總成本以外的參數。
+    """
+    from app import db
+    from app.models import Ingredient, IngredientLatestPrice, Product, Recipe, User
+    from app.recipe_graph import flatten_ingredients, load_recipe_graph
+
+    products = db.session.execute(
+        select(
+            Product.id, Product.recipe_id, Recipe.user_id, User.costing_strategy, Recipe.servings_count,
+            Product.batch_size, Product.bake_power_w, Product.bake_time_min, Product.production_time_hr
+        ).join(Recipe, Recipe.id == Product.recipe_id).join(User, User.id == Recipe.user_id)
+        .where(Product.id.in_(product_ids))
+    ).all()
+
+    # 子食譜依成品重量按比例展開成食材用量，成本與營養計算 (Recipe.calculate_nutrition_bulk) 一致
+    graph = load_recipe_graph({row.recipe_id for row in products})
+    items_by_recipe = flatten_ingredients(graph, graph.keys())
+    ingredient_ids = {ingredient_id for items in items_by_recipe.values() for ingredient_id, _ in items}
+    default_costs = dict(db.session.execute(
+        select(Ingredient.id, Ingredient.cost_per_unit).where(Ingredient.id.in_(ingredient_ids))
+    ).all()) if ingredient_ids else {}
+
+    user_ids = {row.user_id for row in products}
+    cost_columns = [getattr(IngredientLatestPrice, column) for _, column in COSTING_STRATEGIES.values()]
+    aggregates = {
+        (row.user_id, row.ingredient_id): row._mapping
+        for row in db.session.execute(
+            select(IngredientLatestPrice.user_id, IngredientLatestPrice.ingredient_id, *cost_columns).where(
+                IngredientLatestPrice.user_id.in_(user_ids),
+                IngredientLatestPrice.ingredient_id.in_(ingredient_ids)
+            )
+        )
+    } if ingredient_ids else {}
+
+    rates = _cost_rates()
+    jobs = []
+    for row in products:
+        items = []
+        for ingredient_id, quantity_g in items_by_recipe.get(row.recipe_id, []):
+            entry = aggregates.get((row.user_id, ingredient_id))
+            unit_cost = entry[COSTING_STRATEGIES[row.costing_strategy][1]] if entry is not None else None
+            items.append((ingredient_id, quantity_g, unit_cost, default_costs.get(ingredient_id) or 0.0))
+        jobs.append({
+            'product_id': row.id,
+            'items': items,
+            'parameters': {
+                'servings_count': row.servings_count,
+                'batch_size': row.batch_size,
+                'bake_power_w': row.bake_power_w,
+                'bake_time_min': row.bake_time_min,
+                'production_time_hr': row.production_time_hr,
+                **rates,
+            },
+        })
+    return jobs
+
+
+# --- ORM 事件：commit 前重新計算受影響的產品 ---
+
+@event.listens_for(Session, 'before_commit')
+def _recompute_affected_products(session):
+    from app import db
+    from app.nutrition_cache import pending_dependency_keys
+    from app.recipe_snapshots import update_affected_snapshots
+    if not has_app_context() or session is not db.session():
+        return
+
+    # 先 flush，讓尚未寫出的異動也被記錄為依賴鍵
+    session.flush()
+    keys = pending_dependency_keys(session)
+    if not keys:
+        return
+    recipe_ids = affected_recipe_ids(keys)
+    if not recipe_ids:
+        return
+    # 食譜的營養與成本快照：被儲存的食譜立即重算，其餘受影響的食譜標記為過期
+    update_affected_snapshots(keys, recipe_ids)
+    product_ids = affected_product_ids(keys, recipe_ids)
+    if not product_ids:
+        return
+    if len(product_ids) <= current_app.config.get('COST_RECOMPUTE_INLINE_LIMIT', 200):
+        refresh_product_costs(product_ids)
+    else:
+        mark_products_stale(product_ids)
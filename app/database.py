@@ -0,0 +1,154 @@
+# app/database.py
+# --- 資料庫引擎設定與讀寫分流 ---
+# 依連線字串選擇引擎設定檔 (也可以用 DATABASE_PROFILE 指定)：
+#   - sqlite : 每條連線建立時設定 busy_timeout、mmap_size 與 synchronous，SQLITE_WAL 開啟時另外切換為 WAL；
+#              寫入彼此排隊等候 busy_timeout 而不是立即回報 "database is locked"，WAL 模式下讀取也不會擋住寫入
+#   - server : PostgreSQL / MySQL 等伺服器資料庫，使用固定大小的連線池並在取出連線前 pre-ping
+# 讀取流量另外走 "replica" 連線：有設定 DATABASE_READ_URI 時連到唯讀副本，
+# SQLite 檔案資料庫則另開一組同一檔案的唯讀連線 (mode=ro + query_only)，讀寫各自使用自己的連線池。
+# RoutingSession 只在 GET / HEAD 請求中把查詢送到讀取連線；flush、INSERT / UPDATE / DELETE 一律使用主資料庫，
+# 且同一個 session 寫入過之後的查詢也留在主資料庫，確保讀得到自己剛寫入的資料。
+# 可能在讀取後寫回資料的 GET 端點 (例如補算過期的快照或成本) 以 @use_primary 標記，從第一個查詢起就使用主資料庫，
+# 避免依據副本上尚未同步的資料計算後寫回主資料庫。
+import functools
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# 讀取連線在 SQLALCHEMY_BINDS 中的名稱
+READ_BIND_KEY = 'replica'
+# 會被送到讀取連線的 HTTP 方法
+READ_METHODS = frozenset({'GET', 'HEAD'})
+
+
+def sqlite_profile(config, read_only=False):
+    """SQLite 檔案資料庫的引擎參數與每條連線要執行的 PRAGMA。"""
+    pragmas = {
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT_MS'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+    }
+    if read_only:
+        pragmas['query_only'] = 'ON'
+    elif config.get('SQLITE_WAL'):
+        # journal_mode 會永久寫入資料庫檔案，只能由可寫入的連線設定，且只在明確開啟時切換
+        pragmas = {'journal_mode': 'WAL', **pragmas}
+    options = {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0}}
+    return options, pragmas
+
+
+def server_profile(config, read_only=False):
+    """伺服器資料庫的連線池參數。"""
+    options = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+    return options, {}
+
+
+ENGINE_PROFILES = {
+    'sqlite': sqlite_profile,
+    'server': server_profile,
+}
+
+
+def _profile_name(uri, config):
+    if config.get('DATABASE_PROFILE'):
+        return config['DATABASE_PROFILE']
+    return 'sqlite' if make_url(uri).get_backend_name() == 'sqlite' else 'server'
+
+
+def _is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def _sqlite_read_only_uri(uri):
+    """同一個 SQLite 檔案的唯讀連線字串 (sqlite:///file:<path>?mode=ro&uri=true)。"""
+    url = make_url(uri)
+    database = url.database
+    if url.query.get('uri'):
+        database = database.split('?', 1)[0][len('file:'):]
+    return url.set(database=f'file:{database}', query={'mode': 'ro', 'uri': 'true'}).render_as_string(
+        hide_password=False
+    )
+
+
+def configure_engines(app):
+    """
+    在 db.init_app() 之前呼叫：依設定檔填入主資料庫與讀取連線的引擎參數，
+    回傳 {bind key: PRAGMA}，由 install_pragmas() 在引擎建立後掛上連線事件。
+    已明確設定的 SQLALCHEMY_ENGINE_OPTIONS / SQLALCHEMY_BINDS 優先。
+    """
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    pragmas = {}
+
+    profile = _profile_name(uri, config)
+    options, pragmas[None] = ENGINE_PROFILES[profile](config)
+    if profile == 'sqlite' and not _is_sqlite_file(uri):
+        # 記憶體資料庫由 Flask-SQLAlchemy 使用單一連線，不套用連線參數
+        options, pragmas[None] = {}, {}
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+    read_uri = config.get('DATABASE_READ_URI')
+    if not read_uri and profile == 'sqlite' and _is_sqlite_file(uri) and config.get('SQLITE_READ_ONLY_CONNECTION'):
+        read_uri = _sqlite_read_only_uri(uri)
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    if read_uri and READ_BIND_KEY not in binds:
+        read_options, pragmas[READ_BIND_KEY] = ENGINE_PROFILES[_profile_name(read_uri, config)](config, read_only=True)
+        binds[READ_BIND_KEY] = {'url': read_uri, **read_options}
+        config['SQLALCHEMY_BINDS'] = binds
+    return pragmas
+
+
+def install_pragmas(db, pragmas):
+    """為 SQLite 引擎掛上 connect 事件，每條新連線都先執行設定檔的 PRAGMA。"""
+    for bind_key, statements in pragmas.items():
+        engine = db.engines.get(bind_key)
+        if statements and engine is not None and engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', functools.partial(_apply_pragmas, statements))
+
+
+def _apply_pragmas(statements, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in statements.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+class RoutingSession(Session):
+    """GET / HEAD 請求中的唯讀查詢送到讀取連線，其餘 (含寫入之後的查詢) 使用主資料庫。"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._route_to_replica(clause):
+            engine = self._db.engines.get(READ_BIND_KEY)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _route_to_replica(self, clause):
+        if self.info.get('use_primary'):
+            return False
+        if self._flushing or getattr(clause, 'is_dml', False):
+            # 寫入過之後，這個 session 的查詢都留在主資料庫
+            self.info['use_primary'] = True
+            return False
+        return has_request_context() and request.method in READ_METHODS
+
+
+def use_primary(view):
+    """view 的所有查詢都使用主資料庫 (用於可能在讀取後寫回資料的 GET 端點)。"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from app import db
+        db.session.info['use_primary'] = True
+        return view(*args, **kwargs)
+    return wrapper
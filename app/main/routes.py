@@ -1,9 +1,26 @@
 # --- 完整程式碼，請直接覆蓋 ---
-from flask import render_template
+from flask import render_template, jsonify, current_app
+from flask_login import login_required
 from app.main import bp
+from app.metrics import get_metrics
 
 @bp.route('/')
 @bp.route('/index')
 def index():
     # 修正點：從直接回傳文字，改成渲染一個HTML樣板
-    return render_template('main/index.html', title='首頁')
\ No newline at end of file
+    return render_template('main/index.html', title='首頁')
+
+@bp.route('/api/cache_stats')
+@login_required
+def cache_stats():
+    """回傳營養計算快取與食材自動完成快取的命中統計。"""
+    return jsonify({
+        'nutrition': current_app.extensions['nutrition_cache'].snapshot(),
+        'autocomplete': dict(current_app.extensions['autocomplete'].stats),
+    })
+
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus 文字格式的效能指標 (所有 worker 行程加總，見 app/metrics.py)。"""
+    return get_metrics().view()
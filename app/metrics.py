@@ -0,0 +1,349 @@
+# app/metrics.py
+# --- 效能指標 (Prometheus 文字格式) ---
+# 以行程內的計數器與直方圖記錄：
+#   - 每個端點的請求延遲                      http_request_duration_seconds{endpoint, method, status}
+#   - 熱點函式與匯入各階段的耗時               app_operation_duration_seconds{operation}
+#     (營養計算、產品成本、營養標示、食材搜尋、價格匯入、TFDA 匯入)
+#   - SQL 統計與快取命中數 (抓取時由 app.sql_instrumentation 與各快取的統計轉換而來)
+# 記錄只在行程內加總 (一次 bisect 與一次加鎖)，不做任何 I/O。
+# 多個 worker 行程 (gunicorn 等) 時設定 METRICS_MULTIPROC_DIR：每個行程定期把自己的累計值
+# 整份寫入 <目錄>/metrics_<pid>.json (先寫暫存檔再 rename，讀取端不會讀到寫一半的檔案)，
+# /metrics 讀取目錄中所有行程的檔案後加總；已結束的行程其計數器仍保留，量表 (gauge) 只加總仍存活的行程。
+# 目錄應在每次部署啟動前清空，與 prometheus_client 的 multiprocess 模式相同。
+import bisect
+import functools
+import glob
+import hmac
+import json
+import math
+import os
+import threading
+import time
+
+from flask import Response, abort, current_app, g, request
+from flask_login import current_user
+
+# 直方圖的上界 (秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# 找不到對應端點的請求 (404 等) 共用一個標籤，避免任意網址造成標籤數量爆增
+UNMATCHED_ENDPOINT = 'unmatched'
+
+METRIC_HELP = {
+    'http_request_duration_seconds': '每個端點的請求處理時間',
+    'app_operation_duration_seconds': '熱點函式與匯入階段的執行時間',
+    'app_sql_queries_total': '端點執行的 SQL 查詢總數',
+    'app_sql_duration_seconds_total': '端點的 SQL 總耗時',
+    'app_sql_n_plus_one_requests_total': '疑似 N+1 查詢的請求數',
+    'app_cache_events_total': '快取的命中、未命中與失效次數',
+    'app_cache_entries': '快取目前的項目數',
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    行程內的指標儲存區：計數器、量表與直方圖 (以 (名稱, 標籤) 為鍵)。
+    每個行程一份 (見模組層級的 REGISTRY)，fork 出的子行程會重新開始計數，避免與父行程重複加總。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.directory = None
+        self.flush_interval = 5.0
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}   # (名稱, 標籤) -> [各區間次數..., 總和]
+        self._last_flush = 0.0
+
+    def configure(self, directory=None, flush_interval=None):
+        """設定多行程彙總的目錄 (None 表示只在行程內統計) 與寫出間隔秒數。"""
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory or None
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+    # --- 記錄 ---
+
+    def observe(self, name, seconds, **labels):
+        index = bisect.bisect_left(self.buckets, seconds)
+        key = (name, _label_key(labels))
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * len(self.buckets) + [0.0]
+            values[index] += 1
+            values[-1] += seconds
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_total(self, name, value, **labels):
+        """以外部已累計的總數設定計數器 (例如 SQL 統計、快取統計)。"""
+        with self._lock:
+            self._counters[(name, _label_key(labels))] = value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    # --- 多行程彙總 ---
+
+    def state(self):
+        """本行程累計值的複本 (可序列化為 JSON)。"""
+        with self._lock:
+            return {
+                'pid': self._pid,
+                'buckets': [bound if bound != math.inf else None for bound in self.buckets],
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self._gauges.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def flush_due(self):
+        return self.directory is not None and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        """把本行程的累計值整份寫入多行程目錄 (未設定目錄時不做任何事)。"""
+        if self.directory is None:
+            return
+        self._last_flush = time.monotonic()
+        path = os.path.join(self.directory, f'metrics_{self._pid}.json')
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as fp:
+            json.dump(self.state(), fp)
+        os.replace(temporary, path)
+
+    def collect(self):
+        """回傳所有行程加總後的狀態；未設定目錄時只有本行程。"""
+        if self.directory is None:
+            return merge_states([self.state()])
+        self.flush()
+        states = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            try:
+                with open(path, encoding='utf-8') as fp:
+                    states.append(json.load(fp))
+            except (OSError, ValueError):
+                # 檔案剛好被刪除或不完整時略過這一份
+                continue
+        return merge_states(states)
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def merge_states(states):
+    """加總多個行程的 state()：計數器與直方圖相加，量表只加總仍存活的行程。"""
+    merged = {'counters': {}, 'gauges': {}, 'histograms': {}, 'buckets': None}
+    for state in states:
+        buckets = [bound if bound is not None else math.inf for bound in state['buckets']]
+        if merged['buckets'] is None:
+            merged['buckets'] = buckets
+        for name, labels, value in state['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        if _pid_alive(state['pid']):
+            for name, labels, value in state['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                merged['gauges'][key] = merged['gauges'].get(key, 0) + value
+        if buckets != merged['buckets']:
+            # 區間設定不同的舊檔案 (部署前未清空目錄) 無法相加，直方圖略過
+            continue
+        for name, labels, values in state['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = merged['histograms'].get(key)
+            merged['histograms'][key] = values if total is None else [a + b for a, b in zip(total, values)]
+    return merged
+
+
+# --- Prometheus 文字格式 ---
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(state):
+    """把 merge_states() 的結果轉成 Prometheus 文字格式。"""
+    lines = []
+
+    def header(name, kind):
+        if METRIC_HELP.get(name):
+            lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    for kind, series in (('counter', state['counters']), ('gauge', state['gauges'])):
+        current = None
+        for (name, labels), value in sorted(series.items()):
+            if name != current:
+                header(name, kind)
+                current = name
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    current = None
+    for (name, labels), values in sorted(state['histograms'].items()):
+        if name != current:
+            header(name, 'histogram')
+            current = name
+        cumulative = 0
+        for bound, count in zip(state['buckets'], values):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_value(bound))])} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(values[-1])}')
+        lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+# 每個行程一份；fork 之後子行程清空重新計數
+REGISTRY = MetricsRegistry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=REGISTRY._reset)
+
+
+class timed:
+    """
+    記錄執行時間到 app_operation_duration_seconds{operation}，可當作裝飾器或 with 區塊使用：
+        @timed('calculate_nutrition')
+        def ...
+        with timed('tfda_import.sync'):
+            ...
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe('app_operation_duration_seconds', time.perf_counter() - start,
+                                 operation=self.operation)
+        return wrapper
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        REGISTRY.observe('app_operation_duration_seconds', time.perf_counter() - self._start,
+                         operation=self.operation)
+        return False
+
+
+class Metrics:
+    """Flask 整合：記錄每個請求的延遲，定期寫出多行程檔案，並提供 /metrics 的內容。"""
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+
+    def init_app(self, app):
+        self.registry.configure(app.config.get('METRICS_MULTIPROC_DIR'), app.config.get('METRICS_FLUSH_INTERVAL'))
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['metrics'] = self
+
+    # --- 請求 ---
+
+    @staticmethod
+    def _start_request():
+        g.metrics_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        self._observe_request(response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        # 未處理的例外不會經過 after_request，在這裡以 500 記錄
+        if exc is not None:
+            self._observe_request(500)
+
+    def _observe_request(self, status):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        self.registry.observe(
+            'http_request_duration_seconds', time.perf_counter() - start,
+            endpoint=request.endpoint or UNMATCHED_ENDPOINT, method=request.method, status=status
+        )
+        if self.registry.flush_due():
+            self.collect_app_stats()
+            self.registry.flush()
+
+    # --- 匯出 ---
+
+    def collect_app_stats(self):
+        """把 SQL 統計與快取統計 (各自在行程內累計) 轉成指標。"""
+        registry = self.registry
+        instrumentation = current_app.extensions.get('sql_instrumentation')
+        if instrumentation is not None:
+            for endpoint, entry in instrumentation.snapshot().items():
+                registry.set_total('app_sql_queries_total', entry['queries'], endpoint=endpoint)
+                registry.set_total('app_sql_duration_seconds_total', entry['db_time'], endpoint=endpoint)
+                registry.set_total('app_sql_n_plus_one_requests_total', entry['n_plus_one_requests'], endpoint=endpoint)
+        nutrition_cache = current_app.extensions.get('nutrition_cache')
+        if nutrition_cache is not None:
+            stats = nutrition_cache.snapshot()
+            for event in ('hits', 'misses', 'invalidations', 'evictions'):
+                registry.set_total('app_cache_events_total', stats[event], cache='nutrition', event=event)
+            registry.set_gauge('app_cache_entries', stats['size'], cache='nutrition')
+        autocomplete = current_app.extensions.get('autocomplete')
+        if autocomplete is not None:
+            for event, value in dict(autocomplete.stats).items():
+                registry.set_total('app_cache_events_total', value, cache='autocomplete', event=event)
+
+    def exposition(self):
+        self.collect_app_stats()
+        return render(self.registry.collect())
+
+    def view(self):
+        """
+        /metrics：預設拒絕存取 (端點名稱與流量屬於內部資訊)。
+        以 Authorization: Bearer <METRICS_TOKEN> 存取 (供 Prometheus 抓取)，或以管理員身分登入後瀏覽。
+        """
+        token = current_app.config.get('METRICS_TOKEN')
+        authorization = request.headers.get('Authorization', '')
+        token_ok = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+        if not token_ok and not getattr(current_user, 'is_admin', False):
+            abort(403)
+        return Response(self.exposition(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def get_metrics():
+    return current_app.extensions.get('metrics')
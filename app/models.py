@@ -3,10 +3,23 @@
 from datetime import datetime, timezone
 from app import db, login
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app
 from flask_login import UserMixin
 from sqlalchemy.sql import func
 import json
 from sqlalchemy import desc
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from app.nutrition import NUTRIENT_FIELDS, NutrientMatrix, totals_as_dict
+from app.metrics import timed
+from app.nutrition_cache import get_nutrition_cache, record_price_changes
+from app.costing import COSTING_STRATEGIES, DEFAULT_COSTING_STRATEGY, product_cost_breakdown
+from app.units import cost_per_gram, cost_per_gram_sql, grams_per_unit_sql
+from app.recipe_graph import dependency_closure, load_recipe_graph, recipe_weight, topological_order
+from sqlalchemy import case
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 
 @login.user_loader
 def load_user(id):
@@ -25,8 +38,17 @@ class User(UserMixin, db.Model):
     ingredients = db.relationship('Ingredient', back_populates='creator', lazy='dynamic')
     orders = db.relationship('Order', back_populates='staff', lazy='dynamic')
     ingredient_prices = db.relationship('IngredientPrice', back_populates='user', lazy='dynamic')
+    # 食材成本的計算方式 (見 app.costing.COSTING_STRATEGIES) 與移動平均、近期最低所用的期間
+    costing_strategy = db.Column(db.String(32), nullable=False, default=DEFAULT_COSTING_STRATEGY,
+                                 server_default=DEFAULT_COSTING_STRATEGY)
+    costing_window_days = db.Column(db.Integer, nullable=False, default=90, server_default='90')
+    costing_window_purchases = db.Column(db.Integer, nullable=False, default=5, server_default='5')
     def set_password(self, password): self.password_hash = generate_password_hash(password)
     def check_password(self, password): return check_password_hash(self.password_hash, password)
+    @property
+    def is_admin(self):
+        # 管理員帳號由設定檔 ADMIN_USERNAMES 指定
+        return self.username in current_app.config['ADMIN_USERNAMES']
     def __repr__(self): return f'<User {self.username}>'
 
 class Ingredient(db.Model):
@@ -39,8 +61,13 @@ class Ingredient(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     creator = db.relationship('User', back_populates='ingredients')
     tfda_id = db.Column(db.String(64), unique=True, nullable=True, index=True)
+    # TFDA 匯入時的內容雜湊 (名稱 + 營養素)，用來跳過沒有變動的資料
+    content_hash = db.Column(db.String(64), nullable=True)
     cost_per_unit = db.Column(db.Float, nullable=False, default=0)
     unit_name = db.Column(db.String(16), default='g')
+    # 購買單位換算：容量單位 (ml、公升…) 的密度，以及計數單位 (個、包…) 的每件重量
+    density_g_per_ml = db.Column(db.Float, nullable=True)
+    piece_weight_g = db.Column(db.Float, nullable=True)
     prices = db.relationship('IngredientPrice', back_populates='ingredient', lazy='dynamic', cascade="all, delete-orphan")
     calories_kcal = db.Column(db.Float, default=0)
     protein_g = db.Column(db.Float, default=0)
@@ -54,6 +81,10 @@ class Ingredient(db.Model):
 
 class IngredientPrice(db.Model):
     __tablename__ = 'ingredient_prices'
+    # 支援「某使用者對某食材的最新價格」查詢與 IngredientLatestPrice 的重新整理
+    __table_args__ = (
+        db.Index('ix_ingredient_prices_user_ingredient_date', 'user_id', 'ingredient_id', 'purchase_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -69,43 +100,208 @@ class IngredientPrice(db.Model):
     user = db.relationship('User', back_populates='ingredient_prices')
 
     def calculate_cost_per_gram(self):
-        if self.quantity and self.quantity > 0:
-            converted_quantity_base_unit = self.quantity
-            unit_lower = self.unit.lower()
-            
-            if unit_lower == 'kg' or unit_lower == '公斤':
-                converted_quantity_base_unit *= 1000
-            elif unit_lower == 'l' or unit_lower == '公升':
-                converted_quantity_base_unit *= 1000
-            elif unit_lower == 'ml' or unit_lower == '毫升':
-                pass
-            
-            return self.price / converted_quantity_base_unit
-        return 0
+        """每公克成本；單位無法換算成公克時 (例如未設定每件重量的「個」) 回傳 None。"""
+        return cost_per_gram(self.price, self.quantity, self.unit,
+                             self.ingredient.density_g_per_ml, self.ingredient.piece_weight_g)
 
     def __repr__(self):
         return f'<IngredientPrice {self.ingredient.food_name} - {self.price}/{self.quantity}{self.unit}>'
 
 
+class IngredientLatestPrice(db.Model):
+    """
+    每位使用者對每項食材的價格彙總 (反正規化表)：最新一筆價格紀錄，以及各種成本計算方式的每公克成本。
+    由 refresh_latest_prices() 在價格新增、修改、刪除及批次匯入時，只針對異動的 (user_id, ingredient_id) 重新彙總；
+    成本計算直接讀取使用者所選計算方式的欄位，不必再查詢價格歷史。
+    """
+    __tablename__ = 'ingredient_latest_price'
+    # 價格列表依最新購買日期排序的分頁使用
+    __table_args__ = (
+        db.Index('ix_ingredient_latest_price_user_date', 'user_id', 'purchase_date', 'ingredient_id'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id', ondelete='CASCADE'), primary_key=True)
+    price_id = db.Column(db.Integer, db.ForeignKey('ingredient_prices.id', ondelete='CASCADE'), nullable=False)
+    purchase_date = db.Column(db.DateTime(timezone=True))
+    purchase_count = db.Column(db.Integer)
+    # 各計算方式的每公克成本；沒有可換算成公克的價格紀錄時為 NULL
+    latest_cost_per_gram = db.Column(db.Float)
+    moving_avg_cost_per_gram = db.Column(db.Float)
+    weighted_avg_cost_per_gram = db.Column(db.Float)
+    recent_min_cost_per_gram = db.Column(db.Float)
+    price_entry = db.relationship('IngredientPrice')
+
+    def cost_per_gram_for(self, strategy):
+        """所選計算方式的每公克成本 (無法換算時為 None)。"""
+        return getattr(self, COSTING_STRATEGIES[strategy][1])
+
+    def __repr__(self):
+        return f'<IngredientLatestPrice user:{self.user_id} ingredient:{self.ingredient_id} price:{self.price_id}>'
+
+
+class _day_number(FunctionElement):
+    """日期時間換算成以「日」為單位的數值，用於「最新購買日往前 N 天」這類比較。"""
+    type = db.Float()
+    inherit_cache = True
+
+
+@compiles(_day_number)
+def _compile_day_number(element, compiler, **kw):
+    return 'EXTRACT(EPOCH FROM %s) / 86400.0' % compiler.process(element.clauses, **kw)
+
+
+@compiles(_day_number, 'sqlite')
+def _compile_day_number_sqlite(element, compiler, **kw):
+    # SQLite 以字串儲存日期時間，julianday() 可解析有無微秒的兩種格式
+    return 'julianday(%s)' % compiler.process(element.clauses, **kw)
+
+
+def refresh_latest_prices(pairs):
+    """
+    重新彙總指定 (user_id, ingredient_id) 組合的價格，並寫回 ingredient_latest_price。
+    以集合式的 DELETE + INSERT ... SELECT 完成，單筆編輯與批次匯入都適用。
+    請在 commit 之前呼叫，讓它與價格異動屬於同一個交易。
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    refresh_price_aggregates({user_id for user_id, _ in pairs}, {ingredient_id for _, ingredient_id in pairs})
+    record_price_changes(db.session, pairs)
+
+
+def refresh_price_aggregates(user_ids=None, ingredient_ids=None):
+    """
+    重新彙總 ingredient_latest_price 中符合條件的資料列 (None 代表不限)。
+    除了價格異動之外，食材的密度或每件重量改變 (換算結果不同)、使用者調整計算期間時也需要呼叫。
+    每公克成本以 app.units.cost_per_gram_sql 在資料庫中換算，與 cost_per_gram() 的結果相同：
+      - latest_cost_per_gram       最新一筆 (依購買日期、id)
+      - moving_avg_cost_per_gram   最新一筆購買日往前 costing_window_days 天內各筆的平均
+      - weighted_avg_cost_per_gram 依購買量加權的平均 (總金額 / 總公克數)
+      - recent_min_cost_per_gram   最近 costing_window_purchases 筆中的最低值
+    不呼叫 record_price_changes()，由呼叫端視需要通知快取與產品成本。
+    """
+    db.session.flush()
+
+    def where(user_column, ingredient_column):
+        conditions = []
+        if user_ids is not None:
+            conditions.append(user_column.in_(user_ids))
+        if ingredient_ids is not None:
+            conditions.append(ingredient_column.in_(ingredient_ids))
+        return conditions
+
+    db.session.execute(
+        IngredientLatestPrice.__table__.delete().where(
+            *where(IngredientLatestPrice.user_id, IngredientLatestPrice.ingredient_id)
+        )
+    )
+
+    partition = (IngredientPrice.user_id, IngredientPrice.ingredient_id)
+    newest_first = (desc(IngredientPrice.purchase_date), desc(IngredientPrice.id))
+    conversion = (IngredientPrice.unit, Ingredient.density_g_per_ml, Ingredient.piece_weight_g)
+    ranked = db.select(
+        IngredientPrice.user_id,
+        IngredientPrice.ingredient_id,
+        IngredientPrice.id.label('price_id'),
+        IngredientPrice.purchase_date,
+        IngredientPrice.price,
+        (IngredientPrice.quantity * grams_per_unit_sql(*conversion)).label('grams'),
+        cost_per_gram_sql(IngredientPrice.price, IngredientPrice.quantity, *conversion).label('cost'),
+        func.row_number().over(partition_by=partition, order_by=newest_first).label('rank'),
+        func.first_value(IngredientPrice.purchase_date).over(
+            partition_by=partition, order_by=newest_first
+        ).label('latest_date')
+    ).join(
+        Ingredient, Ingredient.id == IngredientPrice.ingredient_id
+    ).where(
+        *where(IngredientPrice.user_id, IngredientPrice.ingredient_id)
+    ).subquery()
+
+    is_latest = ranked.c.rank == 1
+    in_window = _day_number(ranked.c.purchase_date) >= _day_number(ranked.c.latest_date) - User.costing_window_days
+    aggregates = db.select(
+        ranked.c.user_id,
+        ranked.c.ingredient_id,
+        func.max(case((is_latest, ranked.c.price_id))),
+        func.max(case((is_latest, ranked.c.purchase_date))),
+        func.count(),
+        func.max(case((is_latest, ranked.c.cost))),
+        func.avg(case((in_window, ranked.c.cost))),
+        func.sum(case((ranked.c.grams.is_not(None), ranked.c.price))) / func.nullif(func.sum(ranked.c.grams), 0),
+        func.min(case((ranked.c.rank <= User.costing_window_purchases, ranked.c.cost))),
+    ).join(
+        User, User.id == ranked.c.user_id
+    ).group_by(ranked.c.user_id, ranked.c.ingredient_id)
+
+    db.session.execute(
+        IngredientLatestPrice.__table__.insert().from_select(
+            ['user_id', 'ingredient_id', 'price_id', 'purchase_date', 'purchase_count',
+             'latest_cost_per_gram', 'moving_avg_cost_per_gram', 'weighted_avg_cost_per_gram',
+             'recent_min_cost_per_gram'],
+            aggregates
+        )
+    )
+
+
 class Recipe(db.Model):
     __tablename__ = 'recipes'
+    # 列表 API 的 keyset 分頁 (依名稱或修改時間排序) 使用
+    __table_args__ = (
+        db.Index('ix_recipes_user_name', 'user_id', 'recipe_name', 'id'),
+        db.Index('ix_recipes_user_updated', 'user_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     recipe_name = db.Column(db.String(128), index=True, nullable=False)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
-    updated_at = db.Column(db.DateTime(timezone=True), onupdate=func.now())
+    # 建立時也寫入，依修改時間排序的分頁才不會遇到 NULL
+    updated_at = db.Column(db.DateTime(timezone=True), default=func.now(), onupdate=func.now())
     serving_weight_g = db.Column(db.Float, default=100.0)
     final_weight_g = db.Column(db.Float, nullable=True)
     servings_count = db.Column(db.Integer, default=1)
     label_options = db.Column(db.JSON)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    # --- 營養與成本快照 (見 app.recipe_snapshots) ---
+    # 列表頁與標示頁直接讀取；snapshot_computed_at 為 NULL 表示食材、價格或子食譜已變動，快照待重新計算
+    snapshot_version = db.Column(db.Integer, nullable=True)
+    snapshot_hash = db.Column(db.String(64), nullable=True)
+    snapshot_computed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    snapshot_total_weight_g = db.Column(db.Float, nullable=True)
+    snapshot_calories_kcal = db.Column(db.Float, nullable=True)
+    snapshot_protein_g = db.Column(db.Float, nullable=True)
+    snapshot_fat_g = db.Column(db.Float, nullable=True)
+    snapshot_saturated_fat_g = db.Column(db.Float, nullable=True)
+    snapshot_trans_fat_g = db.Column(db.Float, nullable=True)
+    snapshot_carbohydrate_g = db.Column(db.Float, nullable=True)
+    snapshot_sugar_g = db.Column(db.Float, nullable=True)
+    snapshot_sodium_mg = db.Column(db.Float, nullable=True)
+    snapshot_total_ingredient_cost = db.Column(db.Float, nullable=True)
+    snapshot_has_trans_fat_non_art = db.Column(db.Boolean, nullable=True)
+
     author = db.relationship('User', back_populates='recipes')
-    ingredients = db.relationship('RecipeItem', back_populates='recipe', cascade="all, delete-orphan")
+    ingredients = db.relationship('RecipeItem', back_populates='recipe', cascade="all, delete-orphan",
+                                  foreign_keys='RecipeItem.recipe_id')
     def __repr__(self): return f'<Recipe {self.recipe_name}>'
 
+    @timed('calculate_nutrition')
     def calculate_nutrition(self):
+        # 單一食譜也走批次計算路徑，確保查詢次數固定
+        return _compute_nutrition([self])[0]
+
+    def nutrition_snapshot(self):
+        """快照仍有效時回傳其總計 (格式同 calculate_nutrition()，但不含成本明細)，否則回傳 None。"""
+        from app.recipe_snapshots import snapshot_totals
+        return snapshot_totals(self)
+
+    def _accumulate_nutrition(self, latest_prices, strategy, nutrient_totals, sub_recipes=None):
+        """
+        依據已載入的食材項目與價格彙總對照表，累加出重量與成本總計。
+        latest_prices 的鍵為 (user_id, ingredient_id)，值為 IngredientLatestPrice (已載入最新一筆價格紀錄)；
+        strategy 為食譜作者的成本計算方式；nutrient_totals 為營養引擎算好的八項營養素總量 (只含食材項目)；
+        sub_recipes 為 {子食譜 id: (名稱, 成品重量, 計算結果)}，子食譜項目依用量 / 成品重量按比例累加。
+        """
         totals = {
-            'calories_kcal': 0, 'protein_g': 0, 'fat_g': 0, 'carbohydrate_g': 0,
-            'saturated_fat_g': 0, 'trans_fat_g': 0, 'sugar_g': 0, 'sodium_mg': 0,
+            **nutrient_totals,
             'total_weight_g': 0,
             'total_ingredient_cost': 0,
             'ingredient_cost_details': [],
@@ -116,37 +312,39 @@ class Recipe(db.Model):
             return totals
 
         for item in self.ingredients:
+            if item.sub_recipe_id is not None:
+                self._accumulate_sub_recipe(item, sub_recipes[item.sub_recipe_id], totals)
+                continue
+
             current_ingredient_cost_per_gram = 0
             cost_source_info = "無價格紀錄"
             purchase_unit_info = ""
 
-            # --- 修改處：從查詢最高價改為查詢「最新」的一筆價格 ---
-            latest_price_entry = db.session.query(IngredientPrice).filter_by(
-                ingredient_id=item.ingredient.id,
-                user_id=self.user_id # 確保只查找登入使用者的價格
-            ).order_by(
-                desc(IngredientPrice.purchase_date) # 按購買日期降序排列
-            ).first()
+            # 從預先載入的對照表取得該使用者對此食材的價格彙總，依計算方式讀取每公克成本
+            aggregate = latest_prices.get((self.user_id, item.ingredient.id))
+            latest_price_entry = aggregate.price_entry if aggregate else None
+            strategy_label = COSTING_STRATEGIES[strategy][0]
 
             if latest_price_entry:
-                current_ingredient_cost_per_gram = latest_price_entry.calculate_cost_per_gram()
-                cost_source_info = f"{latest_price_entry.source} ({latest_price_entry.purchase_date.strftime('%Y-%m-%d')})"
+                current_ingredient_cost_per_gram = aggregate.cost_per_gram_for(strategy)
+                latest_info = f"{latest_price_entry.source} ({latest_price_entry.purchase_date.strftime('%Y-%m-%d')})"
+                cost_source_info = latest_info if strategy == 'latest' else f"{strategy_label} (最新：{latest_info})"
                 purchase_unit_info = f"{latest_price_entry.unit}"
-            else:
+
+            if current_ingredient_cost_per_gram is None:
+                # 價格的單位無法換算成公克 (例如未設定密度或每件重量)，改用食材本身的預設成本
+                current_ingredient_cost_per_gram = item.ingredient.cost_per_unit / 100.0
+                if strategy == 'latest':
+                    cost_source_info = f"預設成本 ({latest_price_entry.unit} 無法換算成公克)"
+                else:
+                    cost_source_info = f"預設成本 ({strategy_label}沒有可換算成公克的價格)"
+                purchase_unit_info = f"{item.ingredient.unit_name}"
+            elif not latest_price_entry:
                 # 如果沒有任何價格紀錄，則退回使用食材本身的預設成本
                 current_ingredient_cost_per_gram = item.ingredient.cost_per_unit / 100.0
                 cost_source_info = "預設成本"
                 purchase_unit_info = f"{item.ingredient.unit_name}"
 
-            scale = item.quantity_g / 100.0
-            totals['calories_kcal'] += (item.ingredient.calories_kcal or 0) * scale
-            totals['protein_g'] += (item.ingredient.protein_g or 0) * scale
-            totals['fat_g'] += (item.ingredient.fat_g or 0) * scale
-            totals['carbohydrate_g'] += (item.ingredient.carbohydrate_g or 0) * scale
-            totals['saturated_fat_g'] += (item.ingredient.saturated_fat_g or 0) * scale
-            totals['trans_fat_g'] += (item.ingredient.trans_fat_g or 0) * scale
-            totals['sugar_g'] += (item.ingredient.sugar_g or 0) * scale
-            totals['sodium_mg'] += (item.ingredient.sodium_mg or 0) * scale
             totals['total_weight_g'] += item.quantity_g
 
             if (item.ingredient.trans_fat_g or 0) > 0 and \
@@ -168,28 +366,227 @@ class Recipe(db.Model):
         
         return totals
 
+    @staticmethod
+    def _accumulate_sub_recipe(item, sub_recipe, totals):
+        """把用量 item.quantity_g 的子食譜，依其成品重量按比例累加到 totals。"""
+        name, weight, sub_totals = sub_recipe
+        scale = item.quantity_g / weight if weight > 0 else 0.0
+        for field in NUTRIENT_FIELDS:
+            totals[field] += sub_totals[field] * scale
+        totals['total_weight_g'] += item.quantity_g
+        if sub_totals['has_trans_fat_non_art']:
+            totals['has_trans_fat_non_art'] = True
+
+        item_total_cost = sub_totals['total_ingredient_cost'] * scale
+        totals['total_ingredient_cost'] += item_total_cost
+        totals['ingredient_cost_details'].append({
+            'ingredient_id': None,
+            'sub_recipe_id': item.sub_recipe_id,
+            'ingredient_name': f"{name} (子食譜)",
+            'quantity_g': item.quantity_g,
+            'cost_per_gram': sub_totals['total_ingredient_cost'] / weight if weight > 0 else 0.0,
+            'item_total_cost': item_total_cost,
+            'cost_source': '子食譜',
+            'purchase_unit': ''
+        })
+
+
 class RecipeItem(db.Model):
     __tablename__ = 'recipe_items'
+    # 每個項目是一項食材，或是以成品重量計的一個子食譜 (半成品)，兩者擇一
+    __table_args__ = (
+        db.CheckConstraint('(ingredient_id IS NULL) <> (sub_recipe_id IS NULL)', name='ck_recipe_items_component'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quantity_g = db.Column(db.Float, nullable=False)
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
-    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
-    recipe = db.relationship('Recipe', back_populates='ingredients')
+    # ingredient_id 的索引是「食材 → 食譜 → 產品」反向依賴查詢的起點
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=True, index=True)
+    # sub_recipe_id 的索引供「子食譜 → 使用它的食譜」的反向查詢 (app.recipe_graph.ancestor_recipe_ids) 使用
+    sub_recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=True, index=True)
+    recipe = db.relationship('Recipe', back_populates='ingredients', foreign_keys=[recipe_id])
     ingredient = db.relationship('Ingredient')
-    def __repr__(self): return f'<RecipeItem recipe:{self.recipe_id} ingredient:{self.ingredient_id} qty:{self.quantity_g}g>'
+    sub_recipe = db.relationship('Recipe', foreign_keys=[sub_recipe_id])
+
+    @property
+    def component_name(self):
+        return self.sub_recipe.recipe_name if self.sub_recipe_id is not None else self.ingredient.food_name
+
+    def __repr__(self):
+        component = f'sub_recipe:{self.sub_recipe_id}' if self.sub_recipe_id is not None else f'ingredient:{self.ingredient_id}'
+        return f'<RecipeItem recipe:{self.recipe_id} {component} qty:{self.quantity_g}g>'
+
+@timed('calculate_nutrition_bulk')
+def calculate_nutrition_bulk(recipes):
+    """
+    批次計算多個食譜的營養與成本。
+    所有食材項目、食材與最新價格都以固定次數的查詢載入，不會隨食譜數量增加。
+    回傳 {recipe.id: totals}，totals 的格式與 Recipe.calculate_nutrition() 相同。
+    """
+    recipes = list(recipes)
+    return {recipe.id: totals for recipe, totals in zip(recipes, _compute_nutrition(recipes))}
+
+
+def _compute_nutrition(recipes):
+    """
+    依輸入順序回傳每個食譜的計算結果 (支援尚未存入資料庫的臨時食譜)。
+    已存入資料庫的食譜與用到的子食譜會先查營養計算快取 (每個節點各自快取)，只有未命中的才實際計算。
+    """
+    cache = get_nutrition_cache()
+    generation = None
+    memo = {}
+    if cache is not None:
+        # 尚未 flush 的異動先寫出，讓 flush 事件使相關的快取失效
+        if db.session.new or db.session.dirty or db.session.deleted:
+            db.session.flush()
+        memo, generation = cache.get_many({recipe.id for recipe in recipes if recipe.id is not None})
+
+    pending = [recipe for recipe in recipes if recipe.id is None or recipe.id not in memo]
+    computed = _compute_nutrition_uncached(pending, memo, cache, generation) if pending else {}
+    return [computed[recipe] if recipe in computed else memo[recipe.id] for recipe in recipes]
+
+
+def _compute_nutrition_uncached(recipes, memo, cache=None, generation=None):
+    """
+    計算 recipes (以及它們用到、但快取中沒有的子食譜)，回傳 {recipe: totals}。
+    食譜之間依子食譜關係拓撲排序，子食譜先算；每個節點只計算一次，結果存入快取供其他食譜重複使用。
+    食材部分仍以一次矩陣乘法算出所有節點的營養總量。
+    """
+    _preload_recipe_items(recipes)
+
+    # 以遞迴 CTE 載入子食譜結構；由上往下逐層找出快取中沒有的子食譜 (命中快取的子食譜不必再往下展開)
+    nodes = {recipe.id: recipe for recipe in recipes if recipe.id is not None}
+    sub_recipe_ids = {item.sub_recipe_id for recipe in recipes for item in recipe.ingredients
+                      if item.sub_recipe_id is not None}
+    graph = load_recipe_graph(sub_recipe_ids | nodes.keys()) if sub_recipe_ids else {}
+    missing, frontier = set(), sub_recipe_ids - nodes.keys()
+    while frontier:
+        frontier -= memo.keys()
+        if frontier and cache is not None:
+            cached, _ = cache.get_many(frontier)
+            memo.update(cached)
+            frontier -= cached.keys()
+        missing |= frontier
+        frontier = {sub_recipe_id for recipe_id in frontier for _, sub_recipe_id, _ in graph[recipe_id]['items']
+                    if sub_recipe_id is not None} - missing - nodes.keys()
+    if missing:
+        sub_recipes = Recipe.query.filter(Recipe.id.in_(missing)).all()
+        _preload_recipe_items(sub_recipes)
+        nodes.update((recipe.id, recipe) for recipe in sub_recipes)
+
+    to_compute = [*recipes, *(nodes[recipe_id] for recipe_id in missing)]
+    order = topological_order(to_compute, lambda recipe: [
+        nodes[item.sub_recipe_id] for item in recipe.ingredients
+        if item.sub_recipe_id is not None and item.sub_recipe_id in nodes and item.sub_recipe_id not in memo
+    ])
+
+    pairs = set()
+    for recipe in order:
+        if recipe.user_id is None:
+            continue
+        for item in recipe.ingredients:
+            if item.sub_recipe_id is None:
+                pairs.add((recipe.user_id, item.ingredient.id))
+    latest_prices = _load_latest_prices(pairs)
+    strategies = _load_costing_strategies({recipe.user_id for recipe in order if recipe.user_id is not None})
+
+    # 所有食譜共用一個營養素矩陣，一次矩陣乘法算出全部食譜食材部分的營養總量
+    ingredient_items = [[item for item in recipe.ingredients if item.sub_recipe_id is None] for recipe in order]
+    matrix = NutrientMatrix(item.ingredient for items in ingredient_items for item in items)
+    nutrient_totals = matrix.totals([
+        [(item.ingredient.id, item.quantity_g) for item in items] for items in ingredient_items
+    ])
+
+    computed = {}
+    for recipe, row in zip(order, nutrient_totals):
+        sub_recipes = {}
+        for item in recipe.ingredients:
+            if item.sub_recipe_id is None or item.sub_recipe_id in sub_recipes:
+                continue
+            sub_recipe = nodes.get(item.sub_recipe_id)
+            sub_totals = memo[item.sub_recipe_id] if item.sub_recipe_id in memo else computed[sub_recipe]
+            node = graph[item.sub_recipe_id]
+            weight = recipe_weight(node['final_weight_g'], node['items'])
+            sub_recipes[item.sub_recipe_id] = (node['recipe_name'], weight, sub_totals)
+        computed[recipe] = recipe._accumulate_nutrition(
+            latest_prices, strategies.get(recipe.user_id, DEFAULT_COSTING_STRATEGY), totals_as_dict(row), sub_recipes
+        )
+
+    if cache is not None:
+        saved = [recipe for recipe in order if recipe.id is not None]
+        closure = dependency_closure(graph, [recipe.id for recipe in saved if recipe.id in graph])
+        cache.put_many([
+            (recipe.id, recipe.user_id, *closure.get(recipe.id, (
+                {item.ingredient_id for item in recipe.ingredients}, set()
+            )), computed[recipe])
+            for recipe in saved
+        ], generation)
+    return computed
+
+
+def _preload_recipe_items(recipes):
+    """以一次查詢載入尚未載入的 RecipeItem (連同 Ingredient)，並填回各食譜的 relationship。"""
+    unloaded = {recipe.id: recipe for recipe in recipes
+                if recipe.id is not None and 'ingredients' in sa_inspect(recipe).unloaded}
+    if unloaded:
+        items_by_recipe = {recipe_id: [] for recipe_id in unloaded}
+        items = RecipeItem.query.options(joinedload(RecipeItem.ingredient)).filter(
+            RecipeItem.recipe_id.in_(unloaded.keys())
+        ).order_by(RecipeItem.id).all()
+        for item in items:
+            items_by_recipe[item.recipe_id].append(item)
+        for recipe_id, recipe in unloaded.items():
+            set_committed_value(recipe, 'ingredients', items_by_recipe[recipe_id])
+
+    # 已載入的項目若尚未載入食材，一次補齊 (多對一的延遲載入會直接命中 identity map)
+    missing_ids = {item.ingredient_id for recipe in recipes for item in recipe.ingredients
+                   if item.ingredient_id is not None and 'ingredient' in sa_inspect(item).unloaded}
+    if missing_ids:
+        Ingredient.query.filter(Ingredient.id.in_(missing_ids)).all()
+
+
+def _load_latest_prices(pairs):
+    """一次查出多組 (user_id, ingredient_id) 的價格彙總 (連同最新一筆價格紀錄)。"""
+    if not pairs:
+        return {}
+    user_ids = {user_id for user_id, _ in pairs}
+    ingredient_ids = {ingredient_id for _, ingredient_id in pairs}
+
+    entries = IngredientLatestPrice.query.options(joinedload(IngredientLatestPrice.price_entry)).filter(
+        IngredientLatestPrice.user_id.in_(user_ids),
+        IngredientLatestPrice.ingredient_id.in_(ingredient_ids)
+    ).all()
+
+    return {(entry.user_id, entry.ingredient_id): entry for entry in entries
+            if (entry.user_id, entry.ingredient_id) in pairs}
+
+
+def _load_costing_strategies(user_ids):
+    """回傳 {user_id: 成本計算方式}。"""
+    if not user_ids:
+        return {}
+    return dict(db.session.execute(db.select(User.id, User.costing_strategy).where(User.id.in_(user_ids))).all())
+
 
 class Product(db.Model):
     __tablename__ = 'products'
+    # 列表 API 的 keyset 分頁 (依名稱或修改時間排序) 使用
+    __table_args__ = (
+        db.Index('ix_products_user_name', 'user_id', 'product_name', 'id'),
+        db.Index('ix_products_user_updated', 'user_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(128), index=True, nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
-    updated_at = db.Column(db.DateTime(timezone=True), onupdate=func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), default=func.now(), onupdate=func.now())
     calculated_cost = db.Column(db.Float, default=0)
+    # calculated_cost 最後一次計算的時間；為 NULL 表示食材或價格已變動、成本尚待重新計算
+    cost_computed_at = db.Column(db.DateTime(timezone=True), nullable=True)
     selling_price = db.Column(db.Float, default=0)
     stock_quantity = db.Column(db.Integer, default=0)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False, index=True)
     creator = db.relationship('User', back_populates='products')
     recipe = db.relationship('Recipe')
     
@@ -200,39 +597,22 @@ class Product(db.Model):
     
     def __repr__(self): return f'<Product {self.product_name}>'
 
-    def calculate_total_product_cost(self, electricity_cost_per_kwh=3.0, labor_cost_per_hour=200.0):
-        recipe_cost_details = self.recipe.calculate_nutrition()
-        total_ingredient_cost_for_recipe = recipe_cost_details['total_ingredient_cost']
-
-        ingredient_cost_per_serving = total_ingredient_cost_for_recipe / (self.recipe.servings_count or 1)
-
-        electricity_cost_total = 0
-        if self.bake_power_w and self.bake_time_min and self.bake_time_min > 0:
-            total_bake_time_hr = self.bake_time_min / 60.0
-            total_electricity_kwh = (self.bake_power_w * total_bake_time_hr) / 1000.0
-            electricity_cost_total = total_electricity_kwh * electricity_cost_per_kwh
-        
-        labor_cost_total = 0
-        if self.production_time_hr:
-            labor_cost_total = self.production_time_hr * labor_cost_per_hour
-
-        batch_ingredient_cost = (total_ingredient_cost_for_recipe / (self.recipe.servings_count or 1)) * (self.batch_size or 1)
-
-        total_batch_cost = batch_ingredient_cost + electricity_cost_total + labor_cost_total
-
-        average_cost_per_product = 0
-        if self.batch_size and self.batch_size > 0:
-            average_cost_per_product = total_batch_cost / self.batch_size
-        
-        return {
-            'total_ingredient_cost_for_recipe': total_ingredient_cost_for_recipe,
-            'ingredient_cost_details': recipe_cost_details['ingredient_cost_details'],
-            'batch_ingredient_cost': batch_ingredient_cost,
-            'electricity_cost_total': electricity_cost_total,
-            'labor_cost_total': labor_cost_total,
-            'total_batch_cost': total_batch_cost,
-            'average_cost_per_product': average_cost_per_product
-        }
+    @timed('calculate_total_product_cost')
+    def calculate_total_product_cost(self, electricity_cost_per_kwh=3.0, labor_cost_per_hour=200.0, recipe_cost_details=None):
+        # 若呼叫端已批次算好食譜成本 (例如列表頁)，可直接傳入以省去重複計算
+        if recipe_cost_details is None:
+            recipe_cost_details = calculate_nutrition_bulk([self.recipe])[self.recipe.id]
+        breakdown = product_cost_breakdown(
+            recipe_cost_details['total_ingredient_cost'],
+            servings_count=self.recipe.servings_count,
+            batch_size=self.batch_size,
+            bake_power_w=self.bake_power_w,
+            bake_time_min=self.bake_time_min,
+            production_time_hr=self.production_time_hr,
+            electricity_cost_per_kwh=electricity_cost_per_kwh,
+            labor_cost_per_hour=labor_cost_per_hour
+        )
+        return {**breakdown, 'ingredient_cost_details': recipe_cost_details['ingredient_cost_details']}
 
     def calculate_profit_margin(self):
         if self.selling_price and self.selling_price > 0 and self.calculated_cost is not None:
@@ -251,10 +631,16 @@ class Customer(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    # 收銀機重送同一筆訂單時以冪等鍵辨識，同一使用者的冪等鍵不可重複
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_orders_user_idempotency_key'),
+        db.Index('ix_orders_user_date', 'user_id', 'order_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_date = db.Column(db.DateTime(timezone=True), server_default=func.now())
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(32), default='completed')
+    idempotency_key = db.Column(db.String(64), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
     staff = db.relationship('User', back_populates='orders')
@@ -267,7 +653,27 @@ class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, nullable=False)
     price_at_sale = db.Column(db.Float, nullable=False)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    # 售出當時產品的單位成本 (Product.calculated_cost)，之後成本變動不影響已售出的毛利
+    cost_at_sale = db.Column(db.Float, nullable=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     product = db.relationship('Product')
     def __repr__(self): return f'<OrderItem order:{self.order_id} product:{self.product_id} qty:{self.quantity}>'
+
+
+class ProductDailySales(db.Model):
+    """
+    每位使用者每項產品每日的銷售彙總 (銷售報表使用)，在寫入訂單的同一個交易中累加，
+    報表查詢只需讀取日期範圍內的彙總列，不必掃描 order_items。
+    day 為 SALES_TIMEZONE 時區的營業日；可用 `flask orders rebuild-sales-rollups` 由訂單明細重建。
+    """
+    __tablename__ = 'product_daily_sales'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0)
+    product = db.relationship('Product')
+
+    def __repr__(self): return f'<ProductDailySales user:{self.user_id} product:{self.product_id} {self.day}>'
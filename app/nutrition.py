@@ -0,0 +1,76 @@
+# app/nutrition.py
+# --- 以 NumPy 向量化計算營養素的引擎 ---
+# 食材營養以「食材 × 營養素」的稠密矩陣 (每 100 克含量) 表示，
+# 食譜則是各食材用量 (克) 的稀疏向量，總量、密度與每份數值皆由矩陣乘法一次求得。
+import numpy as np
+
+# 營養素欄位順序，矩陣的欄與此順序一一對應
+NUTRIENT_FIELDS = (
+    'calories_kcal', 'protein_g', 'fat_g', 'carbohydrate_g',
+    'saturated_fat_g', 'trans_fat_g', 'sugar_g', 'sodium_mg'
+)
+
+
+class NutrientMatrix:
+    """
+    一組食材的營養素矩陣 (ingredients × nutrients，每 100 克含量)。
+    以食材 id 對應到矩陣的列，供多個食譜共用。
+    """
+
+    def __init__(self, ingredients):
+        self.row_of = {}
+        rows = []
+        for ingredient in ingredients:
+            if ingredient.id in self.row_of:
+                continue
+            self.row_of[ingredient.id] = len(rows)
+            rows.append([getattr(ingredient, field) or 0 for field in NUTRIENT_FIELDS])
+        self.values = np.array(rows, dtype=float).reshape(len(rows), len(NUTRIENT_FIELDS))
+
+    def quantity_matrix(self, recipe_items):
+        """
+        將多個食譜的食材項目轉成用量矩陣 (recipes × ingredients，單位：克)。
+        recipe_items 為每個食譜一個 [(ingredient_id, quantity_g), ...] 清單，
+        同一食材重複出現時用量會累加。
+        """
+        recipe_rows, ingredient_cols, quantities = [], [], []
+        for recipe_row, items in enumerate(recipe_items):
+            for ingredient_id, quantity_g in items:
+                recipe_rows.append(recipe_row)
+                ingredient_cols.append(self.row_of[ingredient_id])
+                quantities.append(quantity_g or 0)
+
+        matrix = np.zeros((len(recipe_items), len(self.row_of)), dtype=float)
+        np.add.at(matrix, (np.array(recipe_rows, dtype=int), np.array(ingredient_cols, dtype=int)), quantities)
+        return matrix
+
+    def totals(self, recipe_items):
+        """回傳每個食譜的營養素總量矩陣 (recipes × nutrients)。"""
+        return self.quantity_matrix(recipe_items) @ self.values / 100.0
+
+
+def totals_as_dict(vector):
+    """將一列營養素向量轉成 {欄位名稱: 數值} 字典。"""
+    return {field: float(value) for field, value in zip(NUTRIENT_FIELDS, vector)}
+
+
+def label_profiles(totals, final_weights, serving_weights):
+    """
+    由營養素總量計算每份與每 100 克的數值，可一次處理多個食譜。
+    totals 為 (recipes × nutrients) 或單一向量；重量為 0 的食譜結果全為 0。
+    回傳 (per_serving, per_100g)，形狀與 totals 相同。
+    """
+    totals = np.asarray(totals, dtype=float)
+    final_weights = np.asarray(final_weights, dtype=float)
+    serving_weights = np.asarray(serving_weights, dtype=float)
+
+    # 營養密度 (每克含量)，總重為 0 時不計算
+    safe_weights = np.where(final_weights > 0, final_weights, 1.0)
+    density = np.where(
+        np.expand_dims(final_weights > 0, -1),
+        totals / np.expand_dims(safe_weights, -1),
+        0.0
+    )
+    per_serving = density * np.expand_dims(serving_weights, -1)
+    per_100g = density * 100.0
+    return per_serving, per_100g
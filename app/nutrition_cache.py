@@ -0,0 +1,315 @@
+# app/nutrition_cache.py
+# --- 食譜營養與成本計算結果的快取 ---
+# 產品列表、產品明細、食譜明細 API 與標示頁都會重複計算同一個食譜，
+# 因此以食譜 id 為鍵快取 Recipe.calculate_nutrition() 的結果，並記錄每個結果依賴的資料：
+#   - 食譜本身與其 RecipeItem            -> ('recipe', recipe_id)
+#   - 用到的食材 (營養素、名稱、預設成本) -> ('ingredient', ingredient_id)
+#   - 該食譜作者對這些食材的最新價格      -> ('price', user_id, ingredient_id)
+# 使用子食譜的食譜記錄的是整個子圖的依賴 (直接或間接用到的食材與子食譜)，
+# 因此子食譜異動時只有使用它的食譜 (下游) 失效，其他食譜與子食譜本身的上游不受影響。
+# ORM 寫入事件只讓依賴於異動資料的食譜失效；TFDA 匯入 (獨立行程) 完成後則整份清空。
+# 快取存在各行程自己的記憶體中：提交異動的行程會更新共用的 NUTRITION_CACHE_STAMP (見 app.cache_stamps)，
+# 其他行程在查詢時發現標記改變就整份清空，因此多個 worker 之間不會讀到舊結果，但失效的範圍較粗。
+import copy
+import os
+import threading
+from collections import OrderedDict, defaultdict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+
+from app.cache_stamps import GenerationStamp
+
+
+class NutritionCache:
+    """
+    以 LRU 淘汰、容量有上限的食譜計算結果快取。
+    除了 recipe_id -> 結果之外，另外維護 ingredient_id -> 食譜與子食譜 id -> 食譜的反向索引，
+    失效時只需找出真正受影響的食譜。
+    stamp_path 為 TFDA 匯入的標記檔，shared_stamp_path 為其他行程提交異動時更新的標記檔，任一個改變時整份清空。
+    """
+
+    def __init__(self, stamp_path=None, max_size=1024, shared_stamp_path=None):
+        self.stamp_path = stamp_path
+        self.shared_stamp = GenerationStamp(shared_stamp_path)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()              # recipe_id -> (user_id, ingredient_ids, sub_recipe_ids, totals)
+        self._recipes_by_ingredient = defaultdict(set)
+        self._recipes_by_sub_recipe = defaultdict(set)
+        self._generation = 0
+        self._stamp = self._read_stamp()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def _read_stamp(self):
+        shared = self.shared_stamp.read()
+        if not self.stamp_path:
+            return None, shared
+        try:
+            return os.path.getmtime(self.stamp_path), shared
+        except OSError:
+            return None, shared
+
+    # --- 讀寫 ---
+
+    def get_many(self, recipe_ids):
+        """
+        回傳 ({recipe_id: totals}, generation)。totals 為複本，呼叫端可自由修改；
+        generation 需在計算完成後傳回 put_many，用來判斷計算期間資料是否已有異動。
+        """
+        stamp = self._read_stamp()
+        found = {}
+        with self._lock:
+            self._sync_stamp_locked(stamp)
+            for recipe_id in recipe_ids:
+                entry = self._entries.get(recipe_id)
+                if entry is None:
+                    continue
+                self._entries.move_to_end(recipe_id)
+                found[recipe_id] = entry[3]
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(set(recipe_ids)) - len(found)
+            generation = self._generation
+        return {recipe_id: copy.deepcopy(totals) for recipe_id, totals in found.items()}, generation
+
+    def generation(self):
+        """
+        目前的資料世代：本行程的失效或其他行程 (標記檔) 的異動都會讓它改變，
+        其他依賴相同資料 (食譜、食材、價格) 的衍生結果可以用它判斷是否需要重新計算。
+        """
+        stamp = self._read_stamp()
+        with self._lock:
+            self._sync_stamp_locked(stamp)
+            return self._generation
+
+    def _sync_stamp_locked(self, stamp):
+        if stamp != self._stamp:
+            self._clear_locked()
+            self._stamp = stamp
+
+    def put_many(self, entries, generation):
+        """
+        存入 [(recipe_id, user_id, ingredient_ids, sub_recipe_ids, totals), ...]，
+        ingredient_ids 與 sub_recipe_ids 為直接或間接用到的食材與子食譜。
+        若計算開始後曾發生失效 (generation 已改變)，結果可能是舊資料，直接捨棄。
+        """
+        entries = [(recipe_id, user_id, frozenset(ingredient_ids), frozenset(sub_recipe_ids), copy.deepcopy(totals))
+                   for recipe_id, user_id, ingredient_ids, sub_recipe_ids, totals in entries]
+        with self._lock:
+            if generation != self._generation:
+                return
+            for recipe_id, user_id, ingredient_ids, sub_recipe_ids, totals in entries:
+                self._discard_locked(recipe_id)
+                self._entries[recipe_id] = (user_id, ingredient_ids, sub_recipe_ids, totals)
+                for ingredient_id in ingredient_ids:
+                    self._recipes_by_ingredient[ingredient_id].add(recipe_id)
+                for sub_recipe_id in sub_recipe_ids:
+                    self._recipes_by_sub_recipe[sub_recipe_id].add(recipe_id)
+            while len(self._entries) > self.max_size:
+                self._discard_locked(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    # --- 失效 ---
+
+    def invalidate(self, keys):
+        """讓依賴於 keys 的食譜失效 (鍵的格式見模組說明)。"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key[0] == 'recipe':
+                    # 食譜本身，以及把它當作子食譜 (直接或間接) 使用的食譜
+                    recipe_ids = [key[1], *self._recipes_by_sub_recipe.get(key[1], ())]
+                elif key[0] == 'ingredient':
+                    recipe_ids = list(self._recipes_by_ingredient.get(key[1], ()))
+                else:
+                    _, user_id, ingredient_id = key
+                    recipe_ids = [recipe_id for recipe_id in self._recipes_by_ingredient.get(ingredient_id, ())
+                                  if self._entries[recipe_id][0] == user_id]
+                for recipe_id in recipe_ids:
+                    if self._discard_locked(recipe_id):
+                        self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def publish(self):
+        """
+        通知其他行程清空快取 (本行程已由 invalidate / clear 處理，commit 後呼叫)。
+        更新標記前若發現其他行程已更新過，先清空自己的內容，避免蓋掉對方的通知。
+        """
+        if not self.shared_stamp.path:
+            return
+        with self._lock:
+            if self._read_stamp() != self._stamp:
+                self._clear_locked()
+            self.shared_stamp.touch()
+            self._stamp = self._read_stamp()
+
+    def _clear_locked(self):
+        self._generation += 1
+        self.stats['invalidations'] += len(self._entries)
+        self._entries.clear()
+        self._recipes_by_ingredient.clear()
+        self._recipes_by_sub_recipe.clear()
+
+    def _discard_locked(self, recipe_id):
+        entry = self._entries.pop(recipe_id, None)
+        if entry is None:
+            return False
+        for index, by_key in ((1, self._recipes_by_ingredient), (2, self._recipes_by_sub_recipe)):
+            for key in entry[index]:
+                recipe_ids = by_key.get(key)
+                if recipe_ids is not None:
+                    recipe_ids.discard(recipe_id)
+                    if not recipe_ids:
+                        del by_key[key]
+        return True
+
+    def snapshot(self):
+        """回傳目前的統計數字 (供監控 API 使用)。"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+            }
+
+    # --- Flask 整合 ---
+
+    def init_app(self, app):
+        app.extensions['nutrition_cache'] = self
+
+
+def get_nutrition_cache():
+    """取得目前應用程式的營養計算快取；不在 app context 中時回傳 None。"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('nutrition_cache')
+
+
+def record_price_changes(session, pairs):
+    """
+    登記 (user_id, ingredient_id) 的最新價格已改變。
+    refresh_latest_prices() 以 Core 語法改寫最新價格表，不會經過 ORM 事件，因此由它主動呼叫。
+    """
+    _invalidate(session, {('price', user_id, ingredient_id) for user_id, ingredient_id in pairs})
+
+
+def pending_dependency_keys(session):
+    """回傳目前交易中已 flush 的異動所對應的依賴鍵 (產品成本的自動重新計算也使用這些鍵)。"""
+    return set(session.info.get('nutrition_cache_keys', ()))
+
+
+# --- ORM 事件 ---
+# flush 後立即失效 (同一交易中之後的讀取不會拿到舊結果)，並記在 session.info 中；
+# commit 或 rollback 時再失效一次，避免其他請求在這段期間以尚未提交的舊資料重新填入快取。
+
+def _invalidate(session, keys):
+    if not keys:
+        return
+    session.info.setdefault('nutrition_cache_keys', set()).update(keys)
+    cache = get_nutrition_cache()
+    if cache is not None:
+        cache.invalidate(keys)
+
+
+def _dependency_keys(obj):
+    from app.models import Ingredient, IngredientLatestPrice, IngredientPrice, Recipe, RecipeItem
+    if isinstance(obj, Recipe):
+        return {('recipe', obj.id)}
+    if isinstance(obj, RecipeItem):
+        # 項目若被移到其他食譜，原本的食譜也要失效
+        history = attributes.get_history(obj, 'recipe_id')
+        return {('recipe', recipe_id) for recipe_id in
+                [obj.recipe_id, *history.deleted] if recipe_id is not None}
+    if isinstance(obj, Ingredient):
+        return {('ingredient', obj.id)}
+    if isinstance(obj, (IngredientPrice, IngredientLatestPrice)):
+        return {('price', obj.user_id, obj.ingredient_id)}
+    return set()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_nutrition_changes(session, flush_context):
+    keys = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        keys |= _dependency_keys(obj)
+    _invalidate(session, keys)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    """Query.delete() / update() 等批次語法不會經過 flush，依 WHERE 條件找出受影響的資料。"""
+    from app.models import Ingredient, IngredientLatestPrice, IngredientPrice, Recipe, RecipeItem
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    key_columns = {
+        Recipe: {'id': 'recipe'},
+        RecipeItem: {'recipe_id': 'recipe', 'ingredient_id': 'ingredient', 'sub_recipe_id': 'recipe'},
+        Ingredient: {'id': 'ingredient'},
+        IngredientPrice: {'ingredient_id': 'ingredient'},
+        IngredientLatestPrice: {'ingredient_id': 'ingredient'},
+    }.get(mapper.class_)
+    if key_columns is None:
+        return
+
+    keys = _equality_keys(orm_execute_state.statement.whereclause, key_columns)
+    if keys:
+        _invalidate(orm_execute_state.session, keys)
+    else:
+        # 無法判斷影響範圍時整份清空
+        orm_execute_state.session.info['nutrition_cache_clear'] = True
+        cache = get_nutrition_cache()
+        if cache is not None:
+            cache.clear()
+
+
+def _equality_keys(whereclause, key_columns):
+    """從以 AND 串接的「欄位 = 值」條件中取出失效鍵；條件較複雜時回傳空集合。"""
+    if whereclause is None:
+        return set()
+    if isinstance(whereclause, BooleanClauseList) and whereclause.operator is operators.and_:
+        terms = whereclause.clauses
+    else:
+        terms = [whereclause]
+    keys = set()
+    for term in terms:
+        if (isinstance(term, BinaryExpression) and term.operator is operators.eq
+                and getattr(term.left, 'key', None) in key_columns
+                and isinstance(term.right, BindParameter)):
+            keys.add((key_columns[term.left.key], term.right.effective_value))
+    return keys
+
+
+@event.listens_for(Session, 'after_commit')
+def _commit_nutrition_changes(session):
+    _apply_nutrition_changes(session, publish=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _rollback_nutrition_changes(session):
+    _apply_nutrition_changes(session, publish=False)
+
+
+def _apply_nutrition_changes(session, publish):
+    keys = session.info.pop('nutrition_cache_keys', None)
+    clear = session.info.pop('nutrition_cache_clear', False)
+    cache = get_nutrition_cache()
+    if cache is None or not (clear or keys):
+        return
+    if clear:
+        cache.clear()
+    else:
+        cache.invalidate(keys)
+    if publish:
+        # 已提交的異動也要讓其他行程的快取失效
+        cache.publish()
@@ -0,0 +1,6 @@
+# app/orders/__init__.py
+from flask import Blueprint
+
+bp = Blueprint('orders', __name__)
+
+from . import routes, commands
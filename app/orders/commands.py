@@ -0,0 +1,15 @@
+# app/orders/commands.py
+# 訂單相關的命令列指令 (flask orders ...)
+import click
+from app import db
+from app.orders import bp
+from app.orders.rollups import rebuild_daily_sales
+
+
+@bp.cli.command('rebuild-sales-rollups')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='只重建指定使用者的彙總 (可重複指定)。')
+def rebuild_sales_rollups(user_ids):
+    """由訂單明細重新計算每日銷售彙總 (product_daily_sales)。"""
+    count = rebuild_daily_sales(set(user_ids) or None)
+    db.session.commit()
+    click.echo(f'已重建 {count} 筆每日銷售彙總。')
@@ -0,0 +1,284 @@
+# app/orders/ingest.py
+# --- 銷售訂單批次寫入 ---
+# 尖峰時段多台收銀機會持續送出訂單 (離線補傳時一次可達數千筆)，因此流程與價格批次匯入相同，以「批次」為單位：
+#   1. 逐筆驗證訂單內容，錯誤的訂單記錄在結果中，不影響同一次請求的其他訂單
+#   2. 訂單用到的產品與顧客各以一次 IN 查詢載入
+#   3. 每批訂單以一個 INSERT ... ON CONFLICT DO NOTHING RETURNING 寫入：冪等鍵 (idempotency key) 已存在的訂單
+#      不會寫入也不會回傳，因此重送同一批訂單、或兩台收銀機同時重送，都不會重複建立訂單或重複扣庫存
+#   4. 訂單明細以 executemany 寫入，庫存以單一 UPDATE ... CASE 扣除，每日銷售彙總以 UPSERT 累加，
+#      全部與訂單在同一個交易中，每批各自 commit
+# 銷售已在收銀機完成，因此庫存不足時仍照常寫入 (庫存可能成為負數，代表需要補登生產數量)。
+from datetime import datetime, timezone
+
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.costing import recompute_stale_products
+from app.models import Customer, Order, OrderItem, Product
+from app.orders.rollups import add_daily_sales
+
+# 冪等鍵與每筆訂單明細數的上限
+MAX_IDEMPOTENCY_KEY_LENGTH = 64
+MAX_ITEMS_PER_ORDER = 200
+
+
+class OrderIngestError(Exception):
+    """整個請求無法處理時 (格式錯誤、訂單數超過上限等) 引發。"""
+
+
+class OrderIngestResult:
+    """批次寫入的結果：新建立的訂單、重送 (冪等鍵已存在) 的訂單與逐筆錯誤。"""
+
+    def __init__(self):
+        self.created = []
+        self.duplicates = []
+        self.errors = []
+
+    def add_error(self, index, idempotency_key, message):
+        self.errors.append({'index': index, 'idempotency_key': idempotency_key, 'message': message})
+
+    def to_dict(self):
+        return {
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+        }
+
+
+def ingest_orders(orders, user_id, batch_size=500, max_orders=5000):
+    """
+    寫入一次請求中的多筆訂單，回傳 OrderIngestResult。
+    created 與 duplicates 的每一項為 {'index', 'idempotency_key', 'id'}，index 為訂單在請求中的位置；
+    重送的訂單回傳第一次建立時的訂單 id，收銀機可據此確認訂單已入帳。
+    每批訂單各自 commit；若中途發生資料庫錯誤，先前已完成的批次會保留 (重送整個請求即可補上其餘訂單)，
+    錯誤則由呼叫端處理。
+    """
+    if not isinstance(orders, list):
+        raise OrderIngestError('orders 必須是訂單陣列')
+    if len(orders) > max_orders:
+        raise OrderIngestError(f'每次最多只能送出 {max_orders} 筆訂單，請分批送出')
+
+    result = OrderIngestResult()
+    parsed = []
+    first_index = {}  # 冪等鍵 -> 在請求中第一次出現的位置，同一請求內重複的訂單只寫入一次
+    repeated = []
+    for index, raw in enumerate(orders):
+        key = raw.get('idempotency_key') if isinstance(raw, dict) else None
+        try:
+            order = _parse_order(raw)
+        except ValueError as e:
+            result.add_error(index, key, str(e))
+            continue
+        if order['idempotency_key'] in first_index:
+            repeated.append((index, order['idempotency_key']))
+            continue
+        first_index[order['idempotency_key']] = index
+        parsed.append((index, order))
+
+    parsed = _check_references(parsed, user_id, result)
+    for start in range(0, len(parsed), batch_size):
+        _write_batch(parsed[start:start + batch_size], user_id, result)
+
+    # 同一請求內重複的訂單，回報第一次出現時寫入 (或先前已存在) 的訂單 id
+    order_ids = {entry['idempotency_key']: entry['id'] for entry in result.created + result.duplicates}
+    for index, key in repeated:
+        if key in order_ids:
+            result.duplicates.append({'index': index, 'idempotency_key': key, 'id': order_ids[key]})
+        else:
+            result.add_error(index, key, f'與第 {first_index[key] + 1} 筆訂單的冪等鍵相同，且該筆訂單未寫入')
+    return result
+
+
+def _parse_order(raw):
+    """驗證並轉換一筆訂單，有錯誤時引發 ValueError。售價未填寫的明細稍後以產品售價補上。"""
+    if not isinstance(raw, dict):
+        raise ValueError('訂單必須是物件')
+
+    key = raw.get('idempotency_key')
+    if not isinstance(key, str) or not key.strip():
+        raise ValueError('請提供 idempotency_key (每筆訂單唯一的字串，重送時沿用)')
+    key = key.strip()
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f'idempotency_key 不可超過 {MAX_IDEMPOTENCY_KEY_LENGTH} 個字')
+
+    order_date = raw.get('order_date')
+    if order_date is None:
+        order_date = datetime.now(timezone.utc)
+    else:
+        try:
+            order_date = datetime.fromisoformat(str(order_date))
+        except ValueError:
+            raise ValueError('order_date 必須是 ISO 8601 格式的日期時間')
+        if order_date.tzinfo is None:
+            order_date = order_date.replace(tzinfo=timezone.utc)
+        # 統一以 UTC 儲存 (SQLite 不保存時區)，營業日換算時再轉為 SALES_TIMEZONE
+        order_date = order_date.astimezone(timezone.utc)
+
+    customer_id = raw.get('customer_id')
+    if customer_id is not None and (not isinstance(customer_id, int) or isinstance(customer_id, bool)):
+        raise ValueError('customer_id 必須是整數')
+
+    items = raw.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('訂單至少需要一項商品')
+    if len(items) > MAX_ITEMS_PER_ORDER:
+        raise ValueError(f'每筆訂單最多 {MAX_ITEMS_PER_ORDER} 項商品')
+    parsed_items = [_parse_item(item, position) for position, item in enumerate(items, start=1)]
+
+    total_amount = raw.get('total_amount')
+    if total_amount is not None:
+        total_amount = _number(total_amount, 'total_amount')
+
+    return {
+        'idempotency_key': key,
+        'order_date': order_date,
+        'customer_id': customer_id,
+        'items': parsed_items,
+        'total_amount': total_amount,
+    }
+
+
+def _parse_item(item, position):
+    if not isinstance(item, dict):
+        raise ValueError(f'第 {position} 項商品格式錯誤')
+    product_id, quantity = item.get('product_id'), item.get('quantity')
+    if not isinstance(product_id, int) or isinstance(product_id, bool):
+        raise ValueError(f'第 {position} 項商品的 product_id 必須是整數')
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+        raise ValueError(f'第 {position} 項商品的 quantity 必須是正整數')
+    price = item.get('price')
+    if price is not None:
+        price = _number(price, f'第 {position} 項商品的 price')
+    return {'product_id': product_id, 'quantity': quantity, 'price': price}
+
+
+def _number(value, label):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value >= 0:
+        raise ValueError(f'{label}必須是不小於 0 的數字')
+    return float(value)
+
+
+def _check_references(parsed, user_id, result):
+    """
+    以一次 IN 查詢載入訂單用到的產品與顧客，排除引用了不存在 (或不屬於此使用者) 產品與顧客的訂單，
+    並補上售價與售出當時的產品成本。
+    成本待重新計算 (食材或價格已變動) 的產品先重新計算並 commit，訂單記錄的成本才不會是變動前的舊值。
+    """
+    product_ids = {item['product_id'] for _, order in parsed for item in order['items']}
+    customer_ids = {order['customer_id'] for _, order in parsed if order['customer_id'] is not None}
+    products = _load_products(product_ids, user_id)
+    stale = [product_id for product_id, row in products.items() if row.cost_computed_at is None]
+    if stale:
+        recompute_stale_products(stale)
+        products.update(_load_products(stale, user_id))
+    customers = set(db.session.scalars(
+        select(Customer.id).where(Customer.id.in_(customer_ids))
+    )) if customer_ids else set()
+
+    valid = []
+    for index, order in parsed:
+        missing = sorted({item['product_id'] for item in order['items']} - products.keys())
+        if missing:
+            result.add_error(index, order['idempotency_key'], f"找不到產品：{', '.join(map(str, missing))}")
+            continue
+        if order['customer_id'] is not None and order['customer_id'] not in customers:
+            result.add_error(index, order['idempotency_key'], f"找不到顧客：{order['customer_id']}")
+            continue
+        for item in order['items']:
+            product = products[item['product_id']]
+            if item['price'] is None:
+                item['price'] = product.selling_price or 0.0
+            item['cost'] = product.calculated_cost
+        if order['total_amount'] is None:
+            order['total_amount'] = sum(item['price'] * item['quantity'] for item in order['items'])
+        valid.append((index, order))
+    return valid
+
+
+def _load_products(product_ids, user_id):
+    return {row.id: row for row in db.session.execute(
+        select(Product.id, Product.selling_price, Product.calculated_cost, Product.cost_computed_at)
+        .where(Product.id.in_(product_ids), Product.user_id == user_id)
+    )} if product_ids else {}
+
+
+def _insert_orders_ignoring_duplicates():
+    """冪等鍵已存在時略過該筆訂單的 INSERT；不支援 ON CONFLICT 的資料庫回傳 None。"""
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(db.session.get_bind().dialect.name)
+    if dialect is None:
+        return None
+    return dialect.insert(Order).on_conflict_do_nothing(index_elements=['user_id', 'idempotency_key'])
+
+
+def _write_batch(batch, user_id, result):
+    by_key = {order['idempotency_key']: (index, order) for index, order in batch}
+    existing = {}
+    statement = _insert_orders_ignoring_duplicates()
+    if statement is None:
+        # 其他資料庫：先排除已存在的冪等鍵 (同時重送時仍由唯一約束擋下，整批回滾)
+        existing = _existing_order_ids(user_id, by_key)
+        statement = insert(Order)
+    pending = [order for key, (_, order) in by_key.items() if key not in existing]
+
+    created = {}
+    if pending:
+        created = dict(db.session.execute(
+            statement.returning(Order.idempotency_key, Order.id),
+            [{
+                'user_id': user_id,
+                'idempotency_key': order['idempotency_key'],
+                'order_date': order['order_date'],
+                'customer_id': order['customer_id'],
+                'total_amount': order['total_amount'],
+                'status': 'completed',
+            } for order in pending]
+        ).all())
+    # 沒有回傳 id 的訂單先前已經寫入過 (重送)
+    skipped = by_key.keys() - created.keys() - existing.keys()
+    if skipped:
+        existing.update(_existing_order_ids(user_id, skipped))
+
+    item_rows = []
+    sales = []
+    sold = {}
+    for key, order_id in created.items():
+        order = by_key[key][1]
+        for item in order['items']:
+            item_rows.append({
+                'order_id': order_id,
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'price_at_sale': item['price'],
+                'cost_at_sale': item['cost'],
+            })
+            sales.append((order['order_date'], item['product_id'], item['quantity'], item['price'], item['cost']))
+            sold[item['product_id']] = sold.get(item['product_id'], 0) + item['quantity']
+    if item_rows:
+        db.session.execute(insert(OrderItem), item_rows)
+        add_daily_sales(user_id, sales)
+    if sold:
+        # 所有售出產品的庫存以一個 UPDATE 扣除；庫存異動不算修改產品，保留 updated_at
+        db.session.execute(
+            update(Product)
+            .where(Product.id.in_(sold))
+            .values(
+                stock_quantity=func.coalesce(Product.stock_quantity, 0) - case(sold, value=Product.id),
+                updated_at=Product.updated_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+    for key, order_id in created.items():
+        result.created.append({'index': by_key[key][0], 'idempotency_key': key, 'id': order_id})
+    for key, order_id in existing.items():
+        result.duplicates.append({'index': by_key[key][0], 'idempotency_key': key, 'id': order_id})
+    for key in skipped - existing.keys():
+        result.add_error(by_key[key][0], key, '冪等鍵與其他訂單衝突，請稍後重送')
+
+
+def _existing_order_ids(user_id, keys):
+    return dict(db.session.execute(
+        select(Order.idempotency_key, Order.id).where(Order.user_id == user_id, Order.idempotency_key.in_(keys))
+    ).all())
@@ -0,0 +1,169 @@
+# app/orders/rollups.py
+# --- 每日銷售彙總 (product_daily_sales) ---
+# 銷售報表 (營收、銷量、銷貨成本、毛利) 不直接掃描 order_items，而是讀取以 (使用者, 營業日, 產品) 為鍵的彙總表：
+#   - 寫入訂單時，同一個交易中以 UPSERT 把該批明細累加到彙總列 (多台收銀機同時寫入也不會遺失累加)
+#   - 報表依日期範圍讀取彙總列，資料量只與天數 × 產品數有關，與訂單歷史的長短無關
+#   - 彙總與明細不一致時 (例如直接修改資料庫)，以 rebuild_daily_sales 由訂單明細重新計算
+# 成本使用 order_items.cost_at_sale (售出當時的產品成本)，之後食材價格變動不會改寫過去的毛利。
+from collections import defaultdict
+from datetime import timezone
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import Order, OrderItem, Product, ProductDailySales
+
+# 重建彙總時每次讀取與寫入的列數
+REBUILD_CHUNK_SIZE = 10000
+
+
+def sales_day(order_date):
+    """訂單時間所屬的營業日 (SALES_TIMEZONE 時區的日期)；沒有時區的時間視為 UTC。"""
+    if order_date.tzinfo is None:
+        order_date = order_date.replace(tzinfo=timezone.utc)
+    return order_date.astimezone(ZoneInfo(current_app.config['SALES_TIMEZONE'])).date()
+
+
+def add_daily_sales(user_id, sales):
+    """
+    把訂單明細累加到每日銷售彙總，sales 為 [(order_date, product_id, quantity, price_at_sale, cost_at_sale), ...]。
+    不會 commit，應與訂單寫入在同一個交易中呼叫。
+    """
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for order_date, product_id, quantity, price, cost in sales:
+        entry = totals[sales_day(order_date), product_id]
+        entry[0] += quantity
+        entry[1] += price * quantity
+        entry[2] += (cost or 0.0) * quantity
+    if not totals:
+        return
+
+    rows = [{
+        'user_id': user_id, 'day': day, 'product_id': product_id,
+        'units': units, 'revenue': revenue, 'cost': cost,
+    } for (day, product_id), (units, revenue, cost) in totals.items()]
+
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(db.session.get_bind().dialect.name)
+    if dialect is not None:
+        statement = dialect.insert(ProductDailySales)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'day', 'product_id'],
+            set_={
+                'units': ProductDailySales.units + statement.excluded.units,
+                'revenue': ProductDailySales.revenue + statement.excluded.revenue,
+                'cost': ProductDailySales.cost + statement.excluded.cost,
+            }
+        ), rows)
+        return
+
+    # 不支援 ON CONFLICT 的資料庫：逐列先累加，沒有既有彙總列時才新增
+    for row in rows:
+        updated = db.session.execute(
+            update(ProductDailySales)
+            .where(
+                ProductDailySales.user_id == row['user_id'],
+                ProductDailySales.day == row['day'],
+                ProductDailySales.product_id == row['product_id']
+            )
+            .values(
+                units=ProductDailySales.units + row['units'],
+                revenue=ProductDailySales.revenue + row['revenue'],
+                cost=ProductDailySales.cost + row['cost']
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if not updated.rowcount:
+            db.session.execute(insert(ProductDailySales), row)
+
+
+def rebuild_daily_sales(user_ids=None):
+    """
+    由訂單明細重新計算每日銷售彙總 (user_ids 為 None 時重建所有使用者)，回傳寫入的彙總列數。
+    營業日的時區換算在 Python 中進行，因此明細以串流方式分批讀取，不會一次載入記憶體。不會 commit。
+    """
+    statement = delete(ProductDailySales)
+    if user_ids is not None:
+        statement = statement.where(ProductDailySales.user_id.in_(user_ids))
+    db.session.execute(statement)
+
+    query = (
+        select(Order.user_id, Order.order_date, OrderItem.product_id, OrderItem.quantity,
+               OrderItem.price_at_sale, OrderItem.cost_at_sale)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.user_id.is_not(None))
+    )
+    if user_ids is not None:
+        query = query.where(Order.user_id.in_(user_ids))
+
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in db.session.execute(query.execution_options(yield_per=REBUILD_CHUNK_SIZE)):
+        entry = totals[row.user_id, sales_day(row.order_date), row.product_id]
+        entry[0] += row.quantity
+        entry[1] += row.price_at_sale * row.quantity
+        entry[2] += (row.cost_at_sale or 0.0) * row.quantity
+
+    rows = [{
+        'user_id': user_id, 'day': day, 'product_id': product_id,
+        'units': units, 'revenue': revenue, 'cost': cost,
+    } for (user_id, day, product_id), (units, revenue, cost) in totals.items()]
+    for start in range(0, len(rows), REBUILD_CHUNK_SIZE):
+        db.session.execute(insert(ProductDailySales), rows[start:start + REBUILD_CHUNK_SIZE])
+    return len(rows)
+
+
+def sales_summary(user_id, start, end):
+    """
+    回傳 [start, end] 營業日範圍內的銷售報表：整體合計、每日合計與各產品合計 (依營收排序)。
+    只讀取彙總表，以 (user_id, day) 主鍵前綴做範圍查詢。
+    """
+    measures = (
+        func.sum(ProductDailySales.units).label('units'),
+        func.sum(ProductDailySales.revenue).label('revenue'),
+        func.sum(ProductDailySales.cost).label('cost'),
+    )
+    in_range = (
+        ProductDailySales.user_id == user_id,
+        ProductDailySales.day >= start,
+        ProductDailySales.day <= end,
+    )
+    daily = db.session.execute(
+        select(ProductDailySales.day, *measures)
+        .where(*in_range)
+        .group_by(ProductDailySales.day)
+        .order_by(ProductDailySales.day)
+    ).all()
+    by_product = db.session.execute(
+        select(ProductDailySales.product_id, Product.product_name, *measures)
+        .join(Product, Product.id == ProductDailySales.product_id)
+        .where(*in_range)
+        .group_by(ProductDailySales.product_id, Product.product_name)
+        .order_by(func.sum(ProductDailySales.revenue).desc())
+    ).all()
+
+    def figures(units, revenue, cost):
+        margin = revenue - cost
+        return {
+            'units': units,
+            'revenue': revenue,
+            'cost': cost,
+            'margin': margin,
+            'margin_rate': margin / revenue if revenue else None,
+        }
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': figures(
+            sum(row.units for row in daily),
+            sum(row.revenue for row in daily),
+            sum(row.cost for row in daily)
+        ),
+        'daily': [{'day': row.day.isoformat(), **figures(row.units, row.revenue, row.cost)} for row in daily],
+        'products': [
+            {'product_id': row.product_id, 'product_name': row.product_name, **figures(row.units, row.revenue, row.cost)}
+            for row in by_product
+        ],
+    }
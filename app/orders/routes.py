@@ -0,0 +1,82 @@
+# app/orders/routes.py
+from datetime import date, datetime, timedelta, timezone
+
+from flask import current_app, flash, jsonify, render_template, request
+from flask_login import current_user, login_required
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.orders import bp
+from app.orders.ingest import OrderIngestError, ingest_orders
+from app.orders.rollups import sales_day, sales_summary
+from app.sql_instrumentation import query_budget
+
+
+def _default_range():
+    """最近 SALES_REPORT_DAYS 個營業日 (含今天)。"""
+    end = sales_day(datetime.now(timezone.utc))
+    return end - timedelta(days=current_app.config['SALES_REPORT_DAYS'] - 1), end
+
+
+def _report_range():
+    """讀取報表的 start / end 查詢參數 (YYYY-MM-DD)，未指定的一端使用預設範圍；格式錯誤時引發 ValueError。"""
+    default_start, default_end = _default_range()
+    start, end = request.args.get('start'), request.args.get('end')
+    end = date.fromisoformat(end) if end else default_end
+    start = date.fromisoformat(start) if start else min(default_start, end)
+    if start > end:
+        raise ValueError('開始日期不可晚於結束日期')
+    return start, end
+
+
+@bp.route('/')
+@login_required
+def sales_report():
+    """銷售報表：日期範圍內的營收、銷量、銷貨成本與毛利 (讀取每日銷售彙總)。"""
+    try:
+        start, end = _report_range()
+    except ValueError as e:
+        flash(f'日期範圍錯誤：{e}')
+        start, end = _default_range()
+    return render_template('orders/sales_report.html', title='銷售報表', report=sales_summary(current_user.id, start, end))
+
+
+@bp.route('/api/sales', methods=['GET'])
+@login_required
+@query_budget(5)
+def sales_report_api():
+    """銷售報表 API。查詢參數：start、end (YYYY-MM-DD，營業日，含兩端)。"""
+    try:
+        start, end = _report_range()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'日期範圍錯誤：{e}'}), 400
+    return jsonify({'status': 'success', **sales_summary(current_user.id, start, end)})
+
+
+@bp.route('/api/orders/batch', methods=['POST'])
+@login_required
+def ingest_order_batch():
+    """
+    收銀機批次送出訂單。請求內容：
+        {"orders": [{"idempotency_key": "...", "order_date": "ISO 8601 (選填)", "customer_id": 選填,
+                     "total_amount": 選填 (預設為明細加總),
+                     "items": [{"product_id": 1, "quantity": 2, "price": 選填 (預設為產品售價)}]}]}
+    冪等鍵已存在的訂單視為重送，不會重複建立；回應中的 created / duplicates / errors 以 index 對應請求中的訂單。
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': '請求資料不完整'}), 400
+    try:
+        result = ingest_orders(
+            data.get('orders'), current_user.id,
+            batch_size=current_app.config['ORDER_INGEST_BATCH_SIZE'],
+            max_orders=current_app.config['ORDER_INGEST_MAX_ORDERS']
+        )
+    except OrderIngestError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except SQLAlchemyError:
+        # 每批各自 commit，發生錯誤前已完成的批次會保留；以相同的冪等鍵重送整個請求即可
+        db.session.rollback()
+        current_app.logger.exception('批次寫入訂單時發生資料庫錯誤')
+        return jsonify({'status': 'error', 'message': '寫入訂單時發生資料庫錯誤，請以相同的冪等鍵重新送出。'}), 500
+    return jsonify({'status': 'success', **result.to_dict()})
@@ -0,0 +1,119 @@
+# app/pagination.py
+# --- 列表 API 的 keyset (游標) 分頁 ---
+# OFFSET 分頁需要先掃過前面所有的資料列，頁數越後面越慢；keyset 分頁改以「上一頁最後一筆的排序鍵」為起點：
+#     WHERE (sort_key, id) > (:last_sort_key, :last_id) ORDER BY sort_key, id LIMIT :n
+# 搭配 (user_id, sort_key, id) 的複合索引，每一頁都只需讀取 n 筆，與使用者的資料總量無關。
+# 游標是排序鍵值經 JSON + base64 編碼的字串，對前端而言是不透明的。
+# SQLite 以字串儲存日期時間，而且 server_default (CURRENT_TIMESTAMP) 與 SQLAlchemy 寫入的格式不同 (後者含微秒)，
+# 因此在 SQLite 上游標保存資料庫中的原始字串，比較時也以字串繫結，避免格式差異造成重複或遺漏的資料列。
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import DateTime, String, bindparam, cast, tuple_
+
+
+class PaginationError(ValueError):
+    """分頁參數錯誤 (游標格式錯誤、與排序方式不符或不支援的排序方式) 時引發。"""
+
+
+class KeysetSort:
+    """
+    一種排序方式：columns 為排序欄位 (最後一欄必須是唯一鍵，通常是 id)，所有欄位使用相同的方向，
+    這樣才能以單一的列值比較 (row value comparison) 表示「在游標之後」，並完整利用複合索引。
+    """
+
+    def __init__(self, name, columns, descending=False):
+        self.name = name
+        self.columns = list(columns)
+        self.descending = descending
+
+    def order_by(self):
+        return [column.desc() if self.descending else column.asc() for column in self.columns]
+
+    def after(self, values, raw_datetimes=False):
+        bound = [
+            bindparam(None, value, type_=String) if raw_datetimes and _is_datetime(column) else bindparam(None, value)
+            for column, value in zip(self.columns, values)
+        ]
+        keys, values = tuple_(*self.columns), tuple_(*bound)
+        return keys < values if self.descending else keys > values
+
+
+def _is_datetime(column):
+    return isinstance(column.type, DateTime)
+
+
+def keyset_paginate(statement, sort, cursor=None, limit=50):
+    """
+    對 select 敘述套用 keyset 分頁，回傳 (rows, next_cursor)；沒有下一頁時 next_cursor 為 None。
+    排序欄位會以額外的欄位附加在結果中，rows 為 Row 物件 (ORM 實體請以類別名稱或 row[0] 取得)。
+    """
+    from app import db
+
+    raw_datetimes = db.session.get_bind().dialect.name == 'sqlite'
+    statement = statement.add_columns(*(
+        (cast(column, String) if raw_datetimes and _is_datetime(column) else column).label(f'_keyset_{index}')
+        for index, column in enumerate(sort.columns)
+    ))
+    if cursor:
+        statement = statement.where(sort.after(decode_cursor(cursor, sort, raw_datetimes), raw_datetimes))
+    # 多取一筆用來判斷是否還有下一頁
+    rows = db.session.execute(statement.order_by(*sort.order_by()).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(sort, [last[f'_keyset_{index}'] for index in range(len(sort.columns))])
+    return rows, next_cursor
+
+
+def encode_cursor(sort, values):
+    payload = {'s': sort.name, 'v': [value.isoformat() if isinstance(value, datetime) else value for value in values]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort, raw_datetimes=False):
+    """將游標還原為排序欄位的值；日期時間欄位 (SQLite 以外) 會轉回 datetime，以便與資料庫中的值比較。"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        values = payload['v']
+        if payload['s'] != sort.name or len(values) != len(sort.columns):
+            raise PaginationError('游標與目前的排序方式不符')
+        if not all(_value_matches(column, value) for column, value in zip(sort.columns, values)):
+            raise PaginationError('無效的分頁游標')
+        return [
+            datetime.fromisoformat(value) if value is not None and not raw_datetimes and _is_datetime(column) else value
+            for column, value in zip(sort.columns, values)
+        ]
+    except PaginationError:
+        raise
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise PaginationError('無效的分頁游標')
+
+
+def _value_matches(column, value):
+    """游標中的值是否符合欄位型別 (日期時間為 ISO 字串)；竄改的游標不應在執行查詢時才出錯。"""
+    if value is None:
+        return True
+    if _is_datetime(column):
+        return isinstance(value, str)
+    expected = column.type.python_type
+    if expected is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return type(value) is expected
+
+
+def page_args(sorts, default_sort):
+    """
+    讀取列表 API 共用的查詢參數，回傳 (sort, cursor, limit, q)：
+    sort 為排序方式名稱、cursor 為上一頁回傳的 next_cursor、limit 為每頁筆數 (上限 LIST_PAGE_SIZE_MAX)、q 為名稱篩選字串。
+    """
+    sort = sorts.get(request.args.get('sort', default_sort))
+    if sort is None:
+        raise PaginationError(f"不支援的排序方式，可用：{'、'.join(sorts)}")
+    limit = request.args.get('limit', current_app.config['LIST_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['LIST_PAGE_SIZE_MAX']))
+    return sort, request.args.get('cursor') or None, limit, request.args.get('q', '', type=str).strip()
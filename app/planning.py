@@ -0,0 +1,171 @@
+# app/planning.py
+# --- 生產計畫的用料展開 (bill of materials) ---
+# 產品以「批」生產：一批 batch_size 件，用掉食譜 batch_size / servings_count 份的食材，並消耗一次烘烤電費與人力。
+# 因此一份生產計畫 (每項產品要做幾件) 可以寫成矩陣運算：
+#     batches = ceil(planned / batch_size)                 (products)
+#     grams   = batches @ G                                (ingredients)，G 為「產品 × 食材」每批用量 (克)
+#     cost    = (G @ unit_cost) * batches + batches * (電費 + 人力)
+# 用量矩陣與 what_if 相同由 app.costing.load_cost_jobs() 的資料建立，整份計畫只需固定次數的查詢與一次矩陣乘法。
+# 採購清單再依各食材最近一次購買的單位與包裝數量，換算成「要買幾包」。
+import math
+
+import numpy as np
+
+from app.costing import product_cost_breakdown
+from app.units import grams_per_unit
+
+# 單次計畫最多可包含的產品數
+MAX_PLAN_PRODUCTS = 1000
+
+
+class ProductionPlanner:
+    """一批產品的用料展開模型 (每批用量矩陣 + 食材單價 + 每批固定成本)。"""
+
+    def __init__(self, products, jobs, ingredients):
+        """
+        products 為 [(product_id, product_name), ...]，jobs 為 load_cost_jobs() 對同一批產品載入的計算資料，
+        ingredients 為 {ingredient_id: (食材名稱, 密度, 每件重量, 最近購買單位或 None, 最近購買數量或 None)}。
+        """
+        jobs_by_product = {job['product_id']: job for job in jobs}
+        products = [product for product in products if product[0] in jobs_by_product]
+
+        self.product_ids = [product[0] for product in products]
+        self.product_names = [product[1] for product in products]
+        self.row_of = {product_id: row for row, product_id in enumerate(self.product_ids)}
+
+        self.ingredient_ids = []
+        column_of = {}
+        for job in jobs:
+            for ingredient_id, _, _, _ in job['items']:
+                if ingredient_id not in column_of:
+                    column_of[ingredient_id] = len(self.ingredient_ids)
+                    self.ingredient_ids.append(ingredient_id)
+
+        self.grams_per_batch = np.zeros((len(products), len(column_of)), dtype=float)
+        self.batch_sizes = np.ones(len(products), dtype=float)
+        self.electricity_per_batch = np.zeros(len(products), dtype=float)
+        self.labor_per_batch = np.zeros(len(products), dtype=float)
+        self.unit_costs = np.zeros(len(column_of), dtype=float)
+        self.priced = np.zeros(len(column_of), dtype=bool)
+
+        for row, product_id in enumerate(self.product_ids):
+            job = jobs_by_product[product_id]
+            parameters = job['parameters']
+            batch_size = parameters['batch_size'] if parameters['batch_size'] and parameters['batch_size'] > 0 else 1
+            # 每批的電費與人力沿用 product_cost_breakdown 的算法
+            breakdown = product_cost_breakdown(0.0, **parameters)
+            self.batch_sizes[row] = batch_size
+            self.electricity_per_batch[row] = breakdown['electricity_cost_total']
+            self.labor_per_batch[row] = breakdown['labor_cost_total']
+            servings = parameters['servings_count'] or 1
+            for ingredient_id, quantity_g, unit_cost, default_cost_per_unit in job['items']:
+                column = column_of[ingredient_id]
+                self.grams_per_batch[row, column] += (quantity_g or 0) / servings * batch_size
+                # 沒有可用價格的食材使用預設成本，算法與 compute_product_costs() 相同
+                self.unit_costs[column] = unit_cost if unit_cost is not None else default_cost_per_unit / 100.0
+                self.priced[column] = unit_cost is not None
+
+        # 採購換算：每個購買單位與每包 (最近一次購買的數量) 各相當於多少克；無法換算時為 NaN
+        self.ingredient_names = []
+        self.purchase_units = []
+        self.grams_per_purchase_unit = np.full(len(column_of), np.nan)
+        self.grams_per_package = np.full(len(column_of), np.nan)
+        for column, ingredient_id in enumerate(self.ingredient_ids):
+            name, density, piece_weight, unit, quantity = ingredients.get(ingredient_id, ('', None, None, None, None))
+            self.ingredient_names.append(name)
+            grams = grams_per_unit(unit, density, piece_weight) if unit else None
+            self.purchase_units.append(unit if grams else None)
+            if grams:
+                self.grams_per_purchase_unit[column] = grams
+                if quantity and quantity > 0:
+                    self.grams_per_package[column] = grams * quantity
+
+    @classmethod
+    def for_user(cls, user_id, product_ids):
+        """以固定次數的查詢載入使用者指定產品的用料與最近的購買單位。"""
+        from app import db
+        from app.costing import load_cost_jobs
+        from app.models import Ingredient, IngredientLatestPrice, IngredientPrice, Product
+
+        products = db.session.execute(
+            db.select(Product.id, Product.product_name)
+            .where(Product.user_id == user_id, Product.id.in_(product_ids))
+            .order_by(Product.product_name, Product.id)
+        ).all()
+        jobs = load_cost_jobs([product.id for product in products]) if products else []
+
+        ingredient_ids = {item[0] for job in jobs for item in job['items']}
+        ingredients = {
+            row.id: (row.food_name, row.density_g_per_ml, row.piece_weight_g, row.unit, row.quantity)
+            for row in db.session.execute(
+                db.select(
+                    Ingredient.id, Ingredient.food_name, Ingredient.density_g_per_ml, Ingredient.piece_weight_g,
+                    IngredientPrice.unit, IngredientPrice.quantity
+                )
+                .outerjoin(IngredientLatestPrice, db.and_(
+                    IngredientLatestPrice.ingredient_id == Ingredient.id,
+                    IngredientLatestPrice.user_id == user_id
+                ))
+                .outerjoin(IngredientPrice, IngredientPrice.id == IngredientLatestPrice.price_id)
+                .where(Ingredient.id.in_(ingredient_ids))
+            )
+        } if ingredient_ids else {}
+        return cls([tuple(product) for product in products], jobs, ingredients)
+
+    def plan(self, quantities):
+        """
+        展開生產計畫，quantities 為 {product_id: 計畫生產件數}；不在模型中的產品忽略。
+        回傳各產品的批數與成本、合併後的採購清單與總計。
+        """
+        planned = np.zeros(len(self.product_ids), dtype=float)
+        for product_id, quantity in quantities.items():
+            row = self.row_of.get(product_id)
+            if row is not None:
+                planned[row] = quantity
+
+        # 只能整批生產，實際產量可能多於計畫
+        batches = np.ceil(planned / self.batch_sizes)
+        ingredient_costs = (self.grams_per_batch @ self.unit_costs) * batches
+        electricity_costs = batches * self.electricity_per_batch
+        labor_costs = batches * self.labor_per_batch
+        total_costs = ingredient_costs + electricity_costs + labor_costs
+
+        grams = batches @ self.grams_per_batch
+        costs = grams * self.unit_costs
+        amounts = grams / self.grams_per_purchase_unit
+        packages = np.ceil(grams / self.grams_per_package)
+
+        products = [{
+            'id': product_id,
+            'product_name': name,
+            'planned_quantity': int(planned[row]),
+            'batches': int(batches[row]),
+            'produced_quantity': int(batches[row] * self.batch_sizes[row]),
+            'ingredient_cost': float(ingredient_costs[row]),
+            'electricity_cost': float(electricity_costs[row]),
+            'labor_cost': float(labor_costs[row]),
+            'total_cost': float(total_costs[row]),
+        } for row, (product_id, name) in enumerate(zip(self.product_ids, self.product_names)) if planned[row] > 0]
+
+        shopping_list = [{
+            'ingredient_id': self.ingredient_ids[column],
+            'food_name': self.ingredient_names[column],
+            'grams': float(grams[column]),
+            'purchase_unit': self.purchase_units[column],
+            'purchase_amount': None if math.isnan(amounts[column]) else float(amounts[column]),
+            'packages': None if math.isnan(packages[column]) else int(packages[column]),
+            'cost_per_gram': float(self.unit_costs[column]),
+            'cost': float(costs[column]),
+            'cost_source': 'price' if self.priced[column] else 'default',
+        } for column in np.argsort(-costs, kind='stable') if grams[column] > 0]
+
+        return {
+            'products': products,
+            'shopping_list': shopping_list,
+            'totals': {
+                'ingredient_cost': float(ingredient_costs.sum()),
+                'electricity_cost': float(electricity_costs.sum()),
+                'labor_cost': float(labor_costs.sum()),
+                'total_cost': float(total_costs.sum()),
+            },
+        }
@@ -0,0 +1,267 @@
+# app/pricing/bulk_import.py
+# --- 食材價格批次匯入 ---
+# 供應商的價格表動輒數萬列，因此整個流程以「批次」為單位串流處理：
+#   1. CSV 以 pandas chunksize、Excel 以 openpyxl 唯讀模式逐批讀取，不會把整份檔案載入記憶體
+#   2. 每批的食材名稱以一次 IN 查詢對應到食材，找不到的名稱一次批次建立為使用者自訂食材
+#   3. 價格紀錄以 executemany 批次寫入，更新最新價格表後每批各自 commit
+# 資料列本身的錯誤 (缺欄位、數值不正確等) 不會中斷匯入，而是記錄在錯誤報告中。
+import math
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import insert, or_, select
+
+from app import db
+from app.metrics import timed
+from app.models import Ingredient, IngredientPrice, refresh_latest_prices
+from app.nutrition import NUTRIENT_FIELDS
+from app.pricing.forms import PRICE_SOURCE_CHOICES
+from app.search import PAYLOAD_FIELDS, record_bulk_upserts
+from app.units import is_known_unit
+
+# 每批處理的資料列數
+CHUNK_SIZE = 1000
+
+# 錯誤報告最多保留的筆數 (超過的只計數)，避免錯誤很多的大檔案佔用過多記憶體
+MAX_REPORTED_ERRORS = 500
+
+# 檔案欄位名稱對應到價格紀錄欄位
+COLUMNS = {
+    '食材名稱': 'ingredient_name',
+    '來源': 'source',
+    '購買價格': 'price',
+    '購買總數量': 'quantity',
+    '數量單位': 'unit',
+}
+
+# 來源欄位可填寫儲存值或顯示名稱
+SOURCE_LOOKUP = {}
+for _value, _label in PRICE_SOURCE_CHOICES:
+    SOURCE_LOOKUP[_value.lower()] = _value
+    SOURCE_LOOKUP[_label] = _value
+
+
+class PriceImportError(Exception):
+    """整份檔案無法匯入時 (格式不支援、缺少必要欄位等) 引發。"""
+
+
+class PriceImportReport:
+    """批次匯入的結果統計與逐列錯誤報告。"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.imported = 0
+        self.created_ingredients = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'message': message})
+
+    @property
+    def errors_truncated(self):
+        return self.error_count > len(self.errors)
+
+
+@timed('price_import')
+def import_price_file(file_storage, user, chunk_size=CHUNK_SIZE):
+    """
+    匯入上傳的 CSV/Excel 價格檔案，回傳 PriceImportReport。
+    每批資料各自 commit；若中途發生資料庫錯誤，先前已完成的批次會保留，
+    錯誤則由呼叫端處理。
+    """
+    report = PriceImportReport()
+    resolved = {}  # 食材名稱 -> ingredient_id，整份檔案共用，重複的名稱不必再查詢
+    for chunk in _read_chunks(file_storage, chunk_size):
+        _import_chunk(chunk, user.id, resolved, report)
+    return report
+
+
+def _read_chunks(file_storage, chunk_size):
+    """依副檔名選擇讀取方式，逐批產生 [(列號, {欄位: 值}), ...]。"""
+    extension = os.path.splitext(file_storage.filename or '')[1].lower()
+    if extension == '.csv':
+        return _read_csv_chunks(file_storage.stream, chunk_size)
+    if extension in ('.xlsx', '.xlsm'):
+        return _read_excel_chunks(file_storage.stream, chunk_size)
+    raise PriceImportError('不支援的檔案格式，請上傳 .csv 或 .xlsx 檔案。')
+
+
+def _check_header(header):
+    missing = [name for name in COLUMNS if name not in header]
+    if missing:
+        raise PriceImportError(f"檔案缺少必要欄位：{'、'.join(missing)}")
+
+
+def _read_csv_chunks(stream, chunk_size):
+    try:
+        reader = pd.read_csv(
+            stream, chunksize=chunk_size, dtype=str, keep_default_na=False,
+            encoding='utf-8-sig', skipinitialspace=True
+        )
+    except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise PriceImportError(f'無法讀取 CSV 檔案：{e}')
+
+    # 第 1 列為標題，資料從第 2 列開始
+    row_number = 2
+    with reader:
+        while True:
+            try:
+                frame = next(reader)
+            except StopIteration:
+                return
+            except (UnicodeDecodeError, pd.errors.ParserError) as e:
+                raise PriceImportError(f'第 {row_number} 列之後的內容無法讀取 (請確認檔案為 UTF-8 編碼的 CSV)：{e}')
+            frame.columns = [str(column).strip() for column in frame.columns]
+            _check_header(frame.columns)
+            records = frame[list(COLUMNS)].to_dict('records')
+            yield [(row_number + offset, record) for offset, record in enumerate(records)]
+            row_number += len(records)
+
+
+def _read_excel_chunks(stream, chunk_size):
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise PriceImportError(f'無法讀取 Excel 檔案：{e}')
+
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows, ())]
+        _check_header(header)
+        positions = {name: header.index(name) for name in COLUMNS}
+
+        chunk = []
+        for row_number, values in enumerate(rows, start=2):
+            chunk.append((row_number, {
+                name: values[index] if index < len(values) else None
+                for name, index in positions.items()
+            }))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def _parse_row(record):
+    """驗證並轉換一列資料 (規則與 IngredientPriceForm 相同)，有錯誤時引發 ValueError。"""
+    values = {COLUMNS[name]: ('' if value is None else str(value).strip()) for name, value in record.items()}
+
+    name = values['ingredient_name']
+    if not name:
+        raise ValueError('請輸入食材名稱')
+    if len(name) > 128:
+        raise ValueError('食材名稱不可超過 128 個字')
+
+    source = SOURCE_LOOKUP.get(values['source']) or SOURCE_LOOKUP.get(values['source'].lower())
+    if source is None:
+        raise ValueError(f"無法辨識的來源「{values['source']}」")
+
+    numbers = {}
+    for field, label, minimum in (('price', '購買價格', 0.01), ('quantity', '購買總數量', 0.001)):
+        try:
+            numbers[field] = float(values[field].replace(',', ''))
+        except ValueError:
+            raise ValueError(f"{label}必須是數字")
+        if not math.isfinite(numbers[field]):
+            raise ValueError(f"{label}必須是有限的數字")
+        if not numbers[field] >= minimum:
+            raise ValueError(f"{label}不可小於 {minimum}")
+
+    unit = values['unit']
+    if not unit:
+        raise ValueError('請輸入數量單位')
+    if len(unit) > 16:
+        raise ValueError('數量單位不可超過 16 個字')
+    if not is_known_unit(unit):
+        raise ValueError(f"無法辨識的單位「{unit}」")
+
+    return {'ingredient_name': name, 'source': source, 'unit': unit, **numbers}
+
+
+@timed('price_import.chunk')
+def _import_chunk(chunk, user_id, resolved, report):
+    rows = []
+    for row_number, record in chunk:
+        # 試算表結尾常有整列空白，直接略過
+        if all(value is None or str(value).strip() == '' for value in record.values()):
+            continue
+        report.total_rows += 1
+        try:
+            rows.append(_parse_row(record))
+        except ValueError as e:
+            report.add_error(row_number, str(e))
+    if not rows:
+        return
+
+    _resolve_ingredients({row['ingredient_name'] for row in rows}, user_id, resolved, report)
+
+    price_rows = [{
+        'ingredient_id': resolved[row['ingredient_name']],
+        'user_id': user_id,
+        'source': row['source'],
+        'price': row['price'],
+        'quantity': row['quantity'],
+        'unit': row['unit'],
+    } for row in rows]
+    db.session.execute(insert(IngredientPrice), price_rows)
+    refresh_latest_prices({(user_id, row['ingredient_id']) for row in price_rows})
+    db.session.commit()
+    report.imported += len(price_rows)
+
+
+def _resolve_ingredients(names, user_id, resolved, report):
+    """
+    以一次 IN 查詢把食材名稱對應到 id (使用者自己的食材優先於 TFDA)，
+    仍找不到的名稱一次批次建立為使用者自訂食材。
+    """
+    names = names - resolved.keys()
+    if not names:
+        return
+
+    matches = db.session.execute(
+        select(Ingredient.id, Ingredient.food_name, Ingredient.user_id)
+        .where(
+            Ingredient.food_name.in_(names),
+            or_(Ingredient.user_id == user_id, Ingredient.source == 'TFDA')
+        )
+        .order_by(Ingredient.id)
+    ).all()
+    own_names = set()
+    for ingredient_id, food_name, owner_id in matches:
+        if food_name in own_names:
+            continue
+        if owner_id == user_id:
+            own_names.add(food_name)
+            resolved[food_name] = ingredient_id
+        else:
+            resolved.setdefault(food_name, ingredient_id)
+
+    missing = sorted(names - resolved.keys())
+    if not missing:
+        return
+
+    created = db.session.execute(
+        insert(Ingredient).returning(
+            Ingredient.id, Ingredient.food_name, Ingredient.source, Ingredient.user_id,
+            *(getattr(Ingredient, field) for field in PAYLOAD_FIELDS)
+        ),
+        [{
+            'food_name': name,
+            'source': 'USER',
+            'user_id': user_id,
+            'cost_per_unit': 0,
+            **{field: 0 for field in NUTRIENT_FIELDS},
+        } for name in missing]
+    ).all()
+    for row in created:
+        resolved[row.food_name] = row.id
+    # 批次 INSERT 不會經過 ORM 事件，需自行通知自動完成索引
+    record_bulk_upserts(db.session, created)
+    report.created_ingredients += len(created)
@@ -0,0 +1,14 @@
+# app/pricing/commands.py
+# 食材價格相關的命令列指令 (flask pricing ...)
+import click
+from app import db
+from app.pricing import bp
+from app.models import refresh_price_aggregates
+
+
+@bp.cli.command('rebuild-aggregates')
+def rebuild_aggregates():
+    """重新彙總所有使用者的食材價格 (ingredient_latest_price)。升級資料庫結構後執行一次即可。"""
+    refresh_price_aggregates()
+    db.session.commit()
+    click.echo('已重新彙總所有食材價格；產品成本可以 `flask products recompute-costs --all` 重新計算。')
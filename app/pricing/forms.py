@@ -2,7 +2,9 @@
 from flask_wtf import FlaskForm
 # 移除 QuerySelectField，新增 StringField
 from wtforms import FloatField, IntegerField, SelectField, SubmitField, FileField, StringField, TextAreaField
-from wtforms.validators import DataRequired, NumberRange, Length, Optional
+from wtforms.validators import DataRequired, NumberRange, Length, Optional, ValidationError
+from app.costing import COSTING_STRATEGIES
+from app.units import is_known_unit
 # from wtforms_sqlalchemy.fields import QuerySelectField # 移除此行
 # from app.models import Ingredient # 這裡可以暫時保留或移除，因為不再直接用於QuerySelectField
 from flask_login import current_user
@@ -10,6 +12,14 @@ from flask_login import current_user
 
 # 移除 get_user_ingredients_query 輔助函數
 
+# 價格來源選項 (儲存值, 顯示名稱)，批次匯入時兩者皆可使用
+PRICE_SOURCE_CHOICES = [
+    ('Manual', '手動輸入'),
+    ('PX Mart', '全聯福利中心'),
+    ('Carrefour', '家樂福超市'),
+    ('Shopee', '蝦皮購物')
+]
+
 class IngredientPriceForm(FlaskForm):
     # 將 ingredient 欄位從 QuerySelectField 改為 StringField
     ingredient_name = StringField(
@@ -18,12 +28,7 @@ class IngredientPriceForm(FlaskForm):
     )
     source = SelectField(
         '來源',
-        choices=[
-            ('Manual', '手動輸入'),
-            ('PX Mart', '全聯福利中心'),
-            ('Carrefour', '家樂福超市'),
-            ('Shopee', '蝦皮購物')
-        ],
+        choices=PRICE_SOURCE_CHOICES,
         validators=[DataRequired('請選擇價格來源')]
     )
     price = FloatField('購買價格 (NT$)', validators=[DataRequired(), NumberRange(min=0.01)])
@@ -31,6 +36,27 @@ class IngredientPriceForm(FlaskForm):
     unit = StringField('數量單位 (例如: g, ml, 個, 包)', validators=[DataRequired(), Length(max=16)])
     submit = SubmitField('新增價格紀錄')
 
+    def validate_unit(self, field):
+        if not is_known_unit(field.data):
+            raise ValidationError(f'無法辨識的單位「{field.data}」，請使用 g、kg、ml、公升、個、包 等單位')
+
 class UploadPriceForm(FlaskForm):
     csv_file = FileField('上傳 CSV/Excel 檔案', validators=[DataRequired()])
-    submit = SubmitField('匯入價格')
\ No newline at end of file
+    submit = SubmitField('匯入價格')
+
+
+class CostingStrategyForm(FlaskForm):
+    strategy = SelectField(
+        '食材成本計算方式',
+        choices=[(code, label) for code, (label, _) in COSTING_STRATEGIES.items()],
+        validators=[DataRequired()]
+    )
+    window_days = IntegerField(
+        '移動平均期間 (天，自最新一次購買往前計算)',
+        validators=[DataRequired('請輸入天數'), NumberRange(min=1, max=3650)]
+    )
+    window_purchases = IntegerField(
+        '最低價採計的最近購買次數',
+        validators=[DataRequired('請輸入次數'), NumberRange(min=1, max=100)]
+    )
+    submit = SubmitField('儲存設定')
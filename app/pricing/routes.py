@@ -5,16 +5,172 @@ from flask import render_template, flash, redirect, url_for, abort, request, cur
 from app import db
 from app.pricing import bp
 from flask_login import login_required, current_user
-from app.models import Ingredient, IngredientPrice
-from app.pricing.forms import IngredientPriceForm, UploadPriceForm
-from datetime import datetime, timezone
-from sqlalchemy import or_
+from app.models import Ingredient, IngredientLatestPrice, IngredientPrice, refresh_latest_prices, refresh_price_aggregates
+from app.pricing.forms import CostingStrategyForm, IngredientPriceForm, UploadPriceForm
+from app.pricing.bulk_import import import_price_file, PriceImportError
+from app.nutrition_cache import record_price_changes
+from app.search import get_autocomplete
+from app.pagination import KeysetSort, PaginationError, keyset_paginate, page_args
+from app.units import cost_per_gram_sql
+from app.sql_instrumentation import query_budget
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import SQLAlchemyError
+
+# 價格列表 API 支援的排序方式 (以每項食材的最新價格列為分頁單位)
+PRICE_SORTS = {
+    'name': KeysetSort('name', [Ingredient.food_name, Ingredient.id]),
+    'purchase_date': KeysetSort(
+        'purchase_date', [IngredientLatestPrice.purchase_date, IngredientLatestPrice.ingredient_id], descending=True
+    ),
+}
+
+# 單一食材價格紀錄的排序 (新到舊)，使用 (user_id, ingredient_id, purchase_date) 索引
+HISTORY_SORT = KeysetSort('history', [IngredientPrice.purchase_date, IngredientPrice.id], descending=True)
+
+
+def price_summary(user_id, days, ingredient_ids):
+    """
+    以一次彙總查詢取得使用者對指定食材的價格摘要，回傳 {ingredient_id: row}：
+    最新一筆價格與其每公克成本、近 days 天的最低與平均每公克成本、近期與全部的紀錄筆數。
+    每公克成本直接在資料庫中換算 (見 app.units.cost_per_gram_sql)；
+    ingredient_ids 為列表 API 的一頁，彙總的資料量因此與頁面大小相關，而非價格紀錄的總筆數。
+    """
+    if not ingredient_ids:
+        return {}
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    latest = aliased(IngredientPrice)
+    density, piece_weight = Ingredient.density_g_per_ml, Ingredient.piece_weight_g
+    is_recent = IngredientPrice.purchase_date >= cutoff
+    recent_cost = case((is_recent, cost_per_gram_sql(
+        IngredientPrice.price, IngredientPrice.quantity, IngredientPrice.unit, density, piece_weight
+    )))
+
+    rows = db.session.execute(
+        db.select(
+            Ingredient.id.label('ingredient_id'),
+            Ingredient.food_name,
+            latest.id.label('latest_price_id'),
+            latest.source.label('latest_source'),
+            latest.price.label('latest_price'),
+            latest.quantity.label('latest_quantity'),
+            latest.unit.label('latest_unit'),
+            latest.purchase_date.label('latest_purchase_date'),
+            cost_per_gram_sql(latest.price, latest.quantity, latest.unit, density, piece_weight)
+            .label('latest_cost_per_gram'),
+            func.min(recent_cost).label('min_cost_per_gram'),
+            func.avg(recent_cost).label('avg_cost_per_gram'),
+            func.count(case((is_recent, IngredientPrice.id))).label('recent_count'),
+            func.count(IngredientPrice.id).label('record_count'),
+        )
+        .select_from(IngredientPrice)
+        .join(Ingredient, Ingredient.id == IngredientPrice.ingredient_id)
+        .join(IngredientLatestPrice, and_(
+            IngredientLatestPrice.user_id == IngredientPrice.user_id,
+            IngredientLatestPrice.ingredient_id == IngredientPrice.ingredient_id
+        ))
+        .join(latest, latest.id == IngredientLatestPrice.price_id)
+        .where(IngredientPrice.user_id == user_id, IngredientPrice.ingredient_id.in_(ingredient_ids))
+        .group_by(Ingredient.id, latest.id)
+    ).all()
+    return {row.ingredient_id: row for row in rows}
+
 
 @bp.route('/')
 @login_required
 def index():
-    prices = IngredientPrice.query.filter_by(user=current_user).order_by(IngredientPrice.purchase_date.desc()).all()
-    return render_template('pricing/index.html', title='食材價格調查', prices=prices)
+    # 列表內容由 list_prices API 分頁載入，頁面本身不查詢價格紀錄
+    return render_template('pricing/index.html', title='食材價格調查', days=current_app.config['PRICE_SUMMARY_DAYS'])
+
+
+@bp.route('/api/prices')
+@login_required
+@query_budget(6)
+def list_prices():
+    """
+    以 keyset 分頁列出使用者有價格紀錄的食材與其價格摘要 (見 price_summary)。
+    查詢參數：sort (name|purchase_date)、q (食材名稱篩選)、cursor、limit。
+    先以 ingredient_latest_price (每項食材一列) 分頁取得這一頁的食材，再只對這些食材做彙總。
+    """
+    try:
+        sort, cursor, limit, q = page_args(PRICE_SORTS, 'name')
+        statement = (
+            db.select(IngredientLatestPrice.ingredient_id)
+            .join(Ingredient, Ingredient.id == IngredientLatestPrice.ingredient_id)
+            .where(IngredientLatestPrice.user_id == current_user.id)
+        )
+        if q:
+            statement = statement.where(Ingredient.food_name.contains(q, autoescape=True))
+        rows, next_cursor = keyset_paginate(statement, sort, cursor, limit)
+    except PaginationError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    ingredient_ids = [row.ingredient_id for row in rows]
+    summaries = price_summary(current_user.id, current_app.config['PRICE_SUMMARY_DAYS'], ingredient_ids)
+    items = []
+    for ingredient_id in ingredient_ids:
+        summary = summaries.get(ingredient_id)
+        if summary is None:
+            continue
+        items.append({
+            'ingredient_id': ingredient_id,
+            'food_name': summary.food_name,
+            'latest_source': summary.latest_source,
+            'latest_price': summary.latest_price,
+            'latest_quantity': summary.latest_quantity,
+            'latest_unit': summary.latest_unit,
+            'latest_purchase_date': _format_date(summary.latest_purchase_date),
+            'latest_cost_per_gram': summary.latest_cost_per_gram,
+            'min_cost_per_gram': summary.min_cost_per_gram,
+            'avg_cost_per_gram': summary.avg_cost_per_gram,
+            'recent_count': summary.recent_count,
+            'record_count': summary.record_count,
+            'history_url': url_for('pricing.price_history', ingredient_id=ingredient_id),
+            'add_url': url_for('pricing.add_price', ingredient_name=summary.food_name),
+        })
+    return jsonify({'status': 'success', 'items': items, 'next_cursor': next_cursor})
+
+
+@bp.route('/api/history/<int:ingredient_id>')
+@login_required
+def price_history(ingredient_id):
+    """以 keyset 分頁回傳使用者對某項食材的價格紀錄 (新到舊)，供價格列表展開時載入。查詢參數：cursor、limit。"""
+    ingredient = db.get_or_404(Ingredient, ingredient_id)
+    try:
+        _, cursor, limit, _ = page_args({HISTORY_SORT.name: HISTORY_SORT}, HISTORY_SORT.name)
+        rows, next_cursor = keyset_paginate(
+            db.select(IngredientPrice).where(
+                IngredientPrice.user_id == current_user.id, IngredientPrice.ingredient_id == ingredient_id
+            ),
+            HISTORY_SORT, cursor, limit
+        )
+    except PaginationError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    return jsonify({
+        'status': 'success',
+        'ingredient_id': ingredient.id,
+        'food_name': ingredient.food_name,
+        'items': [{
+            'id': record.id,
+            'source': record.source,
+            'price': record.price,
+            'quantity': record.quantity,
+            'unit': record.unit,
+            # record.ingredient 已在 identity map 中，不會逐筆查詢
+            'cost_per_gram': record.calculate_cost_per_gram(),
+            'purchase_date': _format_date(record.purchase_date),
+            'edit_url': url_for('pricing.edit_price', price_id=record.id),
+            'delete_url': url_for('pricing.delete_price', price_id=record.id),
+        } for record in (row.IngredientPrice for row in rows)],
+        'next_cursor': next_cursor
+    })
+
+
+def _format_date(value):
+    return value.strftime('%Y-%m-%d') if value else None
+
 
 @bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -60,6 +216,7 @@ def add_price():
                 unit=form.unit.data
             )
             db.session.add(ingredient_price)
+            refresh_latest_prices({(current_user.id, ingredient.id)})
             db.session.commit()
             
             flash(flash_message, 'success')
@@ -77,6 +234,8 @@ def add_price():
     if ingredient_name_from_query:
         form.ingredient_name.data = ingredient_name_from_query
 
+    # 預先載入使用者的自建食材索引，之後的打字搜尋就不必查詢資料庫
+    get_autocomplete().warm_user(current_user.id)
     return render_template('pricing/add_price.html', title='新增食材價格', form=form)
 
 
@@ -99,6 +258,7 @@ def edit_price(price_id):
             price_entry.quantity = form.quantity.data
             price_entry.unit = form.unit.data
             price_entry.updated_at = datetime.now(timezone.utc)
+            refresh_latest_prices({(price_entry.user_id, price_entry.ingredient_id)})
             db.session.commit()
             flash('食材價格紀錄已成功更新！', 'success')
             return jsonify({
@@ -122,7 +282,9 @@ def delete_price(price_id):
     if price_entry.user != current_user:
         abort(403)
     
+    price_key = (price_entry.user_id, price_entry.ingredient_id)
     db.session.delete(price_entry)
+    refresh_latest_prices({price_key})
     db.session.commit()
     flash('食材價格紀錄已成功刪除。', 'success')
     return redirect(url_for('pricing.index'))
@@ -136,18 +298,8 @@ def search_all_ingredients():
     if not query:
         return jsonify([])
 
-    search = f"%{query}%"
-    
-    # 搜尋範圍包括使用者自己建立的(USER)和系統內建的(TFDA)
-    ingredients = Ingredient.query.filter(
-        or_(
-            Ingredient.creator == current_user,
-            Ingredient.source == 'TFDA'
-        ),
-        Ingredient.food_name.like(search)
-    ).order_by(Ingredient.food_name).limit(10).all()
-    
-    results = [{'name': ing.food_name} for ing in ingredients]
+    # 搜尋範圍包括使用者自己建立的(USER)和系統內建的(TFDA)，由記憶體內的自動完成服務提供
+    results = [{'name': item['name']} for item in get_autocomplete().search(query, current_user.id, 'ALL', limit=10)]
     return jsonify(results)
 # --- API 路由結束 ---
 
@@ -156,7 +308,49 @@ def search_all_ingredients():
 @login_required
 def upload_prices():
     form = UploadPriceForm()
+    report = None
     if form.validate_on_submit():
-        # ... (此部分邏輯不變) ...
-        pass
-    return render_template('pricing/upload_prices.html', title='匯入食材價格', form=form)
+        try:
+            report = import_price_file(form.csv_file.data, current_user)
+        except PriceImportError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+        except SQLAlchemyError:
+            # 每批各自 commit，發生錯誤前已完成的批次會保留
+            db.session.rollback()
+            current_app.logger.exception('批次匯入價格時發生資料庫錯誤')
+            flash('匯入過程中發生資料庫錯誤，部分資料可能未匯入，請檢查價格紀錄後重新上傳未完成的部分。', 'danger')
+        else:
+            flash(f'已匯入 {report.imported} 筆價格紀錄，新建立 {report.created_ingredients} 項自訂食材，'
+                  f'{report.error_count} 列有錯誤未匯入。', 'success' if not report.error_count else 'warning')
+    return render_template('pricing/upload_prices.html', title='匯入食材價格', form=form, report=report)
+
+
+@bp.route('/strategy', methods=['GET', 'POST'])
+@login_required
+def costing_strategy():
+    """設定食材成本的計算方式；變更後所有食譜與產品的成本會依新的方式重新計算。"""
+    form = CostingStrategyForm()
+    if form.validate_on_submit():
+        window_changed = (form.window_days.data != current_user.costing_window_days or
+                          form.window_purchases.data != current_user.costing_window_purchases)
+        current_user.costing_strategy = form.strategy.data
+        current_user.costing_window_days = form.window_days.data
+        current_user.costing_window_purchases = form.window_purchases.data
+        if window_changed:
+            # 移動平均與近期最低的彙總值取決於期間，需重新彙總這位使用者的所有食材
+            refresh_price_aggregates(user_ids={current_user.id})
+        # 讓使用者所有食材的價格視為已變動：清除營養計算快取並重新計算受影響產品的成本
+        ingredient_ids = db.session.scalars(
+            db.select(IngredientLatestPrice.ingredient_id).where(IngredientLatestPrice.user_id == current_user.id)
+        ).all()
+        record_price_changes(db.session, {(current_user.id, ingredient_id) for ingredient_id in ingredient_ids})
+        db.session.commit()
+        flash('成本計算方式已更新。', 'success')
+        return redirect(url_for('pricing.index'))
+
+    if request.method == 'GET':
+        form.strategy.data = current_user.costing_strategy
+        form.window_days.data = current_user.costing_window_days
+        form.window_purchases.data = current_user.costing_window_purchases
+    return render_template('pricing/strategy.html', title='成本計算方式', form=form)
@@ -3,5 +3,5 @@ from flask import Blueprint
 # 建立一個名為 'products' 的藍圖
 bp = Blueprint('products', __name__)
 
-# 從目前資料夾(.)匯入路由模組
-from . import routes
\ No newline at end of file
+# 從目前資料夾(.)匯入路由與命令列指令模組
+from . import routes, commands
\ No newline at end of file
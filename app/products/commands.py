@@ -0,0 +1,16 @@
+# app/products/commands.py
+# 產品相關的命令列指令 (flask products ...)
+import click
+from app.products import bp
+from app.costing import recompute_stale_products
+
+
+@bp.cli.command('recompute-costs')
+@click.option('--all', 'recompute_all', is_flag=True, help='重新計算所有產品，而不只是待計算的產品。')
+@click.option('--workers', type=int, default=None, help='平行計算的行程數 (預設為 CPU 核心數)。')
+def recompute_costs(recompute_all, workers):
+    """重新計算成本待更新 (cost_computed_at 為空) 的產品。"""
+    from app.models import Product
+    product_ids = [product_id for (product_id,) in Product.query.with_entities(Product.id)] if recompute_all else None
+    count = recompute_stale_products(product_ids, workers=workers)
+    click.echo(f'已重新計算 {count} 項產品的成本。')
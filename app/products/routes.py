@@ -3,30 +3,23 @@ from flask import render_template, flash, redirect, url_for, abort, request, cur
 from app import db
 from app.products import bp
 from flask_login import login_required, current_user
-from app.models import Product, Recipe
+from app.models import Product, Recipe, calculate_nutrition_bulk
+from app.pagination import KeysetSort, PaginationError, keyset_paginate, page_args
 from app.products.forms import ProductForm
+from app.what_if import MAX_SCENARIOS, get_portfolio_model
+from app.planning import ProductionPlanner, MAX_PLAN_PRODUCTS
+from app.sql_instrumentation import query_budget
+from app.database import use_primary
+from datetime import datetime, timezone
+import math
 
 @bp.route('/')
 @login_required
 def index():
-    # ... 此函數保持不變 ...
-    all_products = Product.query.filter_by(creator=current_user).order_by(Product.product_name).all()
-    products_data_for_display = [{'id': p.id, 'name': p.product_name} for p in all_products]
-    all_recipes = Recipe.query.filter_by(author=current_user).order_by(Recipe.recipe_name).all()
-    recipes_data_for_display = []
-    for recipe in all_recipes:
-        recipe_calc_data = recipe.calculate_nutrition()
-        recipes_data_for_display.append({
-            'id': recipe.id,
-            'name': recipe.recipe_name,
-            'total_ingredient_cost': round(recipe_calc_data.get('total_ingredient_cost', 0), 2),
-            'servings_count': recipe.servings_count
-        })
+    # 產品列表與建立產品時的食譜清單都由分頁 API 載入，頁面本身不查詢產品與食譜
     return render_template(
         'products/index.html',
         title='產品管理',
-        all_products_initial_data=products_data_for_display,
-        all_recipes_initial_data=recipes_data_for_display,
         electricity_cost_per_kwh=current_app.config['ELECTRICITY_COST_PER_KWH'],
         labor_cost_per_hour=current_app.config['LABOR_COST_PER_HOUR']
     )
@@ -34,7 +27,35 @@ def index():
 
 # --- API 路由 ---
 
+# 產品列表 API 支援的排序方式
+PRODUCT_SORTS = {
+    'name': KeysetSort('name', [Product.product_name, Product.id]),
+    'updated': KeysetSort('updated', [Product.updated_at, Product.id], descending=True),
+}
+
+
+@bp.route('/api/products', methods=['GET'])
+@login_required
+@query_budget(4)
+def list_products():
+    """以 keyset 分頁列出使用者的產品。查詢參數：sort (name|updated)、q (名稱篩選)、cursor、limit。"""
+    try:
+        sort, cursor, limit, q = page_args(PRODUCT_SORTS, 'name')
+        statement = db.select(Product.id, Product.product_name).where(Product.user_id == current_user.id)
+        if q:
+            statement = statement.where(Product.product_name.contains(q, autoescape=True))
+        rows, next_cursor = keyset_paginate(statement, sort, cursor, limit)
+    except PaginationError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'status': 'success',
+        'items': [{'id': row.id, 'name': row.product_name} for row in rows],
+        'next_cursor': next_cursor
+    })
+
+
 @bp.route('/api/products/<int:product_id>', methods=['GET'])
+@use_primary
 @login_required
 def get_product_details(product_id):
     product = Product.query.get_or_404(product_id)
@@ -47,6 +68,12 @@ def get_product_details(product_id):
         labor_cost_per_hour=current_app.config['LABOR_COST_PER_HOUR']
     )
     
+    # 食材或價格變動後被標記為待計算的產品，順便寫回最新的成本
+    if product.cost_computed_at is None:
+        product.calculated_cost = total_cost_details['average_cost_per_product']
+        product.cost_computed_at = datetime.now(timezone.utc)
+        db.session.commit()
+
     # ★ 主要修改處：在回傳的 JSON 中加入 ingredient_cost_details
     return jsonify({
         'status': 'success',
@@ -105,7 +132,8 @@ def api_create_product():
             bake_power_w=temp_product.bake_power_w,
             bake_time_min=temp_product.bake_time_min,
             production_time_hr=temp_product.production_time_hr,
-            calculated_cost=calculated_cost # 使用後端計算的成本
+            calculated_cost=calculated_cost, # 使用後端計算的成本
+            cost_computed_at=datetime.now(timezone.utc)
         )
         db.session.add(product)
         db.session.commit()
@@ -142,6 +170,7 @@ def update_product_details(product_id):
         product.selling_price = float(data.get('selling_price', product.selling_price))
         product.stock_quantity = int(data.get('stock_quantity', product.stock_quantity))
         product.calculated_cost = cost_data['average_cost_per_product'] # 儲存後端計算的成本
+        product.cost_computed_at = datetime.now(timezone.utc)
 
         db.session.commit()
         return jsonify({'status': 'success', 'message': '產品已成功更新！'})
@@ -168,7 +197,7 @@ def get_recipe_details(recipe_id):
     if recipe.author != current_user:
         return jsonify({'status': 'error', 'message': '無權限查看此食譜'}), 403
     
-    recipe_data = recipe.calculate_nutrition()
+    recipe_data = calculate_nutrition_bulk([recipe])[recipe.id]
     return jsonify({
         'status': 'success',
         'recipe_id': recipe.id,
@@ -178,3 +207,94 @@ def get_recipe_details(recipe_id):
         'ingredient_cost_details': recipe_data.get('ingredient_cost_details', [])
     })
 
+
+
+@bp.route('/api/what_if', methods=['POST'])
+@login_required
+def what_if():
+    """
+    食材價格變動試算：一次計算使用者所有產品在各情境下的新成本與毛利率。
+    請求格式：{"scenarios": [{"name": "奶油漲 15%", "changes": {"<ingredient_id>": 15}}, ...]}
+    (只有一個情境時也可直接傳 {"changes": {...}})，百分比為負數代表降價。
+    """
+    data = request.get_json(silent=True)
+    if not data: return jsonify({'status': 'error', 'message': '請求資料不完整'}), 400
+
+    raw_scenarios = data.get('scenarios')
+    if raw_scenarios is None and 'changes' in data:
+        raw_scenarios = [{'name': data.get('name', ''), 'changes': data['changes']}]
+    if not isinstance(raw_scenarios, list) or not raw_scenarios:
+        return jsonify({'status': 'error', 'message': '請提供至少一個試算情境'}), 400
+    if len(raw_scenarios) > MAX_SCENARIOS:
+        return jsonify({'status': 'error', 'message': f'一次最多試算 {MAX_SCENARIOS} 個情境'}), 400
+
+    names, scenarios = [], []
+    try:
+        for index, scenario in enumerate(raw_scenarios):
+            changes = {int(ingredient_id): float(percent) for ingredient_id, percent in scenario['changes'].items()}
+            if not all(math.isfinite(percent) for percent in changes.values()):
+                return jsonify({'status': 'error', 'message': '漲跌百分比必須是有限的數字'}), 400
+            if any(percent <= -100 for percent in changes.values()):
+                return jsonify({'status': 'error', 'message': '降價幅度必須小於 100%'}), 400
+            names.append(str(scenario.get('name') or f'情境 {index + 1}'))
+            scenarios.append(changes)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'status': 'error', 'message': '情境格式錯誤，changes 應為 {食材 id: 漲跌百分比}'}), 400
+
+    model = get_portfolio_model(current_user.id)
+    base_costs, base_margins, costs, margins = model.evaluate(scenarios)
+
+    return jsonify({
+        'status': 'success',
+        'products': [{
+            'id': product_id,
+            'product_name': name,
+            'selling_price': float(selling_price),
+            'base_cost': float(base_cost),
+            'base_margin': float(base_margin),
+        } for product_id, name, selling_price, base_cost, base_margin in zip(
+            model.product_ids, model.product_names, model.selling_prices, base_costs, base_margins
+        )],
+        'scenarios': [{
+            'name': name,
+            'products': [{
+                'id': product_id,
+                'new_cost': float(cost),
+                'cost_change': float(cost - base_cost),
+                'new_margin': float(margin),
+                'margin_change': float(margin - base_margin),
+            } for product_id, cost, base_cost, margin, base_margin in zip(
+                model.product_ids, scenario_costs, base_costs, scenario_margins, base_margins
+            )],
+        } for name, scenario_costs, scenario_margins in zip(names, costs, margins)]
+    })
+
+
+@bp.route('/api/production_plan', methods=['POST'])
+@login_required
+def production_plan():
+    """
+    生產計畫用料展開：依各產品的計畫生產件數，計算需要的批數、食材總克數 (含採購單位換算)、
+    預估食材成本與電費、人力成本。
+    請求格式：{"plan": {"<product_id>": 計畫件數, ...}}
+    """
+    data = request.get_json(silent=True)
+    if not data: return jsonify({'status': 'error', 'message': '請求資料不完整'}), 400
+
+    raw_plan = data.get('plan')
+    if not isinstance(raw_plan, dict) or not raw_plan:
+        return jsonify({'status': 'error', 'message': '請提供至少一項產品的計畫件數'}), 400
+    if len(raw_plan) > MAX_PLAN_PRODUCTS:
+        return jsonify({'status': 'error', 'message': f'一次最多規劃 {MAX_PLAN_PRODUCTS} 項產品'}), 400
+    try:
+        quantities = {int(product_id): int(quantity) for product_id, quantity in raw_plan.items()}
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': '計畫格式錯誤，plan 應為 {產品 id: 件數}'}), 400
+    if any(quantity < 0 for quantity in quantities.values()):
+        return jsonify({'status': 'error', 'message': '計畫件數不可為負數'}), 400
+
+    planner = ProductionPlanner.for_user(current_user.id, quantities.keys())
+    missing = sorted(quantities.keys() - set(planner.product_ids))
+    if missing:
+        return jsonify({'status': 'error', 'message': f"找不到產品：{', '.join(map(str, missing))}"}), 404
+    return jsonify({'status': 'success', **planner.plan(quantities)})
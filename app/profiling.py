@@ -0,0 +1,147 @@
+# app/profiling.py
+# --- 單一請求的 cProfile 剖析 ---
+# 管理員 (ADMIN_USERNAMES) 在請求加上 X-Profile: 1 標頭或 ?_profile=1 參數時，以 cProfile 剖析這個請求，
+# 結果以 pstats 格式存到 PROFILER_DIR (預設 <instance>/profiles)，並在回應標頭 X-Profile-Id 回傳編號；
+# 最近的剖析結果列在 /admin/profiles，可直接檢視最耗時的函式或下載 .prof 檔 (snakeviz 等工具可開啟)。
+# 沒有觸發的請求只檢查一次標頭與參數，不會啟動剖析器。
+# cProfile 同一時間只能有一個在執行，同時觸發的其他請求不剖析 (回應標頭 X-Profile-Skipped)。
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, g, request
+from flask_login import current_user
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ARG = '_profile'
+# 剖析結果編號 (檔名) 的格式
+PROFILE_ID = re.compile(r'^[0-9T]+_[\w.-]+$')
+
+
+class RequestProfiler:
+    """依請求觸發的 cProfile 剖析與剖析結果的存取。"""
+
+    def __init__(self):
+        self._active = threading.Lock()
+
+    def init_app(self, app):
+        if not app.config.get('PROFILER_DIR'):
+            app.config['PROFILER_DIR'] = os.path.join(app.instance_path, 'profiles')
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['request_profiler'] = self
+
+    @property
+    def directory(self):
+        return current_app.config['PROFILER_DIR']
+
+    # --- 請求 ---
+
+    def _start_request(self):
+        if PROFILE_HEADER not in request.headers and PROFILE_ARG not in request.args:
+            return
+        if not current_app.config['PROFILER_ENABLED'] or not getattr(current_user, 'is_admin', False):
+            return
+        if not self._active.acquire(blocking=False):
+            g.profile_skipped = True
+            return
+        profiler = cProfile.Profile()
+        g.profile = (profiler, time.perf_counter())
+        profiler.enable()
+
+    def _finish_request(self, response):
+        if g.pop('profile_skipped', False):
+            response.headers['X-Profile-Skipped'] = 'another request is being profiled'
+        entry = g.pop('profile', None)
+        if entry is None:
+            return response
+        profiler, start = entry
+        profiler.disable()
+        duration = time.perf_counter() - start
+        self._active.release()
+        response.headers['X-Profile-Id'] = self._save(profiler, duration, response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        # 發生未處理的例外時不會經過 after_request，在這裡停止剖析器並釋放鎖 (結果不保存)
+        entry = g.pop('profile', None)
+        if entry is not None:
+            entry[0].disable()
+            self._active.release()
+
+    # --- 存取 ---
+
+    def _save(self, profiler, duration, status):
+        created_at = datetime.now(timezone.utc)
+        profile_id = f"{created_at:%Y%m%dT%H%M%S%f}_{request.endpoint or 'unmatched'}"
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.directory, f'{profile_id}.prof'))
+        with open(os.path.join(self.directory, f'{profile_id}.json'), 'w', encoding='utf-8') as fp:
+            json.dump({
+                'id': profile_id,
+                'created_at': created_at.isoformat(),
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'status': status,
+                'duration_ms': round(duration * 1000, 1),
+                'user': current_user.username,
+            }, fp, ensure_ascii=False)
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        """只保留最近的 PROFILER_MAX_FILES 份剖析結果。"""
+        for profile_id in self._profile_ids()[current_app.config['PROFILER_MAX_FILES']:]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + extension))
+                except FileNotFoundError:
+                    pass
+
+    def _profile_ids(self):
+        """依時間由新到舊排列的剖析結果編號。"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-len('.json')] for name in names if name.endswith('.json')), reverse=True)
+
+    def recent(self):
+        """最近的剖析結果 (metadata 字典)，由新到舊。"""
+        profiles = []
+        for profile_id in self._profile_ids():
+            try:
+                with open(os.path.join(self.directory, f'{profile_id}.json'), encoding='utf-8') as fp:
+                    profiles.append(json.load(fp))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def profile_path(self, profile_id):
+        """剖析結果的 .prof 路徑；編號格式不正確或檔案不存在時回傳 None。"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f'{profile_id}.prof')
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=60):
+        """以 pstats 產生文字報表 (依 sort 排序的前 limit 個函式)。"""
+        path = self.profile_path(profile_id)
+        if path is None:
+            return None
+        stream = io.StringIO()
+        stats = pstats.Stats(path, stream=stream)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+def get_request_profiler():
+    return current_app.extensions.get('request_profiler')
@@ -0,0 +1,181 @@
+# app/recipe_graph.py
+# --- 子食譜 (半成品) 的依賴圖 ---
+# 食譜項目可以是食材，也可以是另一個食譜 (麵團、奶餡、內餡等半成品)，依「成品重量」按比例使用：
+#     用了 q 克子食譜 → 子食譜的營養與成本 × q / 子食譜成品重 (final_weight_g，未設定時為原料總重)
+# 食譜之間因此形成有向無環圖 (DAG)。這裡提供以遞迴 CTE 載入整個子圖、拓撲排序 (含循環偵測)、
+# 以及把子食譜按比例展開成食材用量的工具；營養計算、成本計算與快取失效都建立在這些函式上。
+import hashlib
+import json
+
+from sqlalchemy import select
+
+from app import db
+
+
+class RecipeCycleError(ValueError):
+    """食譜之間出現循環引用 (A 使用 B，B 又直接或間接使用 A) 時引發。"""
+
+
+def descendant_recipe_ids(recipe_ids):
+    """以一次遞迴 CTE 查出這些食譜直接或間接使用的所有子食譜 id (不含自身)。"""
+    from app.models import RecipeItem
+
+    if not recipe_ids:
+        return set()
+    children = (
+        select(RecipeItem.sub_recipe_id.label('recipe_id'))
+        .where(RecipeItem.recipe_id.in_(recipe_ids), RecipeItem.sub_recipe_id.is_not(None))
+        .cte('descendants', recursive=True)
+    )
+    children = children.union(
+        select(RecipeItem.sub_recipe_id)
+        .join(children, RecipeItem.recipe_id == children.c.recipe_id)
+        .where(RecipeItem.sub_recipe_id.is_not(None))
+    )
+    return set(db.session.scalars(select(children.c.recipe_id)))
+
+
+def ancestor_recipe_ids(recipe_ids):
+    """
+    以一次遞迴 CTE 查出直接或間接使用這些食譜作為子食譜的所有食譜 id (不含自身)。
+    recipe_ids 可以是 id 集合或回傳 recipe_id 欄位的子查詢。
+    """
+    from app.models import RecipeItem
+
+    parents = (
+        select(RecipeItem.recipe_id)
+        .where(RecipeItem.sub_recipe_id.in_(recipe_ids))
+        .cte('ancestors', recursive=True)
+    )
+    parents = parents.union(
+        select(RecipeItem.recipe_id)
+        .join(parents, RecipeItem.sub_recipe_id == parents.c.recipe_id)
+    )
+    return set(db.session.scalars(select(parents.c.recipe_id)))
+
+
+def load_recipe_graph(recipe_ids):
+    """
+    以固定次數的查詢載入這些食譜及其所有子食譜的結構，回傳 {recipe_id: node}：
+    node 為 {'recipe_name', 'user_id', 'final_weight_g', 'items': [(ingredient_id, sub_recipe_id, quantity_g), ...]}。
+    """
+    from app.models import Recipe, RecipeItem
+
+    recipe_ids = set(recipe_ids)
+    all_ids = recipe_ids | descendant_recipe_ids(recipe_ids)
+    if not all_ids:
+        return {}
+    graph = {
+        row.id: {'recipe_name': row.recipe_name, 'user_id': row.user_id, 'final_weight_g': row.final_weight_g, 'items': []}
+        for row in db.session.execute(
+            select(Recipe.id, Recipe.recipe_name, Recipe.user_id, Recipe.final_weight_g).where(Recipe.id.in_(all_ids))
+        )
+    }
+    for row in db.session.execute(
+        select(RecipeItem.recipe_id, RecipeItem.ingredient_id, RecipeItem.sub_recipe_id, RecipeItem.quantity_g)
+        .where(RecipeItem.recipe_id.in_(all_ids))
+        .order_by(RecipeItem.id)
+    ):
+        graph[row.recipe_id]['items'].append((row.ingredient_id, row.sub_recipe_id, row.quantity_g))
+    return graph
+
+
+def topological_order(roots, children_of):
+    """
+    回傳從 roots 可到達的所有節點，子節點一定排在使用它的節點之前。
+    children_of(node) 回傳節點的子節點；發現循環時引發 RecipeCycleError。
+    """
+    order, state = [], {}  # state: 1 = 走訪中, 2 = 完成
+    for root in roots:
+        if root in state:
+            continue
+        stack = [(root, iter(children_of(root)))]
+        state[root] = 1
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if state.get(child) == 1:
+                    raise RecipeCycleError('食譜之間不可循環引用')
+                if child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(children_of(child))))
+                    break
+            else:
+                stack.pop()
+                state[node] = 2
+                order.append(node)
+    return order
+
+
+def _children_in(graph):
+    return lambda recipe_id: [
+        sub_recipe_id for _, sub_recipe_id, _ in graph[recipe_id]['items']
+        if sub_recipe_id is not None and sub_recipe_id in graph
+    ]
+
+
+def recipe_weight(final_weight_g, items):
+    """子食譜按比例換算時使用的成品重量：有設定烘焙後總重時使用它，否則為原料總重。"""
+    if final_weight_g and final_weight_g > 0:
+        return final_weight_g
+    return sum(quantity_g or 0 for _, _, quantity_g in items)
+
+
+def flatten_ingredients(graph, recipe_ids):
+    """
+    把子食譜按比例展開，回傳 {recipe_id: [(ingredient_id, quantity_g), ...]}，
+    每個節點只展開一次 (記憶化)，被多個食譜共用的半成品不會重複計算。
+    """
+    order = topological_order(recipe_ids, _children_in(graph))
+    flattened = {}
+    for recipe_id in order:
+        items = []
+        for ingredient_id, sub_recipe_id, quantity_g in graph[recipe_id]['items']:
+            if sub_recipe_id is None:
+                items.append((ingredient_id, quantity_g or 0))
+                continue
+            if sub_recipe_id not in graph:
+                continue
+            node = graph[sub_recipe_id]
+            weight = recipe_weight(node['final_weight_g'], node['items'])
+            scale = (quantity_g or 0) / weight if weight > 0 else 0.0
+            items.extend((sub_ingredient_id, sub_quantity * scale)
+                         for sub_ingredient_id, sub_quantity in flattened[sub_recipe_id])
+        flattened[recipe_id] = items
+    return flattened
+
+
+def dependency_closure(graph, recipe_ids):
+    """
+    回傳 {recipe_id: (直接或間接用到的食材 id 集合, 直接或間接用到的子食譜 id 集合)}，
+    供營養計算快取記錄每個結果依賴的資料。
+    """
+    order = topological_order(recipe_ids, _children_in(graph))
+    closure = {}
+    for recipe_id in order:
+        ingredient_ids, sub_recipe_ids = set(), set()
+        for ingredient_id, sub_recipe_id, _ in graph[recipe_id]['items']:
+            if sub_recipe_id is None:
+                ingredient_ids.add(ingredient_id)
+            elif sub_recipe_id in closure:
+                sub_recipe_ids.add(sub_recipe_id)
+                ingredient_ids |= closure[sub_recipe_id][0]
+                sub_recipe_ids |= closure[sub_recipe_id][1]
+        closure[recipe_id] = (ingredient_ids, sub_recipe_ids)
+    return closure
+
+
+def content_hashes(graph, recipe_ids):
+    """
+    回傳 {recipe_id: 內容雜湊}。雜湊涵蓋成品重量與各項目的用量，子食譜以其雜湊代入，
+    因此子食譜 (不論多深) 的內容改變時，使用它的食譜雜湊也會改變。
+    """
+    order = topological_order(recipe_ids, _children_in(graph))
+    hashes = {}
+    for recipe_id in order:
+        node = graph[recipe_id]
+        items = sorted(json.dumps([ingredient_id, hashes.get(sub_recipe_id), quantity_g])
+                       for ingredient_id, sub_recipe_id, quantity_g in node['items'])
+        content = json.dumps([node['final_weight_g'], items])
+        hashes[recipe_id] = hashlib.sha256(content.encode()).hexdigest()
+    return hashes
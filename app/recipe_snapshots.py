@@ -0,0 +1,112 @@
+# app/recipe_snapshots.py
+# --- 食譜營養與成本快照 ---
+# 食譜列表、建立產品時的食譜清單與營養標示頁只需要總量 (重量、八項營養素、食材成本)，
+# 因此把計算結果存在 recipes 表的 snapshot_* 欄位，讀取時不必再由原料項目重新計算：
+#   1. 食譜本身被儲存時，commit 前在同一個交易中重新計算快照 (由 app.costing 的 before_commit 事件呼叫)
+#   2. 食材、價格或子食譜變動時，只把受影響的食譜標記為過期 (snapshot_computed_at = NULL)，
+#      之後由列表 API 讀到時才重新計算，或以 flask recipes refresh-snapshots 批次重算
+# snapshot_version 記錄計算方式的版本：計算方式改變時調高 SNAPSHOT_VERSION，舊快照即自動視為過期。
+# snapshot_hash 為食譜內容 (成品重量、項目與用量，含子食譜) 的雜湊，可用來判斷兩份快照之間配方是否改變。
+# 快照以 Core 語法寫入 recipes 表，不會觸發營養計算快取的失效，也不會改變 updated_at。
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import bindparam, or_, select, update
+
+from app import db
+from app.nutrition import NUTRIENT_FIELDS
+
+# 計算方式的版本，與 recipes.snapshot_version 不同的快照視為過期
+SNAPSHOT_VERSION = 1
+# 批次重算時每次載入的食譜數
+REFRESH_CHUNK_SIZE = 500
+
+# 快照保存的總計欄位 (對應 recipes.snapshot_<欄位>)
+SNAPSHOT_FIELDS = ('total_weight_g', *NUTRIENT_FIELDS, 'total_ingredient_cost', 'has_trans_fat_non_art')
+
+
+def snapshot_totals(recipe):
+    """快照仍有效時回傳 {欄位: 值} (欄位見 SNAPSHOT_FIELDS)，否則回傳 None。"""
+    if recipe.snapshot_computed_at is None or recipe.snapshot_version != SNAPSHOT_VERSION:
+        return None
+    return {field: getattr(recipe, f'snapshot_{field}') for field in SNAPSHOT_FIELDS}
+
+
+def stale_condition():
+    """快照過期的 SQL 條件。"""
+    from app.models import Recipe
+    return or_(Recipe.snapshot_computed_at.is_(None), Recipe.snapshot_version != SNAPSHOT_VERSION)
+
+
+def refresh_recipe_snapshots(recipe_ids):
+    """
+    在目前的交易中重新計算並寫入指定食譜的快照 (不 commit)，回傳 {recipe_id: 快照總計}。
+    已在同一個交易中被刪除的食譜略過。
+    """
+    from app.models import Recipe, calculate_nutrition_bulk
+    from app.recipe_graph import content_hashes, load_recipe_graph
+
+    recipes = Recipe.query.filter(Recipe.id.in_(recipe_ids)).all()
+    if not recipes:
+        return {}
+    nutrition = calculate_nutrition_bulk(recipes)
+    ids = [recipe.id for recipe in recipes]
+    hashes = content_hashes(load_recipe_graph(ids), ids)
+
+    now = datetime.now(timezone.utc)
+    snapshots = {
+        recipe_id: {field: totals[field] for field in SNAPSHOT_FIELDS}
+        for recipe_id, totals in nutrition.items()
+    }
+    table = Recipe.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('recipe_id')).values(updated_at=table.c.updated_at),
+        [{
+            'recipe_id': recipe_id,
+            'snapshot_version': SNAPSHOT_VERSION,
+            'snapshot_hash': hashes[recipe_id],
+            'snapshot_computed_at': now,
+            **{f'snapshot_{field}': value for field, value in snapshot.items()},
+        } for recipe_id, snapshot in snapshots.items()]
+    )
+    return snapshots
+
+
+def mark_recipes_stale(recipe_ids):
+    """將食譜快照標記為過期 (不 commit)。"""
+    from app.models import Recipe
+    table = Recipe.__table__
+    db.session.execute(
+        update(table).where(table.c.id.in_(recipe_ids))
+        .values(snapshot_computed_at=None, updated_at=table.c.updated_at)
+    )
+
+
+def update_affected_snapshots(keys, recipe_ids):
+    """
+    commit 前由 app.costing 呼叫：keys 為這個交易的依賴鍵，recipe_ids 為受影響的食譜 (含上游)。
+    被儲存的食譜本身不多時立即重算，其餘受影響的食譜標記為過期，等讀取時再計算。
+    """
+    saved = {key[1] for key in keys if key[0] == 'recipe'} & recipe_ids
+    if len(saved) > current_app.config.get('RECIPE_SNAPSHOT_INLINE_LIMIT', 200):
+        saved = set()
+    if saved:
+        refresh_recipe_snapshots(saved)
+    if recipe_ids - saved:
+        mark_recipes_stale(recipe_ids - saved)
+
+
+def recompute_stale_recipes(recipe_ids=None):
+    """重新計算快照過期 (或指定) 的食譜並分批 commit，回傳處理的食譜數。"""
+    from app.models import Recipe
+
+    query = select(Recipe.id).order_by(Recipe.id)
+    if recipe_ids is None:
+        query = query.where(stale_condition())
+    else:
+        query = query.where(Recipe.id.in_(recipe_ids))
+    ids = db.session.scalars(query).all()
+    for start in range(0, len(ids), REFRESH_CHUNK_SIZE):
+        refresh_recipe_snapshots(ids[start:start + REFRESH_CHUNK_SIZE])
+        db.session.commit()
+    return len(ids)
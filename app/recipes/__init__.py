@@ -4,4 +4,4 @@ from flask import Blueprint
 bp = Blueprint('recipes', __name__)
 
 # 從目前資料夾(.)匯入路由模組
-from . import routes
\ No newline at end of file
+from . import routes, commands
\ No newline at end of file
@@ -0,0 +1,15 @@
+# app/recipes/commands.py
+# 食譜相關的命令列指令 (flask recipes ...)
+import click
+from app.recipes import bp
+from app.recipe_snapshots import recompute_stale_recipes
+
+
+@bp.cli.command('refresh-snapshots')
+@click.option('--all', 'refresh_all', is_flag=True, help='重新計算所有食譜，而不只是快照過期的食譜。')
+def refresh_snapshots(refresh_all):
+    """重新計算營養與成本快照過期 (snapshot_computed_at 為空或版本不同) 的食譜。"""
+    from app.models import Recipe
+    recipe_ids = [recipe_id for (recipe_id,) in Recipe.query.with_entities(Recipe.id)] if refresh_all else None
+    count = recompute_stale_recipes(recipe_ids)
+    click.echo(f'已重新計算 {count} 個食譜的快照。')
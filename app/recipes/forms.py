@@ -15,6 +15,9 @@ class IngredientForm(FlaskForm):
     # 將 cost_per_unit 和 unit_name 的 DataRequired() 更改為 Optional()
     cost_per_unit = FloatField('成本 (每100g)', validators=[Optional(), NumberRange(min=0)], default=0)
     unit_name = StringField('單位名稱', validators=[Optional(), Length(max=16)], default='g') # 允許最大長度，但允許空
+    # 價格紀錄以容量或計數單位購買時，用來換算成公克 (可不填)
+    density_g_per_ml = FloatField('密度 (g/ml)', validators=[Optional(), NumberRange(min=0.01)])
+    piece_weight_g = FloatField('每件重量 (g)', validators=[Optional(), NumberRange(min=0.01)])
 
     calories_kcal = FloatField('熱量 (大卡/100g)', validators=[InputRequired(message="此欄位不可空白"), NumberRange(min=0)])
     protein_g = FloatField('蛋白質 (克/100g)', validators=[InputRequired(message="此欄位不可空白"), NumberRange(min=0)])
@@ -5,37 +5,46 @@ from datetime import datetime, timezone
 from app import db
 from app.recipes import bp
 from flask_login import login_required, current_user
-from app.models import Recipe, Ingredient, RecipeItem, Product
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import Recipe, Ingredient, RecipeItem, Product, IngredientLatestPrice, calculate_nutrition_bulk, \
+    refresh_price_aggregates
+from app.pagination import KeysetSort, PaginationError, keyset_paginate, page_args
 from app.recipes.forms import RecipeForm, IngredientForm
+from app.nutrition import NUTRIENT_FIELDS, label_profiles, totals_as_dict
+from app.recipe_graph import descendant_recipe_ids
+from app.recipe_snapshots import refresh_recipe_snapshots
+from app.search import get_autocomplete
+from app.metrics import timed
+from app.sql_instrumentation import query_budget
+from app.database import use_primary
 
 # --- 新增的輔助函數 ---
+@timed('generate_label_data')
 def _generate_label_data(recipe_obj):
     """
     輔助函數，用於計算並格式化營養標示資料。
     它接受一個 Recipe 物件 (無論是來自資料庫還是臨時建立的)。
     返回一個包含標籤所需文字的字典。
     """
-    # 1. 執行核心計算
-    raw_totals = recipe_obj.calculate_nutrition()
+    # 1. 讀取營養快照；快照過期或是臨時建立的食譜才執行核心計算
+    raw_totals = recipe_obj.nutrition_snapshot() or recipe_obj.calculate_nutrition()
 
     # 2. 確定最終重量和份數
     final_weight = recipe_obj.final_weight_g if recipe_obj.final_weight_g and recipe_obj.final_weight_g > 0 else raw_totals.get('total_weight_g', 0)
     servings_count = recipe_obj.servings_count if recipe_obj.servings_count and recipe_obj.servings_count > 0 else 1
     serving_weight = final_weight / servings_count if servings_count > 0 and final_weight > 0 else 0
 
-    # 3. 計算營養密度
-    density = {}
-    if final_weight > 0:
-        for key, value in raw_totals.items():
-            if isinstance(value, (int, float)) and key != 'total_cost':
-                density[key] = value / final_weight
-    
-    per_serving = {key: val * serving_weight for key, val in density.items()}
-    per_100g = {key: val * 100 for key, val in density.items()}
+    # 3. 由營養素向量一次算出每份與每100公克的數值
+    per_serving_vector, per_100g_vector = label_profiles(
+        [raw_totals[field] for field in NUTRIENT_FIELDS], final_weight, serving_weight
+    )
+    per_serving = totals_as_dict(per_serving_vector)
+    per_100g = totals_as_dict(per_100g_vector)
 
-    # 4. 格式化成分字串 (按重量降序排列)
+    # 4. 格式化成分字串 (按重量降序排列)；子食譜 (複合原料) 在括號內列出其成分
+    _preload_sub_recipes(recipe_obj)
     ingredients_list_sorted = sorted(recipe_obj.ingredients, key=lambda item: item.quantity_g, reverse=True)
-    ingredients_str = "、".join([item.ingredient.food_name for item in ingredients_list_sorted])
+    ingredients_str = "、".join([_component_label(item) for item in ingredients_list_sorted])
 
     # 5. 處理標籤顯示選項
     label_options = recipe_obj.label_options or {}
@@ -88,14 +97,134 @@ def _generate_label_data(recipe_obj):
         'allergens': allergen_text,
         'has_trans_fat_non_art': raw_totals.get('has_trans_fat_non_art', False)
     }
+
+
+def _preload_sub_recipes(recipe_obj):
+    """成分標示會展開每一層子食譜，先以固定次數的查詢載入整個子圖 (含各項目的食材與子食譜)，避免逐項目延遲載入。"""
+    sub_recipe_ids = {item.sub_recipe_id for item in recipe_obj.ingredients if item.sub_recipe_id is not None}
+    if sub_recipe_ids:
+        sub_recipe_ids |= descendant_recipe_ids(sub_recipe_ids)
+        Recipe.query.options(_ITEMS_WITH_COMPONENTS).filter(Recipe.id.in_(sub_recipe_ids)).all()
+
+
+def _component_label(item, depth=0):
+    """成分標示中的一個項目：食材名稱，或「子食譜名稱 (成分、成分...)」。"""
+    if item.sub_recipe_id is None:
+        return item.ingredient.food_name
+    sub_recipe = item.sub_recipe
+    # 循環引用在儲存時已經擋下，深度上限只是保險
+    if depth >= 10 or not sub_recipe.ingredients:
+        return sub_recipe.recipe_name
+    parts = sorted(sub_recipe.ingredients, key=lambda sub_item: sub_item.quantity_g, reverse=True)
+    return f"{sub_recipe.recipe_name} ({'、'.join(_component_label(sub_item, depth + 1) for sub_item in parts)})"
+
+
+def _component_details(recipe, totals):
+    """把子食譜的計算結果換算成與食材相同格式的每 100 公克營養素與成本，供編輯頁即時試算。"""
+    weight = recipe.final_weight_g if recipe.final_weight_g and recipe.final_weight_g > 0 else totals['total_weight_g']
+    factor = 100.0 / weight if weight > 0 else 0.0
+    details = {field: totals[field] * factor for field in NUTRIENT_FIELDS}
+    details['cost_per_unit'] = totals['total_ingredient_cost'] * factor
+    details['unit_name'] = 'g'
+    return details
+
+
+# 編輯頁與標示頁需要所有項目的食材或子食譜，一次載入避免逐項目延遲載入
+_ITEMS_WITH_COMPONENTS = selectinload(Recipe.ingredients).options(
+    joinedload(RecipeItem.ingredient), joinedload(RecipeItem.sub_recipe)
+)
+
+
+def _load_components(items_data, recipe_id=None):
+    """
+    驗證並載入食譜項目，回傳 [(Ingredient 或 None, 子食譜 Recipe 或 None, quantity_g), ...]。
+    每個項目需提供 ingredient_id 或 sub_recipe_id 其中之一；子食譜必須是自己的食譜，
+    且不可造成循環引用 (recipe_id 為正在編輯的食譜)。資料有誤時引發 ValueError。
+    """
+    rows = []
+    for item_data in items_data:
+        quantity_g = float(item_data['quantity_g'])
+        if quantity_g <= 0:
+            continue
+        if item_data.get('sub_recipe_id') is not None:
+            rows.append((None, int(item_data['sub_recipe_id']), quantity_g))
+        else:
+            rows.append((int(item_data['ingredient_id']), None, quantity_g))
+
+    ingredient_ids = {ingredient_id for ingredient_id, _, _ in rows if ingredient_id is not None}
+    sub_recipe_ids = {sub_recipe_id for _, sub_recipe_id, _ in rows if sub_recipe_id is not None}
+    ingredients_by_id = {ing.id: ing for ing in Ingredient.query.filter(Ingredient.id.in_(ingredient_ids))} \
+        if ingredient_ids else {}
+    recipes_by_id = {r.id: r for r in Recipe.query.filter(
+        Recipe.id.in_(sub_recipe_ids), Recipe.user_id == current_user.id
+    )} if sub_recipe_ids else {}
+    if sub_recipe_ids - recipes_by_id.keys():
+        raise ValueError('找不到指定的子食譜')
+    if recipe_id is not None and (recipe_id in sub_recipe_ids or recipe_id in descendant_recipe_ids(sub_recipe_ids)):
+        raise ValueError('子食譜不可直接或間接使用這個食譜本身')
+
+    return [(ingredients_by_id.get(ingredient_id), recipes_by_id.get(sub_recipe_id), quantity_g)
+            for ingredient_id, sub_recipe_id, quantity_g in rows
+            if sub_recipe_id is not None or ingredient_id in ingredients_by_id]
 # --- 輔助函數結束 ---
 
 
 @bp.route('/')
 @login_required
 def index():
-    recipes = Recipe.query.filter_by(author=current_user).order_by(Recipe.updated_at.desc()).all()
-    return render_template('recipes/index.html', title='我的食譜', recipes=recipes)
+    # 列表內容由 list_recipes API 分頁載入，頁面本身不查詢食譜
+    return render_template('recipes/index.html', title='我的食譜')
+
+
+# 食譜列表 API 支援的排序方式
+RECIPE_SORTS = {
+    'updated': KeysetSort('updated', [Recipe.updated_at, Recipe.id], descending=True),
+    'name': KeysetSort('name', [Recipe.recipe_name, Recipe.id]),
+}
+
+
+@bp.route('/api/recipes')
+@use_primary
+@login_required
+@query_budget(15)
+def list_recipes():
+    """
+    以 keyset 分頁列出使用者的食譜，附上快照中的總重、營養素與食材成本。
+    查詢參數：sort (updated|name)、q (名稱篩選)、cursor、limit。
+    快照過期的食譜 (食材或價格已變動) 只重算這一頁中的那幾筆。
+    """
+    try:
+        sort, cursor, limit, q = page_args(RECIPE_SORTS, 'updated')
+        statement = db.select(Recipe).where(Recipe.user_id == current_user.id)
+        if q:
+            statement = statement.where(Recipe.recipe_name.contains(q, autoescape=True))
+        rows, next_cursor = keyset_paginate(statement, sort, cursor, limit)
+    except PaginationError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    recipes = [row.Recipe for row in rows]
+    snapshots = {recipe.id: recipe.nutrition_snapshot() for recipe in recipes}
+    stale = [recipe_id for recipe_id, snapshot in snapshots.items() if snapshot is None]
+    if stale:
+        snapshots.update(refresh_recipe_snapshots(stale))
+    items = []
+    for recipe in recipes:
+        snapshot = snapshots[recipe.id]
+        items.append({
+            'id': recipe.id,
+            'name': recipe.recipe_name,
+            'updated_at': (recipe.updated_at or recipe.created_at).strftime('%Y-%m-%d %H:%M'),
+            'servings_count': recipe.servings_count,
+            'url': url_for('recipes.recipe_detail', recipe_id=recipe.id),
+            'delete_url': url_for('recipes.delete_recipe', recipe_id=recipe.id),
+            'total_weight_g': round(snapshot['total_weight_g'], 1),
+            'total_ingredient_cost': round(snapshot['total_ingredient_cost'], 2),
+            'nutrition': {field: snapshot[field] for field in NUTRIENT_FIELDS},
+        })
+    if stale:
+        # 重算的快照寫回資料庫，下次讀取就不必再計算 (物件在 commit 後失效，因此放在組好回應之後)
+        db.session.commit()
+    return jsonify({'status': 'success', 'items': items, 'next_cursor': next_cursor})
 
 
 @bp.route('/create', methods=['POST'])
@@ -120,6 +249,10 @@ def delete_recipe(recipe_id):
     if linked_product:
         flash(f'無法刪除食譜 "{recipe.recipe_name}"，因為它已被產品 "{linked_product.product_name}" 使用。請先刪除關聯的產品。', 'danger')
         return redirect(url_for('recipes.index'))
+    parent_item = RecipeItem.query.filter_by(sub_recipe_id=recipe.id).first()
+    if parent_item:
+        flash(f'無法刪除食譜 "{recipe.recipe_name}"，因為它是食譜 "{parent_item.recipe.recipe_name}" 的子食譜。', 'danger')
+        return redirect(url_for('recipes.index'))
     
     recipe_name = recipe.recipe_name
     db.session.delete(recipe)
@@ -130,8 +263,9 @@ def delete_recipe(recipe_id):
 
 @bp.route('/<int:recipe_id>')
 @login_required
+@query_budget(12)
 def recipe_detail(recipe_id):
-    recipe = Recipe.query.get_or_404(recipe_id)
+    recipe = Recipe.query.options(_ITEMS_WITH_COMPONENTS).get_or_404(recipe_id)
     if recipe.author != current_user:
         abort(403)
     
@@ -142,7 +276,22 @@ def recipe_detail(recipe_id):
         'final_weight_g': recipe.final_weight_g or '',
         'label_options': recipe.label_options or {}
     }
+    # 子食譜以每 100 公克的營養素與成本呈現，編輯頁即可與食材用同樣的方式試算
+    sub_recipes = [item.sub_recipe for item in recipe.ingredients if item.sub_recipe_id is not None]
+    sub_totals = {sub_recipe.id: sub_recipe.nutrition_snapshot() for sub_recipe in sub_recipes}
+    stale = [sub_recipe for sub_recipe in sub_recipes if sub_totals[sub_recipe.id] is None]
+    if stale:
+        sub_totals.update(calculate_nutrition_bulk(stale))
     for item in recipe.ingredients:
+        if item.sub_recipe_id is not None:
+            initial_state['ingredients'].append({
+                'ingredient_id': None,
+                'sub_recipe_id': item.sub_recipe_id,
+                'ingredient_name': f"{item.sub_recipe.recipe_name} (子食譜)",
+                'quantity_g': item.quantity_g,
+                'details': _component_details(item.sub_recipe, sub_totals[item.sub_recipe_id]),
+            })
+            continue
         initial_state['ingredients'].append({
             'ingredient_id': item.ingredient.id,
             'ingredient_name': item.ingredient.food_name,
@@ -156,13 +305,16 @@ def recipe_detail(recipe_id):
                 'unit_name': item.ingredient.unit_name
             }
         })
+    # 預先載入使用者的自建食材索引，之後的打字搜尋就不必查詢資料庫
+    get_autocomplete().warm_user(current_user.id)
     return render_template('recipes/recipe_detail.html', title=f"編輯食譜: {recipe.recipe_name}", recipe=recipe, initial_state=initial_state)
 
 
 @bp.route('/<int:recipe_id>/label')
 @login_required
+@query_budget(10)
 def recipe_label(recipe_id):
-    recipe = Recipe.query.get_or_404(recipe_id)
+    recipe = Recipe.query.options(_ITEMS_WITH_COMPONENTS).get_or_404(recipe_id)
     if recipe.author != current_user:
         abort(403)
 
@@ -183,6 +335,7 @@ def recipe_label(recipe_id):
 @bp.route('/ingredients', methods=['GET'])
 @login_required
 def manage_ingredients():
+    get_autocomplete().warm_user(current_user.id)
     return render_template('recipes/manage_ingredients.html', title='食材管理')
 
 
@@ -201,7 +354,9 @@ def get_ingredient(ingredient_id):
         'trans_fat_g': ingredient.trans_fat_g, 'carbohydrate_g': ingredient.carbohydrate_g,
         'sugar_g': ingredient.sugar_g, 'sodium_mg': ingredient.sodium_mg,
         'cost_per_unit': ingredient.cost_per_unit,
-        'unit_name': ingredient.unit_name
+        'unit_name': ingredient.unit_name,
+        'density_g_per_ml': ingredient.density_g_per_ml,
+        'piece_weight_g': ingredient.piece_weight_g
     }
     return jsonify({'status': 'success', 'data': ingredient_data})
 
@@ -236,7 +391,11 @@ def update_ingredient(ingredient_id):
     if existing_ingredient: return jsonify({'status': 'error', 'message': f'名稱「{new_name}」已被其他食材使用，請換一個。'}), 400
     form = IngredientForm(data=data)
     if form.validate():
+        conversion = (ingredient.density_g_per_ml, ingredient.piece_weight_g)
         form.populate_obj(ingredient)
+        if (ingredient.density_g_per_ml, ingredient.piece_weight_g) != conversion:
+            # 換算方式改變，所有使用者對此食材的每公克成本彙總都要重新計算
+            refresh_price_aggregates(ingredient_ids={ingredient.id})
         db.session.commit()
         return jsonify({'status': 'success', 'message': '食材已成功更新！', 'ingredient': {'id': ingredient.id, 'name': ingredient.food_name}})
     else:
@@ -249,6 +408,8 @@ def delete_ingredient_api(ingredient_id):
     ingredient = Ingredient.query.get_or_404(ingredient_id)
     if ingredient.creator != current_user: return jsonify({'status': 'error', 'message': '權限不足'}), 403
     ingredient_name = ingredient.food_name
+    # 價格紀錄會隨食材一併刪除，最新價格對照表也要同步清除
+    IngredientLatestPrice.query.filter_by(ingredient_id=ingredient.id).delete()
     db.session.delete(ingredient)
     db.session.commit()
     return jsonify({'status': 'success', 'message': f'食材「{ingredient_name}」已成功刪除。'})
@@ -256,29 +417,29 @@ def delete_ingredient_api(ingredient_id):
 
 @bp.route('/api/search_ingredients')
 @login_required
+@query_budget(4)
 def search_ingredients():
     query = request.args.get('q', '', type=str)
     source_filter = request.args.get('source', 'ALL', type=str)
-    base_query = Ingredient.query
-    if source_filter == 'USER':
-        base_query = base_query.filter(Ingredient.creator == current_user)
-    elif source_filter == 'TFDA':
-        base_query = base_query.filter_by(source='TFDA')
-    if query:
-        search = f"%{query}%"
-        base_query = base_query.filter(Ingredient.food_name.like(search))
-    ingredients = base_query.order_by(Ingredient.food_name).limit(20).all()
-    results = [{'id': ing.id, 'name': ing.food_name,
-                'calories_kcal': ing.calories_kcal, 'protein_g': ing.protein_g,
-                'fat_g': ing.fat_g, 'carbohydrate_g': ing.carbohydrate_g,
-                'saturated_fat_g': ing.saturated_fat_g, 'trans_fat_g': ing.trans_fat_g,
-                'sugar_g': ing.sugar_g, 'sodium_mg': ing.sodium_mg,
-                'cost_per_unit': ing.cost_per_unit,
-                'unit_name': ing.unit_name
-                } for ing in ingredients]
+    # 結果 (含營養素欄位) 完全由記憶體內的自動完成服務提供，不查詢資料庫
+    results = get_autocomplete().search(query, current_user.id, source_filter, limit=20)
     return jsonify(results)
 
 
+@bp.route('/api/recipe/<int:recipe_id>/component')
+@login_required
+def get_recipe_component(recipe_id):
+    """把食譜當作子食譜使用時需要的資料 (每 100 公克的營養素與成本)。"""
+    recipe = Recipe.query.get_or_404(recipe_id)
+    if recipe.author != current_user:
+        return jsonify({'status': 'error', 'message': '權限不足'}), 403
+    return jsonify({'status': 'success', 'data': {
+        'id': recipe.id,
+        'name': recipe.recipe_name,
+        'details': _component_details(recipe, recipe.nutrition_snapshot() or recipe.calculate_nutrition()),
+    }})
+
+
 @bp.route('/api/recipe/<int:recipe_id>/save', methods=['POST'])
 @login_required
 def save_recipe(recipe_id):
@@ -295,14 +456,23 @@ def save_recipe(recipe_id):
     except (ValueError, TypeError):
         recipe.final_weight_g = None
     recipe.label_options = data.get('label_options', {})
-    
+
+    try:
+        components = _load_components(data.get('ingredients', []), recipe_id=recipe.id)
+    except (KeyError, ValueError, TypeError) as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e) if isinstance(e, ValueError) else '食譜項目格式錯誤'}), 400
+
     RecipeItem.query.filter_by(recipe_id=recipe.id).delete()
-    for item_data in data.get('ingredients', []):
-        ingredient = Ingredient.query.get(item_data['ingredient_id'])
-        if ingredient and float(item_data['quantity_g']) > 0:
-            recipe_item = RecipeItem(recipe_id=recipe.id, ingredient_id=ingredient.id, quantity_g=float(item_data['quantity_g']))
-            db.session.add(recipe_item)
-            
+    for ingredient, sub_recipe, quantity_g in components:
+        recipe_item = RecipeItem(
+            recipe_id=recipe.id,
+            ingredient_id=ingredient.id if ingredient else None,
+            sub_recipe_id=sub_recipe.id if sub_recipe else None,
+            quantity_g=quantity_g
+        )
+        db.session.add(recipe_item)
+
     db.session.commit()
     return jsonify({'status': 'success', 'message': '食譜已成功儲存！'})
 
@@ -315,23 +485,32 @@ def preview_label():
         return jsonify({'status': 'error', 'message': '請求資料不完整'}), 400
 
     try:
-        final_weight_str = data.get('final_weight_g')
-        final_weight_val = float(final_weight_str) if final_weight_str else None
+        try:
+            final_weight_str = data.get('final_weight_g')
+            final_weight_val = float(final_weight_str) if final_weight_str else None
+            servings_count = int(data.get('servings_count', 1))
+        except (ValueError, TypeError):
+            return jsonify({'status': 'error', 'message': '成品重量與份數必須是數字'}), 400
 
         # 建立一個臨時的、僅存在於記憶體中的 Recipe 物件用於計算
         temp_recipe = Recipe(
             recipe_name=data.get('recipe_name', '預覽食譜'),
             final_weight_g=final_weight_val,
-            servings_count=int(data.get('servings_count', 1)),
+            servings_count=servings_count,
             label_options=data.get('label_options', {})
         )
         
-        # 填充臨時的食材項目
-        for item_data in data.get('ingredients', []):
-            ingredient = Ingredient.query.get(item_data['ingredient_id'])
-            if ingredient and float(item_data['quantity_g']) > 0:
-                temp_recipe_item = RecipeItem(ingredient=ingredient, quantity_g=float(item_data['quantity_g']))
-                temp_recipe.ingredients.append(temp_recipe_item)
+        # 填充臨時的食材與子食譜項目 (各以一次查詢載入)；格式錯誤的項目 (缺少欄位、不是數字) 回傳 400
+        try:
+            components = _load_components(data.get('ingredients', []))
+        except (KeyError, ValueError, TypeError) as e:
+            return jsonify({'status': 'error', 'message': str(e) if isinstance(e, ValueError) else '食譜項目格式錯誤'}), 400
+        for ingredient, sub_recipe, quantity_g in components:
+            if sub_recipe is not None:
+                temp_recipe_item = RecipeItem(sub_recipe=sub_recipe, sub_recipe_id=sub_recipe.id, quantity_g=quantity_g)
+            else:
+                temp_recipe_item = RecipeItem(ingredient=ingredient, quantity_g=quantity_g)
+            temp_recipe.ingredients.append(temp_recipe_item)
         
         # 使用重構後的輔助函數來產生標籤資料
         label_data = _generate_label_data(temp_recipe)
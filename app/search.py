@@ -0,0 +1,372 @@
+# app/search.py
+# --- 食材名稱自動完成服務 ---
+# 新增價格頁與食譜編輯頁會在使用者打字時每隔數百毫秒呼叫搜尋 API，
+# 因此搜尋完全在記憶體中完成，不必查詢資料庫：
+#   1. TFDA 食材：app 啟動時載入一次、建好後不再修改的名稱索引 (前綴排序表 + n-gram 反向索引)
+#   2. 使用者自建食材：每位使用者一份小型索引 (overlay)，由 ORM 寫入事件同步
+#   3. 查詢結果：以 (user, q, source) 為鍵的短效快取，相同的查詢同時進來時只計算一次
+# 中文名稱沒有空白斷詞，因此 n-gram 以單字 (unigram) 與雙字 (bigram) 為單位。
+# 索引存在各行程自己的記憶體中：提交食材異動的行程會更新共用的 AUTOCOMPLETE_STAMP (見 app.cache_stamps)，
+# 其他行程在查詢時發現標記改變，就捨棄所有 overlay 與查詢結果 (TFDA 食材只由匯入程式更新，索引不受影響)。
+import heapq
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.cache_stamps import GenerationStamp
+from app.metrics import timed
+
+# 搜尋結果中回傳給前端的食材欄位
+PAYLOAD_FIELDS = (
+    'calories_kcal', 'protein_g', 'fat_g', 'carbohydrate_g',
+    'saturated_fat_g', 'trans_fat_g', 'sugar_g', 'sodium_mg',
+    'cost_per_unit', 'unit_name'
+)
+
+
+def _grams(text):
+    """回傳字串的所有 unigram 與 bigram。"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _entry_from(obj):
+    """由 Ingredient 物件 (或同欄位的查詢結果列) 建立索引項目。"""
+    payload = {'id': obj.id, 'name': obj.food_name}
+    payload.update((field, getattr(obj, field)) for field in PAYLOAD_FIELDS)
+    return {'id': obj.id, 'name': obj.food_name, 'source': obj.source,
+            'user_id': obj.user_id, 'payload': payload}
+
+
+class _NameIndex:
+    """
+    建好後即不再修改的名稱索引，可在不加鎖的情況下同時被多個執行緒讀取。
+    內含依名稱排序的前綴表 (以 bisect 找前綴) 與 n-gram 反向索引 (找中間的子字串)。
+    """
+
+    def __init__(self, entries):
+        self.entries = {entry['id']: entry for entry in entries}
+        self._lower = {entry_id: (entry['name'] or '').lower() for entry_id, entry in self.entries.items()}
+        self._sorted = sorted((name_lower, entry_id) for entry_id, name_lower in self._lower.items())
+        self._postings = defaultdict(set)
+        for entry_id, name_lower in self._lower.items():
+            for gram in _grams(name_lower):
+                self._postings[gram].add(entry_id)
+
+    def with_changes(self, upserts, deletes):
+        """回傳套用異動後的新索引 (原索引不變)。"""
+        entries = dict(self.entries)
+        for entry_id in deletes:
+            entries.pop(entry_id, None)
+        for entry in upserts:
+            entries[entry['id']] = entry
+        return _NameIndex(entries.values())
+
+    def _prefix_ids(self, query):
+        for position in range(bisect_left(self._sorted, (query,)), len(self._sorted)):
+            name_lower, entry_id = self._sorted[position]
+            if not name_lower.startswith(query):
+                break
+            yield entry_id
+
+    def ranked(self, query, limit):
+        """
+        回傳 [(排序鍵, 項目), ...]，最多 limit 筆。
+        排序依序為：是否為前綴、出現位置、名稱長度、名稱；空字串則依名稱排序。
+        """
+        if not query:
+            return heapq.nsmallest(limit, (((entry['name'],), entry) for entry in self.entries.values()),
+                                   key=lambda pair: pair[0])
+
+        prefix_ids = list(self._prefix_ids(query))
+        if len(prefix_ids) >= limit:
+            # 前綴相符一定排在最前面，足夠時不必再找中間相符的項目
+            candidate_ids = prefix_ids
+        elif len(query) == 1:
+            candidate_ids = self._postings.get(query, ())
+        else:
+            postings = sorted((self._postings.get(query[i:i + 2], set()) for i in range(len(query) - 1)), key=len)
+            candidate_ids = set.intersection(*postings) if postings[0] else ()
+
+        ranked = []
+        for entry_id in candidate_ids:
+            position = self._lower[entry_id].find(query)
+            if position < 0:
+                continue
+            entry = self.entries[entry_id]
+            ranked.append(((position != 0, position, len(entry['name']), entry['name']), entry))
+        return heapq.nsmallest(limit, ranked, key=lambda pair: pair[0])
+
+
+class AutocompleteService:
+    """
+    食材名稱自動完成服務。
+    TFDA 匯入程式 (獨立行程、直接寫入 SQLite) 完成後會更新 TFDA_IMPORT_STAMP 檔案，
+    服務發現檔案時間改變時會重新載入 TFDA 索引；shared_stamp_path 改變時 (其他行程提交了食材異動)
+    則捨棄所有使用者的 overlay 與查詢結果。
+    """
+
+    def __init__(self, stamp_path=None, cache_ttl=30.0, cache_size=2048, max_overlays=1024, shared_stamp_path=None):
+        self.stamp_path = stamp_path
+        self.shared_stamp = GenerationStamp(shared_stamp_path)
+        self._shared_generation = self.shared_stamp.read()
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.max_overlays = max_overlays
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._base = None
+        self._base_stamp = None
+        self._base_generation = 0
+        self._overlays = OrderedDict()        # user_id -> _NameIndex
+        self._user_generations = defaultdict(int)
+        self._cache = OrderedDict()           # key -> (expires_at, results)
+        self._inflight = {}                   # key -> Future
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+    # --- 載入 ---
+
+    def _read_stamp(self):
+        if not self.stamp_path:
+            return None
+        try:
+            return os.path.getmtime(self.stamp_path)
+        except OSError:
+            return None
+
+    def load_base(self):
+        """從資料庫載入 TFDA 食材，建立共用的唯讀索引。"""
+        from app import db
+        from app.models import Ingredient
+        stamp = self._read_stamp()
+        rows = db.session.query(
+            Ingredient.id, Ingredient.food_name, Ingredient.source, Ingredient.user_id,
+            *(getattr(Ingredient, field) for field in PAYLOAD_FIELDS)
+        ).filter(Ingredient.source == 'TFDA').all()
+        base = _NameIndex(_entry_from(row) for row in rows)
+        with self._lock:
+            self._base = base
+            self._base_stamp = stamp
+            self._base_generation += 1
+
+    def warm(self):
+        """app 啟動時預先載入 TFDA 索引；資料表尚未建立時 (例如執行 migration 前) 留待第一次搜尋再載入。"""
+        from app import db
+        try:
+            self.load_base()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Autocomplete index not preloaded: {getattr(e, 'orig', None) or e}")
+
+    def _check_shared_stamp(self):
+        """其他行程提交過食材異動時，捨棄所有 overlay 與查詢結果 (下次使用時重新載入)。"""
+        generation = self.shared_stamp.read()
+        if generation == self._shared_generation:
+            return
+        with self._lock:
+            if generation == self._shared_generation:
+                return
+            self._shared_generation = generation
+            self._discard_all_locked()
+
+    def _discard_all_locked(self):
+        self._overlays.clear()
+        self._cache.clear()
+
+    def publish(self):
+        """通知其他行程捨棄 overlay (本行程已由 apply_changes 同步，commit 後呼叫)。"""
+        if not self.shared_stamp.path:
+            return
+        with self._lock:
+            if self.shared_stamp.read() != self._shared_generation:
+                # 其他行程也更新過，先捨棄自己的 overlay，避免蓋掉對方的通知
+                self._discard_all_locked()
+            self._shared_generation = self.shared_stamp.touch()
+
+    def _ensure_base(self):
+        if self._base is not None and self._read_stamp() == self._base_stamp:
+            return self._base
+        with self._load_lock:
+            if self._base is None or self._read_stamp() != self._base_stamp:
+                self.load_base()
+        return self._base
+
+    def _load_overlay(self, user_id):
+        from app import db
+        from app.models import Ingredient
+        rows = db.session.query(
+            Ingredient.id, Ingredient.food_name, Ingredient.source, Ingredient.user_id,
+            *(getattr(Ingredient, field) for field in PAYLOAD_FIELDS)
+        ).filter(Ingredient.user_id == user_id).all()
+        return _NameIndex(_entry_from(row) for row in rows)
+
+    def _ensure_overlay(self, user_id):
+        with self._lock:
+            overlay = self._overlays.get(user_id)
+            if overlay is not None:
+                self._overlays.move_to_end(user_id)
+                return overlay
+            generation = self._shared_generation
+        overlay = self._load_overlay(user_id)
+        with self._lock:
+            if generation != self._shared_generation:
+                # 載入期間其他行程提交了異動，這份 overlay 可能是舊資料，只用於這次查詢
+                return overlay
+            overlay = self._overlays.setdefault(user_id, overlay)
+            while len(self._overlays) > self.max_overlays:
+                self._overlays.popitem(last=False)
+        return overlay
+
+    def warm_user(self, user_id):
+        """預先載入使用者的 overlay，讓之後的打字搜尋完全不必查詢資料庫。"""
+        self._check_shared_stamp()
+        self._ensure_overlay(user_id)
+
+    # --- 同步 ---
+
+    def apply_changes(self, upserts, deletes):
+        """套用已提交的食材異動 (upserts 為索引項目，deletes 為 (id, source, user_id))。"""
+        with self._lock:
+            touched_users = {entry['user_id'] for entry in upserts} | {user_id for _, _, user_id in deletes}
+            for user_id in touched_users:
+                if user_id is None:
+                    continue
+                self._user_generations[user_id] += 1
+                overlay = self._overlays.get(user_id)
+                if overlay is not None:
+                    self._overlays[user_id] = overlay.with_changes(
+                        [entry for entry in upserts if entry['user_id'] == user_id],
+                        [entry_id for entry_id, _, owner in deletes if owner == user_id]
+                    )
+
+            # 食材改名或改變來源時，也要從原本所在的索引移除
+            tfda_upserts = [entry for entry in upserts if entry['source'] == 'TFDA']
+            tfda_deletes = [entry_id for entry_id, source, _ in deletes if source == 'TFDA']
+            tfda_deletes += [entry['id'] for entry in upserts if entry['source'] != 'TFDA']
+            if self._base is not None and (tfda_upserts or any(i in self._base.entries for i in tfda_deletes)):
+                self._base = self._base.with_changes(tfda_upserts, tfda_deletes)
+                self._base_generation += 1
+
+    # --- 查詢 ---
+
+    @timed('ingredient_search')
+    def search(self, query, user_id, source='ALL', limit=20):
+        """
+        搜尋可見的食材，回傳依相關性排序的結果 (含營養素欄位的字典)。
+        source 為 'USER' (僅自己的食材)、'TFDA' 或 'ALL' (自己的食材加上 TFDA)。
+        """
+        query = (query or '').strip().lower()
+        self._check_shared_stamp()
+        base = self._ensure_base() if source != 'USER' else None
+        overlay = self._ensure_overlay(user_id) if source != 'TFDA' else None
+
+        with self._lock:
+            key = (user_id, query, source, limit, self._base_generation, self._user_generations[user_id],
+                   self._shared_generation)
+        return self._cached(key, lambda: self._search(base, overlay, query, limit))
+
+    def _search(self, base, overlay, query, limit):
+        ranked = []
+        for index in (base, overlay):
+            if index is not None:
+                ranked.extend(index.ranked(query, limit))
+        return [entry['payload'] for _, entry in heapq.nsmallest(limit, ranked, key=lambda pair: pair[0])]
+
+    def _cached(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached[1]
+            future = self._inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._inflight[key] = Future()
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        # 相同查詢正在計算中，直接等待它的結果
+        if not is_owner:
+            return future.result()
+
+        try:
+            results = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(results)
+            with self._lock:
+                self._cache[key] = (time.monotonic() + self.cache_ttl, results)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return results
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # --- Flask 整合 ---
+
+    def init_app(self, app):
+        app.extensions['autocomplete'] = self
+
+
+def get_autocomplete():
+    """取得目前應用程式的自動完成服務。"""
+    return current_app.extensions['autocomplete']
+
+
+# --- ORM 事件：在交易提交後同步索引 ---
+
+@event.listens_for(Session, 'after_flush')
+def _collect_ingredient_changes(session, flush_context):
+    from app.models import Ingredient
+    changes = session.info.setdefault('autocomplete_changes', {'upserts': {}, 'deletes': {}})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Ingredient):
+            changes['upserts'][obj.id] = _entry_from(obj)
+            changes['deletes'].pop(obj.id, None)
+    for obj in session.deleted:
+        if isinstance(obj, Ingredient):
+            changes['upserts'].pop(obj.id, None)
+            changes['deletes'][obj.id] = (obj.id, obj.source, obj.user_id)
+
+
+def record_bulk_upserts(session, rows):
+    """
+    批次 INSERT (Core) 不會經過 ORM flush 事件，由呼叫端把新增的食材列登記到同一份異動中，
+    commit 後與一般寫入一起套用到索引。rows 需包含 id、food_name、source、user_id 與 PAYLOAD_FIELDS。
+    """
+    changes = session.info.setdefault('autocomplete_changes', {'upserts': {}, 'deletes': {}})
+    for row in rows:
+        changes['upserts'][row.id] = _entry_from(row)
+        changes['deletes'].pop(row.id, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_ingredient_changes(session):
+    changes = session.info.pop('autocomplete_changes', None)
+    if not changes or not has_app_context():
+        return
+    service = current_app.extensions.get('autocomplete')
+    if service is not None:
+        service.apply_changes(list(changes['upserts'].values()), list(changes['deletes'].values()))
+        service.publish()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_ingredient_changes(session):
+    session.info.pop('autocomplete_changes', None)
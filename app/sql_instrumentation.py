@@ -0,0 +1,168 @@
+# app/sql_instrumentation.py
+# --- 每個請求的 SQL 統計與 N+1 偵測 ---
+# 在所有引擎 (主資料庫與讀取連線) 掛上 before/after_cursor_execute 事件，記錄每個請求的：
+#   - 查詢次數與資料庫總耗時
+#   - 查詢「形狀」(去掉參數與 IN 清單長度後的 SQL) 的出現次數；同一形狀重複 SQL_REPEAT_THRESHOLD 次以上
+#     通常代表在迴圈中逐筆查詢 (N+1)，例如逐項目查價格、在模板中延遲載入關聯
+# 請求結束時彙總到所屬的端點 (blueprint.view)，供監控使用；查詢次數超過預算時記錄警告，
+# 開啟 SQL_STRICT_QUERY_BUDGET (測試用) 時改為引發 QueryBudgetExceeded。
+# 端點預算預設為 SQL_QUERY_BUDGET，個別端點可用 @query_budget(n) 或 SQL_QUERY_BUDGETS 設定。
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+# 摘要中列出的重複查詢形狀數
+TOP_SHAPES = 3
+
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+|\$\d+))*\s*\)')
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """嚴格模式下端點的查詢次數超過預算時引發。"""
+
+
+def query_budget(limit):
+    """設定單一端點的查詢次數預算 (裝飾 view 函式)。"""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def statement_shape(statement):
+    """把 SQL 正規化成「形狀」：參數、數字與字串常數以 ? 代替，IN 清單不論長短都視為相同。"""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+class RequestQueryStats:
+    """單一請求的查詢統計。"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """出現至少 threshold 次的查詢形狀 [(形狀, 次數), ...]，依次數排序。"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class SqlInstrumentation:
+    """SQL 統計服務：記錄每個請求的查詢，並依端點彙總。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def init_app(self, app, db):
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+                event.listen(engine, 'handle_error', self._handle_error)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['sql_instrumentation'] = self
+
+    # --- 引擎事件 ---
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start_time'].pop()
+        stats = g.get('sql_stats') if has_request_context() else None
+        if stats is not None:
+            stats.record(statement, duration)
+
+    @staticmethod
+    def _handle_error(exception_context):
+        # 執行失敗的查詢不會觸發 after_cursor_execute，在這裡移除它的開始時間，避免堆疊錯位或持續增長
+        # (cursor 尚未建立時表示錯誤發生在執行之前，開始時間還沒記錄)
+        conn, context = exception_context.connection, exception_context.execution_context
+        if conn is None or getattr(context, 'cursor', None) is None:
+            return
+        start_times = conn.info.get('query_start_time')
+        if start_times:
+            start_times.pop()
+
+    # --- 請求 ---
+
+    @staticmethod
+    def _start_request():
+        g.sql_stats = RequestQueryStats()
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None or request.endpoint is None:
+            return response
+        config = current_app.config
+        repeated = stats.repeated(config['SQL_REPEAT_THRESHOLD'])
+        self._aggregate(request.endpoint, stats, bool(repeated))
+
+        if config['SQL_SERVER_TIMING']:
+            response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} SQL"')
+        if repeated:
+            current_app.logger.warning(
+                '%s 疑似 N+1 查詢：%s', request.endpoint,
+                '；'.join(f'{count} 次 {shape[:200]}' for shape, count in repeated[:TOP_SHAPES])
+            )
+
+        budget = self.budget_for(request.endpoint)
+        if budget is not None and stats.count > budget:
+            message = (f'{request.endpoint} 執行了 {stats.count} 次查詢，超過預算 {budget} 次 '
+                       f'(資料庫耗時 {stats.duration * 1000:.1f} ms)')
+            if config['SQL_STRICT_QUERY_BUDGET']:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
+
+    @staticmethod
+    def budget_for(endpoint):
+        """端點的查詢預算：@query_budget 優先，其次為 SQL_QUERY_BUDGETS，再來是 SQL_QUERY_BUDGET；None 表示不限制。"""
+        view = current_app.view_functions.get(endpoint)
+        if view is not None and getattr(view, 'query_budget', None) is not None:
+            return view.query_budget
+        config = current_app.config
+        return config['SQL_QUERY_BUDGETS'].get(endpoint, config['SQL_QUERY_BUDGET'])
+
+    def _aggregate(self, endpoint, stats, suspected_n_plus_one):
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'db_time': 0.0, 'max_queries': 0, 'n_plus_one_requests': 0,
+            })
+            entry['requests'] += 1
+            entry['queries'] += stats.count
+            entry['db_time'] += stats.duration
+            entry['max_queries'] = max(entry['max_queries'], stats.count)
+            entry['n_plus_one_requests'] += suspected_n_plus_one
+
+    def snapshot(self):
+        """回傳 {端點: 累計統計} 的複本 (供監控使用)。"""
+        with self._lock:
+            return {endpoint: dict(entry) for endpoint, entry in self._endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+def get_sql_instrumentation():
+    return current_app.extensions.get('sql_instrumentation')
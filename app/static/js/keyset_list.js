@@ -0,0 +1,119 @@
+// app/static/js/keyset_list.js
+// 分頁列表 API (食譜、產品、價格) 的共用載入器：
+// 先載入第一頁，捲動到列表底部 (或點擊「載入更多」) 時再以 next_cursor 載入下一頁。
+// 搜尋或變更排序時呼叫 reset()，尚未回應的舊請求結果會被捨棄。
+
+class KeysetList {
+    /**
+     * @param {Object} options
+     * @param {string} options.url           列表 API 網址
+     * @param {HTMLElement} options.container 放置資料列的元素
+     * @param {Function} options.renderItem  item => HTMLElement
+     * @param {string|Function} [options.emptyHtml] 沒有任何資料時顯示的內容 (函式會收到目前的查詢參數)
+     * @param {Object} [options.params]      固定附加的查詢參數
+     * @param {HTMLElement} [options.footerAfter] 「載入更多」區塊放在此元素之後 (預設為 container；表格請傳入 table)
+     */
+    constructor({ url, container, renderItem, emptyHtml = '', params = {}, footerAfter = null }) {
+        this.url = url;
+        this.container = container;
+        this.renderItem = renderItem;
+        this.emptyHtml = emptyHtml;
+        this.params = params;
+        this.cursor = null;
+        this.done = false;
+        this.loading = false;
+        this.requestId = 0;
+        this.itemCount = 0;
+
+        // 列表底部的「載入更多」區塊；進入畫面時自動載入下一頁
+        this.footer = document.createElement('div');
+        this.footer.className = 'text-center p-2';
+        this.footer.innerHTML = '<button type="button" class="btn btn-sm btn-outline-secondary">載入更多</button>';
+        this.footer.querySelector('button').addEventListener('click', () => this.loadMore());
+        (footerAfter || this.container).after(this.footer);
+
+        if ('IntersectionObserver' in window) {
+            this.observer = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) this.loadMore();
+            });
+            this.observer.observe(this.footer);
+        }
+    }
+
+    reset(params = {}) {
+        this.params = { ...this.params, ...params };
+        this.cursor = null;
+        this.done = false;
+        this.loading = false;
+        this.itemCount = 0;
+        this.requestId += 1;
+        this.container.innerHTML = '';
+        return this.loadMore();
+    }
+
+    async loadMore() {
+        if (this.loading || this.done) return;
+        this.loading = true;
+        const requestId = this.requestId;
+        this.setFooter('<span class="spinner-border spinner-border-sm text-secondary" role="status"></span>');
+
+        const query = new URLSearchParams();
+        Object.entries(this.params).forEach(([key, value]) => {
+            if (value !== null && value !== undefined && value !== '') query.set(key, value);
+        });
+        if (this.cursor) query.set('cursor', this.cursor);
+
+        try {
+            const response = await fetch(`${this.url}?${query.toString()}`);
+            const data = await response.json();
+            if (requestId !== this.requestId) return; // 已被 reset() 取代
+            if (!response.ok || data.status !== 'success') throw new Error(data.message || `HTTP ${response.status}`);
+
+            data.items.forEach(item => this.container.appendChild(this.renderItem(item)));
+            this.itemCount += data.items.length;
+            this.cursor = data.next_cursor;
+            this.done = !data.next_cursor;
+        } catch (error) {
+            if (requestId !== this.requestId) return;
+            console.error('載入列表失敗:', error);
+            this.loading = false;
+            this.setFooter('<span class="text-danger me-2">載入失敗</span><button type="button" class="btn btn-sm btn-outline-secondary">重試</button>');
+            this.footer.querySelector('button').addEventListener('click', () => this.loadMore());
+            return;
+        }
+
+        this.loading = false;
+        if (this.done) {
+            const emptyHtml = typeof this.emptyHtml === 'function' ? this.emptyHtml(this.params) : this.emptyHtml;
+            this.setFooter(this.itemCount === 0 ? emptyHtml : '');
+        } else {
+            this.setFooter('<button type="button" class="btn btn-sm btn-outline-secondary">載入更多</button>');
+            this.footer.querySelector('button').addEventListener('click', () => this.loadMore());
+            // 這一頁不足以填滿畫面時底部仍在畫面中，觀察器不會再次觸發；
+            // 重新觀察會立即回報目前的狀態，必要時接著載入下一頁
+            if (this.observer) {
+                this.observer.unobserve(this.footer);
+                this.observer.observe(this.footer);
+            }
+        }
+    }
+
+    setFooter(html) {
+        this.footer.innerHTML = html;
+    }
+}
+
+// 搜尋框輸入時延遲呼叫，避免每個按鍵都發出請求
+function debounce(fn, wait = 250) {
+    let timer = null;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), wait);
+    };
+}
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value === null || value === undefined ? '' : String(value);
+    return div.innerHTML;
+}
@@ -23,6 +23,20 @@ document.addEventListener('DOMContentLoaded', function() {
                 <div class="invalid-feedback" id="error-unit_name"></div>
             </div>
         </div>
+        <div class="row mb-3 form-row-compact">
+            <label for="density_g_per_ml" class="col-sm-4 col-form-label">密度 (g/ml):</label>
+            <div class="col-sm-8">
+                <input type="number" id="density_g_per_ml" name="density_g_per_ml" class="form-control" min="0.01" step="0.001" placeholder="以「ml」「杯」等單位購買時填寫">
+                <div class="invalid-feedback" id="error-density_g_per_ml"></div>
+            </div>
+        </div>
+        <div class="row mb-3 form-row-compact">
+            <label for="piece_weight_g" class="col-sm-4 col-form-label">每件重量 (g):</label>
+            <div class="col-sm-8">
+                <input type="number" id="piece_weight_g" name="piece_weight_g" class="form-control" min="0.01" step="0.01" placeholder="以「個」「包」等單位購買時填寫">
+                <div class="invalid-feedback" id="error-piece_weight_g"></div>
+            </div>
+        </div>
         <div class="row mb-3 form-row-compact">
             <label for="calories_kcal" class="col-sm-4 col-form-label">熱量 (大卡/100g):</label>
             <div class="col-sm-8">
@@ -166,6 +180,8 @@ document.addEventListener('DOMContentLoaded', function() {
             food_name: document.getElementById('food_name').value,
             cost_per_unit: document.getElementById('cost_per_unit').value,
             unit_name: document.getElementById('unit_name').value,
+            density_g_per_ml: document.getElementById('density_g_per_ml').value,
+            piece_weight_g: document.getElementById('piece_weight_g').value,
             calories_kcal: document.getElementById('calories_kcal').value,
             protein_g: document.getElementById('protein_g').value,
             fat_g: document.getElementById('fat_g').value,
@@ -216,6 +232,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     document.getElementById('food_name').value = data.food_name;
                     document.getElementById('cost_per_unit').value = data.cost_per_unit;
                     document.getElementById('unit_name').value = data.unit_name;
+                    document.getElementById('density_g_per_ml').value = data.density_g_per_ml ?? '';
+                    document.getElementById('piece_weight_g').value = data.piece_weight_g ?? '';
                     document.getElementById('calories_kcal').value = data.calories_kcal;
                     document.getElementById('protein_g').value = data.protein_g;
                     document.getElementById('fat_g').value = data.fat_g;
@@ -0,0 +1,128 @@
+// app/static/js/pricing_index.js
+// 食材價格列表：每項食材一列，透過 /pricing/api/prices 分頁載入；
+// 點擊「紀錄」時才向 API 分頁載入該食材的價格紀錄，顯示在食材列下方
+
+document.addEventListener('DOMContentLoaded', function() {
+    const table = document.getElementById('price-summary-table');
+    const tbody = document.getElementById('price-summary-body');
+    const searchBox = document.getElementById('price-search-box');
+    const sortSelect = document.getElementById('price-sort');
+    const columnCount = table.querySelectorAll('thead th').length;
+
+    function formatNumber(value, digits) {
+        return Number(value).toFixed(digits);
+    }
+
+    function formatCost(value) {
+        return value === null ? '-' : formatNumber(value, 3);
+    }
+
+    const unconvertibleHtml = '<span class="text-muted" title="請在食材管理中設定密度或每件重量">無法換算</span>';
+
+    function renderSummary(summary) {
+        const row = document.createElement('tr');
+        row.innerHTML = `
+            <td>${escapeHtml(summary.food_name)}</td>
+            <td>
+                NT$ ${formatNumber(summary.latest_price, 2)} / ${formatNumber(summary.latest_quantity, 3)} ${escapeHtml(summary.latest_unit)}
+                <small class="text-muted">(${escapeHtml(summary.latest_source)})</small>
+            </td>
+            <td>${escapeHtml(summary.latest_purchase_date)}</td>
+            <td class="text-end">${summary.latest_cost_per_gram === null ? unconvertibleHtml : formatNumber(summary.latest_cost_per_gram, 3)}</td>
+            <td class="text-end">${formatCost(summary.min_cost_per_gram)}</td>
+            <td class="text-end">${formatCost(summary.avg_cost_per_gram)}</td>
+            <td class="text-end">
+                ${summary.record_count}
+                ${summary.recent_count !== summary.record_count ? `<small class="text-muted">(近期 ${summary.recent_count})</small>` : ''}
+            </td>
+            <td class="text-nowrap">
+                <button type="button" class="btn btn-sm btn-outline-secondary me-2 toggle-history-btn">
+                    <i class="bi bi-clock-history me-1"></i>紀錄
+                </button>
+                <a href="${summary.add_url}" class="btn btn-sm btn-outline-success">
+                    <i class="bi bi-plus-lg me-1"></i>新增
+                </a>
+            </td>`;
+        row.querySelector('.toggle-history-btn').addEventListener('click', () => toggleHistory(row, summary.history_url));
+        return row;
+    }
+
+    function renderRecord(record) {
+        const row = document.createElement('tr');
+        row.innerHTML = `
+            <td>${escapeHtml(record.purchase_date)}</td>
+            <td>${escapeHtml(record.source)}</td>
+            <td class="text-end">${formatNumber(record.price, 2)}</td>
+            <td class="text-end">${formatNumber(record.quantity, 3)}</td>
+            <td>${escapeHtml(record.unit)}</td>
+            <td class="text-end">${record.cost_per_gram === null ? unconvertibleHtml : formatNumber(record.cost_per_gram, 3)}</td>
+            <td class="text-nowrap">
+                <a href="${record.edit_url}" class="btn btn-sm btn-outline-primary me-2">
+                    <i class="bi bi-pencil me-1"></i>編輯
+                </a>
+                <form action="${record.delete_url}" method="post" onsubmit="return confirm('確定要刪除這筆價格紀錄嗎？');" class="d-inline">
+                    <button type="submit" class="btn btn-sm btn-outline-danger">
+                        <i class="bi bi-trash me-1"></i>刪除
+                    </button>
+                </form>
+            </td>`;
+        return row;
+    }
+
+    function toggleHistory(summaryRow, historyUrl) {
+        const detailRow = summaryRow.nextElementSibling;
+        // 已展開時再點一次即收合 (已載入的內容保留，不重複請求)
+        if (detailRow && detailRow.classList.contains('price-history-row')) {
+            detailRow.classList.toggle('d-none');
+            return;
+        }
+
+        const newRow = document.createElement('tr');
+        newRow.className = 'price-history-row';
+        newRow.innerHTML = `
+            <td colspan="${columnCount}" class="bg-light">
+                <table class="table table-sm table-striped mb-0">
+                    <thead>
+                        <tr>
+                            <th>購買日期</th>
+                            <th>來源</th>
+                            <th class="text-end">購買價格 (NT$)</th>
+                            <th class="text-end">購買數量</th>
+                            <th>單位</th>
+                            <th class="text-end">每公克成本 (NT$/g)</th>
+                            <th>操作</th>
+                        </tr>
+                    </thead>
+                    <tbody></tbody>
+                </table>
+            </td>`;
+        summaryRow.after(newRow);
+
+        const historyTable = newRow.querySelector('table');
+        new KeysetList({
+            url: historyUrl,
+            container: historyTable.querySelector('tbody'),
+            renderItem: renderRecord,
+            emptyHtml: '<span class="text-muted">沒有價格紀錄。</span>',
+            footerAfter: historyTable
+        }).loadMore();
+    }
+
+    const priceList = new KeysetList({
+        url: tbody.dataset.url,
+        container: tbody,
+        renderItem: renderSummary,
+        emptyHtml: params => params.q ? '<p class="text-muted p-2 text-center">沒有找到符合條件的食材。</p>' : `
+            <div class="alert alert-secondary mt-5 text-center p-4 rounded shadow-sm">
+                <h4 class="alert-heading">目前沒有食材價格紀錄喔！</h4>
+                <p>點擊上方「新增價格紀錄」或「匯入價格紀錄」來開始管理您的食材成本吧！</p>
+            </div>`,
+        params: { sort: sortSelect.value },
+        footerAfter: table.parentElement
+    });
+
+    const reload = () => priceList.reset({ q: searchBox.value.trim(), sort: sortSelect.value });
+    searchBox.addEventListener('input', debounce(reload));
+    sortSelect.addEventListener('change', reload);
+    reload();
+});
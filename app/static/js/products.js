@@ -12,14 +12,13 @@ document.addEventListener('DOMContentLoaded', function() {
     const createProductModal = new bootstrap.Modal(document.getElementById('create-product-modal'));
     const recipeSearchBox = document.getElementById('recipe-search-box');
     const recipeSearchResultsDiv = document.getElementById('recipe-search-results');
+    const productSortSelect = document.getElementById('product-sort');
 
     // --- 狀態管理 ---
     let currentProductId = null;
     let selectedRecipeDataForCreation = null;
 
-    // --- 從 HTML 傳遞的後端資料 (保持不變) ---
-    const allProductsInitialData = window.allProductsInitialData || [];
-    const allRecipesInitialData = window.allRecipesInitialData || [];
+    // --- 從 HTML 傳遞的後端資料 ---
     const electricityCostPerKwh = window.electricityCostPerKwh || 0;
     const laborCostPerHour = window.laborCostPerHour || 0;
 
@@ -201,7 +200,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     renderProductForm(data); // 傳遞包含所有細節的 data
                     updateButtonStates();
                     document.querySelectorAll('.list-group-item.active').forEach(el => el.classList.remove('active'));
-                    document.querySelector(`[data-product-id="${productId}"]`).classList.add('active');
+                    document.querySelector(`[data-product-id="${productId}"]`)?.classList.add('active');
                 } else {
                     alert('獲取產品詳情失敗: ' + data.message);
                 }
@@ -249,35 +248,50 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // --- 其他函式和事件監聽 (保持不變) ---
-    function renderProductList(products) {
-        productListDiv.innerHTML = '';
-        if (products.length > 0) {
-            products.forEach(product => {
-                const item = document.createElement('a');
-                item.href = '#';
-                item.className = 'list-group-item list-group-item-action';
-                item.setAttribute('data-product-id', product.id);
-                item.textContent = product.name;
-                item.addEventListener('click', (e) => { e.preventDefault(); selectProduct(product.id); });
-                productListDiv.appendChild(item);
-            });
-        } else {
-            productListDiv.innerHTML = '<p class="text-muted p-2 text-center">沒有找到產品。</p>';
-        }
+    // --- 產品列表與建立產品時的食譜清單：皆由分頁 API 逐頁載入，搜尋在後端進行 ---
+    function renderProductItem(product) {
+        const item = document.createElement('a');
+        item.href = '#';
+        item.className = 'list-group-item list-group-item-action';
+        item.setAttribute('data-product-id', product.id);
+        if (product.id === currentProductId) item.classList.add('active');
+        item.textContent = product.name;
+        item.addEventListener('click', (e) => { e.preventDefault(); selectProduct(product.id); });
+        return item;
+    }
+    function renderRecipeItem(recipe) {
+        const item = document.createElement('div');
+        item.className = 'list-group-item list-group-item-action';
+        item.innerHTML = `${escapeHtml(recipe.name)} <small class="text-muted">(食譜成本: NT$ ${recipe.total_ingredient_cost.toFixed(2)})</small>`;
+        item.addEventListener('click', () => { handleRecipeSelectionForCreation(recipe.id); });
+        return item;
     }
-    function searchProducts() { const query = productSearchBox.value.trim().toLowerCase(); const filteredProducts = allProductsInitialData.filter(p => p.name.toLowerCase().includes(query)); renderProductList(filteredProducts); }
-    function renderRecipeSearchResults(recipes) { recipeSearchResultsDiv.innerHTML = ''; if (recipes.length > 0) { recipes.forEach(recipe => { const item = document.createElement('div'); item.className = 'list-group-item list-group-item-action'; item.innerHTML = `${recipe.name} <small class="text-muted">(食譜成本: NT$ ${recipe.total_ingredient_cost.toFixed(2)})</small>`; item.addEventListener('click', () => { handleRecipeSelectionForCreation(recipe.id); }); recipeSearchResultsDiv.appendChild(item); }); } else { recipeSearchResultsDiv.innerHTML = '<p class="text-muted p-2 text-center">沒有找到符合條件的食譜。</p>'; } }
-    function searchRecipesInModal() { const query = recipeSearchBox.value.trim().toLowerCase(); const filteredRecipes = query === "" ? allRecipesInitialData : allRecipesInitialData.filter(r => r.name.toLowerCase().includes(query)); renderRecipeSearchResults(filteredRecipes); }
+    const productList = new KeysetList({
+        url: productListDiv.dataset.url,
+        container: productListDiv,
+        renderItem: renderProductItem,
+        emptyHtml: '<p class="text-muted p-2 text-center">沒有找到產品。</p>',
+        params: { sort: productSortSelect.value }
+    });
+    const recipeList = new KeysetList({
+        url: recipeSearchResultsDiv.dataset.url,
+        container: recipeSearchResultsDiv,
+        renderItem: renderRecipeItem,
+        emptyHtml: '<p class="text-muted p-2 text-center">沒有找到符合條件的食譜。</p>',
+        params: { sort: 'name' }
+    });
+    function searchProducts() { productList.reset({ q: productSearchBox.value.trim(), sort: productSortSelect.value }); }
+    function searchRecipesInModal() { recipeList.reset({ q: recipeSearchBox.value.trim() }); }
     function deleteProduct() { if (typeof currentProductId !== 'number' || !confirm('您確定要永久刪除這個產品嗎？')) return; deleteButton.disabled = true; deleteButton.querySelector('.spinner-border').classList.remove('d-none'); fetch(`/products/api/products/${currentProductId}/delete`, { method: 'POST' }).then(r => r.json()).then(d => { if (d.status === 'success') { alert(d.message); window.location.reload(); } else { alert('刪除失敗: ' + d.message); } }).finally(() => { deleteButton.disabled = false; deleteButton.querySelector('.spinner-border').classList.add('d-none'); }); }
-    productSearchBox.addEventListener('input', searchProducts);
-    recipeSearchBox.addEventListener('input', searchRecipesInModal);
-    newButton.addEventListener('click', () => { resetToInitialState(); renderRecipeSearchResults(allRecipesInitialData); createProductModal.show(); });
+    productSearchBox.addEventListener('input', debounce(searchProducts));
+    productSortSelect.addEventListener('change', searchProducts);
+    recipeSearchBox.addEventListener('input', debounce(searchRecipesInModal));
+    newButton.addEventListener('click', () => { resetToInitialState(); recipeSearchBox.value = ''; searchRecipesInModal(); createProductModal.show(); });
     cancelButton.addEventListener('click', resetToInitialState);
     saveButton.addEventListener('click', saveProduct);
     deleteButton.addEventListener('click', deleteProduct);
     
     // --- 初始化 ---
-    renderProductList(allProductsInitialData);
+    searchProducts();
     resetToInitialState();
 });
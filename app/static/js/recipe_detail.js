@@ -116,19 +116,28 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // 食譜項目可以是食材或子食譜，以 i{食材 id} / r{食譜 id} 區分
+    function itemKey(item) {
+        return item.sub_recipe_id ? `r${item.sub_recipe_id}` : `i${item.ingredient_id}`;
+    }
+
+    function findItem(key) {
+        return recipeState.ingredients.find(item => itemKey(item) === key);
+    }
+
     function renderTable() {
         ingredientsTableBody.innerHTML = '';
         noIngredientsMsg.style.display = recipeState.ingredients.length > 0 ? 'none' : 'block';
         recipeState.ingredients.forEach(item => {
             const newRow = document.createElement('tr');
-            newRow.setAttribute('data-ingredient-id', item.ingredient_id);
+            newRow.setAttribute('data-item-key', itemKey(item));
             newRow.innerHTML = `
                 <td>${item.ingredient_name}</td>
-                <td class="text-end"><input type="number" class="form-control form-control-sm text-end weight-input" value="${item.quantity_g}" min="0" step="0.1" data-ingredient-id="${item.ingredient_id}"></td>
+                <td class="text-end"><input type="number" class="form-control form-control-sm text-end weight-input" value="${item.quantity_g}" min="0" step="0.1" data-item-key="${itemKey(item)}"></td>
                 <td>
                     <button class="btn btn-sm btn-outline-info arrow-btn up-btn" title="上移"><i class="bi bi-arrow-up-circle-fill"></i></button>
                     <button class="btn btn-sm btn-outline-info arrow-btn down-btn" title="下移"><i class="bi bi-arrow-down-circle-fill"></i></button>
-                    <button class="btn btn-sm btn-outline-danger remove-btn" data-ingredient-id="${item.ingredient_id}" title="移除"><i class="bi bi-x-circle-fill"></i></button>
+                    <button class="btn btn-sm btn-outline-danger remove-btn" data-item-key="${itemKey(item)}" title="移除"><i class="bi bi-x-circle-fill"></i></button>
                 </td>
             `;
             ingredientsTableBody.appendChild(newRow);
@@ -244,7 +253,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function updateAll() { renderTable(); calculateAndDisplayNutrition(); }
 
     function addIngredientToState(ingredientData) {
-        if (recipeState.ingredients.some(item => item.ingredient_id == ingredientData.id)) { alert('這個食材已經在列表中了！'); return; }
+        if (findItem(`i${ingredientData.id}`)) { alert('這個食材已經在列表中了！'); return; }
         recipeState.ingredients.push({
             ingredient_id: ingredientData.id,
             ingredient_name: ingredientData.name,
@@ -261,12 +270,33 @@ document.addEventListener('DOMContentLoaded', function() {
         updateAll();
     }
     
+    function addSubRecipeToState(recipe) {
+        if (recipe.id === recipeId) { alert('食譜不能使用自己作為子食譜！'); return; }
+        if (findItem(`r${recipe.id}`)) { alert('這個子食譜已經在列表中了！'); return; }
+        fetch(`/recipes/api/recipe/${recipe.id}/component`)
+            .then(response => response.json())
+            .then(result => {
+                if (result.status !== 'success') { alert(result.message); return; }
+                recipeState.ingredients.push({
+                    ingredient_id: null,
+                    sub_recipe_id: result.data.id,
+                    ingredient_name: `${result.data.name} (子食譜)`,
+                    quantity_g: 0,
+                    details: result.data.details
+                });
+                updateAll();
+            })
+            .catch(error => {
+                console.error('Error loading sub-recipe:', error);
+                alert('載入子食譜時發生錯誤。');
+            });
+    }
+
     function updateStateOrder() {
         const newOrder = [];
         const rows = ingredientsTableBody.querySelectorAll('tr');
         rows.forEach(row => {
-            const ingredientId = parseInt(row.getAttribute('data-ingredient-id'));
-            const item = recipeState.ingredients.find(i => i.ingredient_id === ingredientId);
+            const item = findItem(row.getAttribute('data-item-key'));
             if (item) {
                 const newQuantity = parseFloat(row.querySelector('.weight-input').value) || 0;
                 item.quantity_g = newQuantity;
@@ -302,6 +332,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 } else {
                     searchResultsDiv.innerHTML = '<p class="text-muted p-2 text-center">沒有找到符合條件的食材。</p>';
                 }
+                if (query) { searchSubRecipes(query); }
             })
             .catch(error => {
                 console.error('Error searching ingredients:', error);
@@ -309,6 +340,24 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    // 自己的其他食譜 (麵團、內餡等半成品) 也可以作為子食譜加入
+    function searchSubRecipes(query) {
+        fetch(`/recipes/api/recipes?sort=name&limit=5&q=${encodeURIComponent(query)}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status !== 'success') return;
+                data.items.filter(recipe => recipe.id !== recipeId).forEach(recipe => {
+                    const resultItem = document.createElement('div');
+                    resultItem.innerHTML = `<span class="badge bg-secondary me-2">子食譜</span>`;
+                    resultItem.appendChild(document.createTextNode(recipe.name));
+                    resultItem.className = 'list-group-item list-group-item-action';
+                    resultItem.addEventListener('click', () => addSubRecipeToState(recipe));
+                    searchResultsDiv.appendChild(resultItem);
+                });
+            })
+            .catch(error => console.error('Error searching recipes:', error));
+    }
+
     function openAddModal(prefilledName) {
         modalFormContainer.innerHTML = formTemplate;
         document.getElementById('modal_food_name').value = prefilledName;
@@ -357,7 +406,7 @@ document.addEventListener('DOMContentLoaded', function() {
         calculateServingWeight();
     }
     
-    ingredientsTableBody.addEventListener('input', function(event) { if (event.target.classList.contains('weight-input')) { const ingredientIdToUpdate = parseInt(event.target.getAttribute('data-ingredient-id')); const newQuantity = parseFloat(event.target.value) || 0; const item = recipeState.ingredients.find(i => i.ingredient_id == ingredientIdToUpdate); if(item) { item.quantity_g = newQuantity; } calculateAndDisplayNutrition(); } });
+    ingredientsTableBody.addEventListener('input', function(event) { if (event.target.classList.contains('weight-input')) { const newQuantity = parseFloat(event.target.value) || 0; const item = findItem(event.target.getAttribute('data-item-key')); if(item) { item.quantity_g = newQuantity; } calculateAndDisplayNutrition(); } });
     ingredientsTableBody.addEventListener('click', function(event) {
         const target = event.target;
         const button = target.closest('button'); 
@@ -365,8 +414,8 @@ document.addEventListener('DOMContentLoaded', function() {
         if (!button) return;
 
         if (button.classList.contains('remove-btn')) {
-            const ingredientIdToRemove = parseInt(button.getAttribute('data-ingredient-id'));
-            if (confirm(`您確定要移除嗎？`)) { recipeState.ingredients = recipeState.ingredients.filter(item => item.ingredient_id != ingredientIdToRemove); updateAll(); }
+            const keyToRemove = button.getAttribute('data-item-key');
+            if (confirm(`您確定要移除嗎？`)) { recipeState.ingredients = recipeState.ingredients.filter(item => itemKey(item) !== keyToRemove); updateAll(); }
         } else if (button.classList.contains('up-btn')) {
             const row = button.closest('tr');
             const prevRow = row.previousElementSibling;
@@ -416,8 +465,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const itemsInTable = [];
         const rows = ingredientsTableBody.querySelectorAll('tr');
         rows.forEach(row => {
-            const id = parseInt(row.getAttribute('data-ingredient-id'));
-            const originalItem = recipeState.ingredients.find(i => i.ingredient_id === id);
+            const originalItem = findItem(row.getAttribute('data-item-key'));
             if (originalItem) {
                 originalItem.quantity_g = parseFloat(row.querySelector('.weight-input').value) || 0;
                 itemsInTable.push(originalItem);
@@ -1,6 +1,54 @@
 // app/static/js/recipes_index.js
-// 目前 recipes/index.html 沒有頁面專屬的 JavaScript 邏輯
-// 如果未來需要，可以將相關邏輯添加在此。
+// 食譜列表：透過 /recipes/api/recipes 分頁載入，搜尋與排序都由後端處理
 document.addEventListener('DOMContentLoaded', function() {
-    // 這裡可以添加 recipes/index.html 頁面專屬的 JS 邏輯
-});
\ No newline at end of file
+    const listDiv = document.getElementById('recipe-list');
+    const searchBox = document.getElementById('recipe-search-box');
+    const sortSelect = document.getElementById('recipe-sort');
+
+    function renderRecipe(recipe) {
+        const item = document.createElement('div');
+        item.className = 'list-group-item list-group-item-action py-3';
+        item.innerHTML = `
+            <div class="d-flex w-100 justify-content-between align-items-center">
+                <a href="${recipe.url}" class="text-decoration-none flex-grow-1">
+                    <h5 class="mb-1 text-primary">${escapeHtml(recipe.name)}</h5>
+                </a>
+                <small class="text-muted mx-4">
+                    <i class="bi bi-basket me-1"></i>${recipe.total_weight_g.toFixed(1)} 公克 ·
+                    ${recipe.nutrition.calories_kcal.toFixed(0)} 大卡 ·
+                    NT$ ${recipe.total_ingredient_cost.toFixed(2)}
+                </small>
+                <small class="text-muted mx-4">
+                    <i class="bi bi-clock me-1"></i>最後修改於: ${escapeHtml(recipe.updated_at)}
+                </small>
+                <form action="${recipe.delete_url}" method="POST" class="d-inline">
+                    <button type="submit" class="btn btn-outline-danger btn-sm">
+                        <i class="bi bi-trash me-1"></i>刪除
+                    </button>
+                </form>
+            </div>`;
+        item.querySelector('form').addEventListener('submit', event => {
+            if (!confirm(`您確定要刪除「${recipe.name}」嗎？此操作無法復原！`)) event.preventDefault();
+        });
+        return item;
+    }
+
+    const recipeList = new KeysetList({
+        url: listDiv.dataset.url,
+        container: listDiv,
+        renderItem: renderRecipe,
+        emptyHtml: params => params.q ? '<p class="text-muted p-2 text-center">沒有找到符合條件的食譜。</p>' : `
+            <div class="alert alert-secondary mt-5 text-center p-4">
+                <h4 class="alert-heading">目前沒有食譜喔！</h4>
+                <p>點擊右上角的「新增食譜」按鈕，建立您的第一個食譜吧！</p>
+                <hr>
+                <p class="mb-0">開始您的美食創作之旅。</p>
+            </div>`,
+        params: { sort: sortSelect.value }
+    });
+
+    const reload = () => recipeList.reset({ q: searchBox.value.trim(), sort: sortSelect.value });
+    searchBox.addEventListener('input', debounce(reload));
+    sortSelect.addEventListener('change', reload);
+    reload();
+});
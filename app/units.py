@@ -0,0 +1,96 @@
+# app/units.py
+# --- 購買單位換算 ---
+# 價格紀錄的數量單位是使用者自由輸入的字串 (g、公斤、ml、個、包…)，成本計算需要換算成公克。
+# 單位在模組載入時就整理成「別名 → (類別, 換算係數)」的對照表，查詢只需一次字典查找：
+#   - mass   質量單位，係數為每單位的公克數
+#   - volume 容量單位，係數為每單位的毫升數，需乘上食材密度 (g/ml) 才是公克
+#   - piece  計數單位 (個、包、盒…)，係數為每單位的件數，需乘上食材的每件重量 (g)
+# 容量單位在食材未設定密度、計數單位在食材未設定每件重量時無法換算 (成本改用食材的預設成本)，
+# 不假設 1 g/ml，避免油、糖漿等密度差異大的食材算出錯誤的成本。
+from functools import lru_cache
+
+from sqlalchemy import case, func
+
+MASS, VOLUME, PIECE = 'mass', 'volume', 'piece'
+
+_UNIT_GROUPS = (
+    (MASS, 1.0, ('g', 'gram', 'grams', '公克', '克')),
+    (MASS, 0.001, ('mg', '毫克')),
+    (MASS, 1000.0, ('kg', 'kgs', '公斤', '千克')),
+    (MASS, 600.0, ('台斤', '斤')),
+    (MASS, 37.5, ('兩',)),
+    (MASS, 453.59237, ('lb', 'lbs', '磅')),
+    (MASS, 28.349523125, ('oz', '盎司')),
+    (VOLUME, 1.0, ('ml', 'cc', '毫升', '西西')),
+    (VOLUME, 1000.0, ('l', '公升', '升')),
+    (VOLUME, 15.0, ('tbsp', '大匙', '湯匙')),
+    (VOLUME, 5.0, ('tsp', '小匙', '茶匙')),
+    (VOLUME, 240.0, ('cup', 'cups', '杯', '量杯')),
+    (PIECE, 1.0, ('個', '顆', '粒', '片', '條', '根', '隻', '塊', '枚', '包', '袋', '盒', '罐', '瓶', '桶', '箱',
+                  '入', 'pc', 'pcs', 'piece', 'pieces', 'ea', 'pack')),
+    (PIECE, 12.0, ('打', 'dozen', 'dz')),
+)
+
+# 別名 (已正規化) -> (類別, 係數)
+UNIT_TABLE = {alias.casefold(): (kind, factor) for kind, factor, aliases in _UNIT_GROUPS for alias in aliases}
+
+
+@lru_cache(maxsize=512)
+def parse_unit(unit):
+    """回傳單位的 (類別, 係數)；無法辨識時回傳 None。"""
+    if not unit:
+        return None
+    return UNIT_TABLE.get(unit.strip().casefold())
+
+
+def is_known_unit(unit):
+    return parse_unit(unit) is not None
+
+
+def grams_per_unit(unit, density_g_per_ml=None, piece_weight_g=None):
+    """一個單位相當於多少公克；無法換算 (未知單位、未設定密度的容量單位或未設定每件重量的計數單位) 時回傳 None。"""
+    parsed = parse_unit(unit)
+    if parsed is None:
+        return None
+    kind, factor = parsed
+    if kind == MASS:
+        return factor
+    if kind == VOLUME:
+        return factor * density_g_per_ml if density_g_per_ml else None
+    if piece_weight_g:
+        return factor * piece_weight_g
+    return None
+
+
+def cost_per_gram(price, quantity, unit, density_g_per_ml=None, piece_weight_g=None):
+    """由一筆購買紀錄換算每公克成本；數量為 0 時為 0，單位無法換算時回傳 None。"""
+    if not quantity or quantity <= 0:
+        return 0
+    grams = grams_per_unit(unit, density_g_per_ml, piece_weight_g)
+    if grams is None:
+        return None
+    return price / (quantity * grams)
+
+
+def grams_per_unit_sql(unit, density_g_per_ml, piece_weight_g):
+    """
+    SQL 版本的 grams_per_unit：由同一份對照表產生 CASE 運算式，供彙總查詢直接在資料庫中換算。
+    參數為欄位運算式；無法換算時結果為 NULL (MIN/AVG 等彙總函式會自動略過)。
+    """
+    normalized = func.lower(func.trim(unit))
+    density = func.nullif(density_g_per_ml, 0)
+    piece_weight = func.nullif(piece_weight_g, 0)
+    whens = []
+    for kind, factor, aliases in _UNIT_GROUPS:
+        grams = {MASS: factor, VOLUME: factor * density, PIECE: factor * piece_weight}[kind]
+        whens.append((normalized.in_([alias.casefold() for alias in aliases]), grams))
+    return case(*whens, else_=None)
+
+
+def cost_per_gram_sql(price, quantity, unit, density_g_per_ml, piece_weight_g):
+    """SQL 版本的 cost_per_gram：數量不大於 0 時為 0，單位無法換算時為 NULL。"""
+    return case(
+        (quantity > 0, price / (quantity * grams_per_unit_sql(unit, density_g_per_ml, piece_weight_g))),
+        else_=0.0
+    )
+
@@ -0,0 +1,207 @@
+# app/what_if.py
+# --- 食材價格變動的試算 (what-if / 敏感度分析) ---
+# 產品的平均單位成本對食材單價是線性的：
+#     cost = W @ unit_cost + fixed
+# 其中 W 為「產品 × 食材」的用量矩陣 (每件產品分攤到的克數)，unit_cost 為各食材每克成本，
+# fixed 為與食材無關的電費與人力成本 (每件)。
+# 因此只要建好一次 W，任意多組價格變動情境都能以一次矩陣乘法同時算出所有產品的新成本與毛利率。
+# 建好的模型依使用者快取 (PortfolioModelCache)，食譜、食材、價格 (營養計算快取的世代) 或產品本身
+# 有異動時才重新建立，連續調整情境的試算不必每次重新載入所有產品。
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+
+from app.costing import product_cost_breakdown
+from app.nutrition_cache import get_nutrition_cache
+
+# 單次請求最多可試算的情境數
+MAX_SCENARIOS = 1000
+# 模型用到的產品欄位；只有這些欄位改變時才需要重新建立 (成本寫回 calculated_cost 不影響模型)
+MODEL_ATTRIBUTES = ('product_name', 'selling_price', 'recipe', 'recipe_id', 'batch_size',
+                    'bake_power_w', 'bake_time_min', 'production_time_hr')
+
+
+class PortfolioCostModel:
+    """一位使用者所有產品的成本模型 (用量矩陣 + 食材單價 + 固定成本)。"""
+
+    def __init__(self, products, jobs):
+        """
+        products 為 [(product_id, product_name, selling_price), ...]，
+        jobs 為 app.costing.load_cost_jobs() 對同一批產品載入的計算資料。
+        """
+        jobs_by_product = {job['product_id']: job for job in jobs}
+        products = [product for product in products if product[0] in jobs_by_product]
+
+        self.product_ids = [product[0] for product in products]
+        self.product_names = [product[1] for product in products]
+        self.selling_prices = np.array([product[2] or 0 for product in products], dtype=float)
+
+        self.column_of = {}
+        for job in jobs:
+            for ingredient_id, _, _, _ in job['items']:
+                self.column_of.setdefault(ingredient_id, len(self.column_of))
+
+        self.grams = np.zeros((len(products), len(self.column_of)), dtype=float)
+        self.fixed_costs = np.zeros(len(products), dtype=float)
+        self.unit_costs = np.zeros(len(self.column_of), dtype=float)
+
+        purchases = {}  # column -> (依計算方式的每公克成本或 None, 食材預設成本)
+        for row, product_id in enumerate(self.product_ids):
+            job = jobs_by_product[product_id]
+            # 以 product_cost_breakdown 本身求出線性關係的截距 (食材成本為 0) 與斜率，
+            # 確保與 Product.calculate_total_product_cost() 的算法一致
+            fixed = product_cost_breakdown(0.0, **job['parameters'])['average_cost_per_product']
+            scale = product_cost_breakdown(1.0, **job['parameters'])['average_cost_per_product'] - fixed
+            self.fixed_costs[row] = fixed
+            for ingredient_id, quantity_g, unit_cost, default_cost_per_unit in job['items']:
+                column = self.column_of[ingredient_id]
+                self.grams[row, column] += (quantity_g or 0) * scale
+                purchases[column] = (unit_cost, default_cost_per_unit)
+
+        # 沒有可用價格 (無價格紀錄或單位無法換算) 的食材使用預設成本
+        for column, (unit_cost, default_cost_per_unit) in purchases.items():
+            self.unit_costs[column] = unit_cost if unit_cost is not None else default_cost_per_unit / 100.0
+
+    @classmethod
+    def for_user(cls, user_id):
+        """以固定次數的查詢載入使用者的所有產品並建立模型。"""
+        from app import db
+        from app.costing import load_cost_jobs
+        from app.models import Product
+
+        products = db.session.execute(
+            db.select(Product.id, Product.product_name, Product.selling_price)
+            .where(Product.user_id == user_id)
+            .order_by(Product.product_name, Product.id)
+        ).all()
+        jobs = load_cost_jobs([product.id for product in products]) if products else []
+        return cls([tuple(product) for product in products], jobs)
+
+    def multipliers(self, scenarios):
+        """
+        將情境轉成 (scenarios × ingredients) 的單價倍數矩陣。
+        每個情境為 {ingredient_id: 漲跌百分比}，例如 {12: 15} 代表該食材漲價 15%；
+        不在任何產品中的食材不影響結果。
+        """
+        matrix = np.ones((len(scenarios), len(self.column_of)), dtype=float)
+        for row, changes in enumerate(scenarios):
+            for ingredient_id, percent in changes.items():
+                column = self.column_of.get(ingredient_id)
+                if column is not None:
+                    matrix[row, column] = 1.0 + percent / 100.0
+        return matrix
+
+    def costs(self, multipliers=None):
+        """回傳各情境下每項產品的平均單位成本 (scenarios × products)；未指定時為目前成本 (單一列)。"""
+        if multipliers is None:
+            multipliers = np.ones((1, len(self.column_of)), dtype=float)
+        return (multipliers * self.unit_costs) @ self.grams.T + self.fixed_costs
+
+    def margins(self, costs):
+        """由成本計算毛利率 (%)，算法與 Product.calculate_profit_margin() 相同；售價為 0 的產品為 0。"""
+        selling = self.selling_prices
+        safe_selling = np.where(selling > 0, selling, 1.0)
+        return np.where(selling > 0, (selling - costs) / safe_selling * 100, 0.0)
+
+    def evaluate(self, scenarios):
+        """
+        試算多個情境，回傳 (base_costs, base_margins, costs, margins)：
+        base_* 為目前的成本與毛利率 (products)，其餘為 (scenarios × products)。
+        """
+        base_costs = self.costs()[0]
+        costs = self.costs(self.multipliers(scenarios))
+        return base_costs, self.margins(base_costs), costs, self.margins(costs)
+
+
+class PortfolioModelCache:
+    """
+    每位使用者最近建立的 PortfolioCostModel (LRU，最多 max_size 位使用者)。
+    模型以建立前的資料世代為鍵：營養計算快取的世代 (食譜、食材、價格，含其他行程的異動)
+    加上這位使用者的產品異動次數；建立期間若有異動，下次取用時世代不同即重新建立。
+    """
+
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._models = OrderedDict()                # user_id -> (世代, 模型)
+        self._product_generations = defaultdict(int)
+
+    def get(self, user_id):
+        version = self._version(user_id)
+        if version is None:
+            return PortfolioCostModel.for_user(user_id)
+        with self._lock:
+            cached = self._models.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._models.move_to_end(user_id)
+                return cached[1]
+        model = PortfolioCostModel.for_user(user_id)
+        with self._lock:
+            self._models[user_id] = (version, model)
+            self._models.move_to_end(user_id)
+            while len(self._models) > self.max_size:
+                self._models.popitem(last=False)
+        return model
+
+    def _version(self, user_id):
+        nutrition_cache = get_nutrition_cache()
+        if nutrition_cache is None:
+            return None
+        with self._lock:
+            product_generation = self._product_generations[user_id]
+        return nutrition_cache.generation(), product_generation
+
+    def products_changed(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._product_generations[user_id] += 1
+                self._models.pop(user_id, None)
+
+    # --- Flask 整合 ---
+
+    def init_app(self, app):
+        app.extensions['portfolio_models'] = self
+
+
+def get_portfolio_model(user_id):
+    """取得使用者的成本模型 (有快取時使用快取)。"""
+    cache = current_app.extensions.get('portfolio_models')
+    return cache.get(user_id) if cache is not None else PortfolioCostModel.for_user(user_id)
+
+
+# --- ORM 事件：產品的售價、批量等參數改變時讓模型失效 ---
+
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    from app.models import Product
+    user_ids = {obj.user_id for obj in list(session.new) + list(session.deleted) if isinstance(obj, Product)}
+    user_ids.update(
+        obj.user_id for obj in session.dirty
+        if isinstance(obj, Product)
+        and any(attributes.get_history(obj, name).has_changes() for name in MODEL_ATTRIBUTES)
+    )
+    if user_ids:
+        session.info.setdefault('portfolio_model_users', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_product_changes(session):
+    user_ids = session.info.pop('portfolio_model_users', None)
+    if not user_ids or not has_app_context():
+        return
+    cache = current_app.extensions.get('portfolio_models')
+    if cache is not None:
+        cache.products_changed(user_ids)
+    # 產品異動不在營養計算快取的依賴中，另外更新共用標記，讓其他行程的世代 (與模型) 一併失效
+    nutrition_cache = get_nutrition_cache()
+    if nutrition_cache is not None:
+        nutrition_cache.publish()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop('portfolio_model_users', None)
@@ -0,0 +1,350 @@
+# benchmarks/run.py
+# --- 熱點路徑的效能基準測試 ---
+# 用法：
+#   python -m benchmarks.run                              以 medium 規模產生資料並執行全部基準測試
+#   python -m benchmarks.run --scale small --repeat 5     快速檢查
+#   python -m benchmarks.run --only search               只執行名稱包含 search 的項目
+#   python -m benchmarks.run --save-baseline              把這次的結果存為基準 (benchmarks/baseline.json)
+# 每次執行都在暫存目錄建立新的 SQLite 資料庫並以固定種子產生合成資料 (見 benchmarks/synthetic.py)，
+# 結果 (各項目的中位數、p95、最小值與每次執行的 SQL 查詢數) 寫入 --output 指定的 JSON 檔。
+# 有基準檔時逐項比較：中位數慢於基準超過 --tolerance (且差距大於 --min-delta-ms)，或查詢數增加，
+# 都視為效能退化，列出後以結束碼 1 結束。基準檔與這次的規模或種子不同時無法比較，以結束碼 2 結束。
+# 找不到基準檔時輸出 SKIPPED 並略過比較；加上 --require-baseline 時同樣以結束碼 2 結束。
+# benchmarks/baseline.json 為 medium 規模、種子 42 的基準 (產生時的環境記錄在 meta 中)。
+# 耗時與機器有關，基準檔應在同一台機器 (或同規格的 CI 環境) 上產生。
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event, func, select
+
+from app import create_app, db
+from app.models import Product, Recipe, RecipeItem
+from app.nutrition_cache import get_nutrition_cache
+from benchmarks.synthetic import BENCH_PASSWORD, SCALES, SyntheticDataset
+from config import Config
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, 'results.json')
+
+# 搜尋基準測試輪流使用的查詢字串
+SEARCH_QUERIES = ('麵粉', '奶', '低筋', '可可', '抹茶粉', '無鹽奶油', '紅豆', '12', '鮮', '糖')
+
+
+def bench_config(directory):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        TFDA_IMPORT_STAMP = os.path.join(directory, 'tfda_import.stamp')
+        NUTRITION_CACHE_STAMP = os.path.join(directory, 'nutrition_cache.stamp')
+        AUTOCOMPLETE_STAMP = os.path.join(directory, 'autocomplete.stamp')
+        WTF_CSRF_ENABLED = False
+        # 量測實際的搜尋，不使用查詢結果快取
+        AUTOCOMPLETE_CACHE_TTL = 0.0
+        SQL_STRICT_QUERY_BUDGET = False
+        METRICS_MULTIPROC_DIR = None
+        PROFILER_ENABLED = False
+        PROFILER_DIR = os.path.join(directory, 'profiles')
+    return BenchConfig
+
+
+class QueryCounter:
+    """計算所有引擎執行的 SQL 數。"""
+
+    def __init__(self, app):
+        self.count = 0
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+class BenchContext:
+    """基準測試共用的資料：app、已登入的 test client 與挑選好的測試對象。"""
+
+    def __init__(self, app, directory, dataset):
+        self.app = app
+        self.directory = directory
+        self.dataset = dataset
+        self.db_path = os.path.join(directory, 'bench.db')
+        with app.app_context():
+            # 項目最多的食譜 (含子食譜時優先) 與使用它的產品，代表最重的單筆計算
+            item_count = func.count(RecipeItem.id)
+            self.recipe_id = db.session.execute(
+                select(RecipeItem.recipe_id)
+                .group_by(RecipeItem.recipe_id)
+                .order_by(func.count(RecipeItem.sub_recipe_id).desc(), item_count.desc(), RecipeItem.recipe_id)
+                .limit(1)
+            ).scalar_one()
+            recipe = db.session.get(Recipe, self.recipe_id)
+            self.user_id = recipe.user_id
+            self.username = recipe.author.username
+            self.product_id = db.session.scalar(
+                select(Product.id)
+                .join(RecipeItem, RecipeItem.recipe_id == Product.recipe_id)
+                .where(Product.user_id == self.user_id)
+                .group_by(Product.id)
+                .order_by(item_count.desc(), Product.id)
+                .limit(1)
+            )
+            self.preview_items = [
+                {'sub_recipe_id': item.sub_recipe_id, 'quantity_g': item.quantity_g} if item.sub_recipe_id
+                else {'ingredient_id': item.ingredient_id, 'quantity_g': item.quantity_g}
+                for item in recipe.ingredients
+            ]
+        self.client = app.test_client()
+        response = self.client.post('/auth/login', data={'username': self.username, 'password': BENCH_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError('基準測試使用者登入失敗')
+
+    def clear_nutrition_cache(self):
+        cache = get_nutrition_cache()
+        if cache is not None:
+            cache.clear()
+
+
+# --- 基準測試項目 ---
+# 每個項目接收 BenchContext，回傳要重複量測的無參數函式。
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.request.path} 回應 {response.status_code}')
+    return response
+
+
+@benchmark('recipe.calculate_nutrition')
+def bench_calculate_nutrition(ctx):
+    def run():
+        with ctx.app.app_context():
+            ctx.clear_nutrition_cache()
+            db.session.get(Recipe, ctx.recipe_id).calculate_nutrition()
+    return run
+
+
+@benchmark('recipe.calculate_nutrition.cached')
+def bench_calculate_nutrition_cached(ctx):
+    def run():
+        with ctx.app.app_context():
+            db.session.get(Recipe, ctx.recipe_id).calculate_nutrition()
+    return run
+
+
+@benchmark('product.calculate_total_product_cost')
+def bench_product_cost(ctx):
+    def run():
+        with ctx.app.app_context():
+            ctx.clear_nutrition_cache()
+            config = ctx.app.config
+            db.session.get(Product, ctx.product_id).calculate_total_product_cost(
+                config['ELECTRICITY_COST_PER_KWH'], config['LABOR_COST_PER_HOUR']
+            )
+    return run
+
+
+@benchmark('products.index')
+def bench_products_index(ctx):
+    return lambda: _check(ctx.client.get('/products/'))
+
+
+@benchmark('products.list_products')
+def bench_products_list(ctx):
+    # products.index 的產品列表由此 API 分頁載入
+    return lambda: _check(ctx.client.get('/products/api/products?limit=50'))
+
+
+@benchmark('recipes.preview_label')
+def bench_preview_label(ctx):
+    payload = {'recipe_name': '預覽', 'servings_count': 8, 'final_weight_g': 1200,
+               'label_options': {}, 'ingredients': ctx.preview_items}
+
+    def run():
+        ctx.clear_nutrition_cache()
+        _check(ctx.client.post('/recipes/api/recipe/preview_label', json=payload))
+    return run
+
+
+def _rotating_search(ctx, url):
+    queries = iter(range(sys.maxsize))
+    return lambda: _check(ctx.client.get(url, query_string={'q': SEARCH_QUERIES[next(queries) % len(SEARCH_QUERIES)]}))
+
+
+@benchmark('recipes.search_ingredients')
+def bench_search_ingredients(ctx):
+    return _rotating_search(ctx, '/recipes/api/search_ingredients')
+
+
+@benchmark('pricing.search_all_ingredients')
+def bench_search_all_ingredients(ctx):
+    return _rotating_search(ctx, '/pricing/api/search_all_ingredients')
+
+
+@benchmark('tfda_import.sync')
+def bench_tfda_import(ctx):
+    """輪流同步兩份匯出檔 (約 10% 的食材內容不同)，每次都有一部分食材需要更新。"""
+    import import_tfda_data
+
+    exports = [os.path.join(ctx.directory, 'tfda_a.json'), os.path.join(ctx.directory, 'tfda_b.json')]
+    ctx.dataset.write_tfda_export(exports[0])
+    ctx.dataset.write_tfda_export(exports[1], changed_ratio=0.1)
+    runs = iter(range(sys.maxsize))
+
+    def run():
+        conn = sqlite3.connect(ctx.db_path, isolation_level=None)
+        try:
+            with open(exports[next(runs) % 2], encoding='utf-8') as fp, contextlib.redirect_stdout(io.StringIO()):
+                import_tfda_data.sync_records(
+                    conn, import_tfda_data.group_records(import_tfda_data.iter_json_array(fp))
+                )
+        finally:
+            conn.close()
+    return run
+
+
+# --- 執行與比較 ---
+
+def measure(run, counter, repeat, warmup=1):
+    for _ in range(warmup):
+        run()
+    durations, queries = [], []
+    for _ in range(repeat):
+        before = counter.count
+        start = time.perf_counter()
+        run()
+        durations.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count - before)
+    durations.sort()
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(durations), 3),
+        'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3),
+        'min_ms': round(durations[0], 3),
+        'mean_ms': round(statistics.fmean(durations), 3),
+        'queries': int(statistics.median(queries)),
+    }
+
+
+def run_benchmarks(scale, seed, repeat, only=None):
+    with tempfile.TemporaryDirectory(prefix='nutrition-bench-') as directory:
+        config = bench_config(directory)
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+            dataset = SyntheticDataset(scale, seed)
+            started = time.perf_counter()
+            counts = dataset.generate()
+            generate_seconds = time.perf_counter() - started
+            db.session.remove()
+        print(f'已產生 {scale} 規模的資料 ({generate_seconds:.1f} 秒)：'
+              + '、'.join(f'{name} {count}' for name, count in counts.items()))
+
+        # 以新的 app 量測 (食材搜尋索引與各項快取從啟動狀態開始)
+        app = create_app(config)
+        counter = QueryCounter(app)
+        ctx = BenchContext(app, directory, dataset)
+        results = {}
+        for name, setup in BENCHMARKS.items():
+            if only and not any(term in name for term in only):
+                continue
+            results[name] = measure(setup(ctx), counter, repeat)
+            print(f"  {name:<40} 中位數 {results[name]['median_ms']:>10.2f} ms   "
+                  f"p95 {results[name]['p95_ms']:>10.2f} ms   查詢 {results[name]['queries']}")
+
+    return {
+        'meta': {
+            'scale': scale,
+            'seed': seed,
+            'repeat': repeat,
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dataset': counts,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """回傳效能退化的項目說明清單。"""
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            continue
+        slower = current['median_ms'] - previous['median_ms']
+        if current['median_ms'] > previous['median_ms'] * (1 + tolerance) and slower > min_delta_ms:
+            regressions.append(f"{name}: 中位數 {previous['median_ms']:.2f} → {current['median_ms']:.2f} ms "
+                               f"(+{slower / previous['median_ms']:.0%})")
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: 查詢數 {previous['queries']} → {current['queries']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='以合成資料執行熱點路徑的效能基準測試，並與基準結果比較。')
+    parser.add_argument('--scale', choices=SCALES, default='medium', help='合成資料的規模 (預設: medium)')
+    parser.add_argument('--seed', type=int, default=42, help='亂數種子 (預設: 42)')
+    parser.add_argument('--repeat', type=int, default=20, help='每個項目量測的次數 (預設: 20)')
+    parser.add_argument('--only', action='append', help='只執行名稱包含此字串的項目 (可重複指定)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f'結果 JSON 檔 (預設: {DEFAULT_OUTPUT})')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help=f'基準 JSON 檔 (預設: {DEFAULT_BASELINE})')
+    parser.add_argument('--save-baseline', action='store_true', help='把這次的結果存為基準，不做比較')
+    parser.add_argument('--require-baseline', action='store_true', help='找不到基準檔時以結束碼 2 結束 (CI 使用)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='中位數可接受的變慢比例 (預設: 0.25)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='變慢的毫秒數小於此值時視為雜訊 (預設: 1.0)')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scale, args.seed, args.repeat, args.only)
+    with open(args.output, 'w', encoding='utf-8') as fp:
+        json.dump(results, fp, ensure_ascii=False, indent=2)
+    print(f'結果已寫入 {args.output}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as fp:
+            json.dump(results, fp, ensure_ascii=False, indent=2)
+        print(f'已更新基準檔 {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        # 明確標示略過，避免 CI 把「沒有比較」誤讀為「沒有退化」；--require-baseline 時視為失敗
+        print(f'SKIPPED: 找不到基準檔 {args.baseline}，未與基準比較 (可用 --save-baseline 建立)。', file=sys.stderr)
+        return 2 if args.require_baseline else 0
+
+    with open(args.baseline, encoding='utf-8') as fp:
+        baseline = json.load(fp)
+    if (baseline['meta']['scale'], baseline['meta']['seed']) != (args.scale, args.seed):
+        print(f"基準檔的規模與種子 ({baseline['meta']['scale']}, {baseline['meta']['seed']}) "
+              f'與這次 ({args.scale}, {args.seed}) 不同，無法比較。', file=sys.stderr)
+        return 2
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f'發現 {len(regressions)} 項效能退化：', file=sys.stderr)
+        for line in regressions:
+            print(f'  - {line}', file=sys.stderr)
+        return 1
+    print('與基準相比沒有效能退化。')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# benchmarks/synthetic.py
+# --- 可重現的合成資料集 ---
+# 以固定的亂數種子產生與正式環境規模相近的資料，供效能基準測試使用：
+#   - 使用者
+#   - TFDA 規模的食材目錄 (另產生一份相同內容的 TFDA 匯出 JSON，供匯入程式的基準測試使用)
+#   - 每位使用者的自訂食材與長期的價格紀錄
+#   - 數千個食譜，每個 5–40 項，其中一部分項目使用同一位使用者較早建立的食譜作為子食譜
+#   - 產品與訂單 (訂單經由 app.orders.ingest 寫入，每日銷售彙總同時建立)
+# 資料以 Core 批次 INSERT 寫入並指定 id，最後重新彙總最新價格、食譜快照與產品成本，與正式環境的狀態一致。
+# 同一個種子與規模一定產生相同的資料 (時間以固定的基準日計算，不使用目前時間)。
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+
+from app import db
+from app.costing import recompute_stale_products
+from app.models import Ingredient, IngredientPrice, Product, Recipe, RecipeItem, User, refresh_price_aggregates
+from app.nutrition_cache import get_nutrition_cache
+from app.orders.ingest import ingest_orders
+from app.recipe_snapshots import recompute_stale_recipes
+
+# 資料規模
+SCALES = {
+    'small': {
+        'users': 2, 'tfda_ingredients': 300, 'user_ingredients': 20, 'priced_ingredients': 60,
+        'prices_per_ingredient': 12, 'recipes': 200, 'products': 80, 'orders': 1000,
+    },
+    'medium': {
+        'users': 5, 'tfda_ingredients': 2200, 'user_ingredients': 60, 'priced_ingredients': 300,
+        'prices_per_ingredient': 40, 'recipes': 3000, 'products': 1000, 'orders': 20000,
+    },
+    'large': {
+        'users': 10, 'tfda_ingredients': 2200, 'user_ingredients': 120, 'priced_ingredients': 600,
+        'prices_per_ingredient': 80, 'recipes': 12000, 'products': 4000, 'orders': 100000,
+    },
+}
+
+# 食譜項目數的範圍與使用子食譜的比例
+MIN_ITEMS, MAX_ITEMS = 5, 40
+SUB_RECIPE_RATIO = 0.05
+# 價格紀錄與訂單的時間以此為基準往前推
+BASE_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+BENCH_PASSWORD = 'benchmark'
+
+INSERT_CHUNK_SIZE = 5000
+
+TFDA_ITEMS = {
+    '熱量': 'calories_kcal', '粗蛋白': 'protein_g', '粗脂肪': 'fat_g', '飽和脂肪': 'saturated_fat_g',
+    '反式脂肪': 'trans_fat_g', '總碳水化合物': 'carbohydrate_g', '糖質總量': 'sugar_g', '鈉': 'sodium_mg',
+}
+_NAME_PARTS = (
+    ('低筋', '高筋', '全脂', '無鹽', '有鹽', '冷凍', '乾燥', '新鮮', '即溶', '調味', '無糖', '原味'),
+    ('麵粉', '奶油', '鮮奶', '砂糖', '雞蛋', '可可粉', '杏仁', '核桃', '抹茶粉', '乳酪', '鮮奶油', '香草莢',
+     '紅豆', '芋頭', '蜂蜜', '黑糖', '燕麥', '葡萄乾', '蔓越莓', '芝麻', '花生', '椰子粉', '玉米粉', '酵母'),
+)
+_UNITS = (('kg', 1), ('g', 500), ('lb', 2), ('L', 1), ('ml', 1000), ('盒', 1))
+
+
+class SyntheticDataset:
+    """產生合成資料集；generate() 必須在 app context 中呼叫，資料庫應為空的。"""
+
+    def __init__(self, scale='medium', seed=42):
+        self.scale = scale
+        self.params = SCALES[scale]
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.tfda_records = []
+        self.user_ids = []
+        self.recipe_ids_by_user = {}
+        self.product_ids_by_user = {}
+        self.ingredient_ids_by_user = {}
+
+    def generate(self):
+        """寫入所有資料並 commit，回傳各資料表的筆數。"""
+        counts = {}
+        counts['users'] = self._users()
+        counts['ingredients'] = self._ingredients()
+        counts['ingredient_prices'] = self._prices()
+        counts['recipes'], counts['recipe_items'] = self._recipes()
+        counts['products'] = self._products()
+        db.session.commit()
+
+        refresh_price_aggregates()
+        db.session.commit()
+        recompute_stale_recipes()
+        recompute_stale_products()
+        counts['orders'] = self._orders()
+        cache = get_nutrition_cache()
+        if cache is not None:
+            cache.clear()
+        return counts
+
+    def _insert(self, model, rows):
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            db.session.execute(insert(model), rows[start:start + INSERT_CHUNK_SIZE])
+        return len(rows)
+
+    def _nutrients(self):
+        rnd = self.random
+        fat = round(rnd.uniform(0, 80), 1)
+        return {
+            'calories_kcal': round(rnd.uniform(10, 900), 1),
+            'protein_g': round(rnd.uniform(0, 40), 1),
+            'fat_g': fat,
+            'saturated_fat_g': round(fat * rnd.uniform(0, 0.6), 1),
+            'trans_fat_g': round(rnd.choice((0, 0, 0, rnd.uniform(0, 1.5))), 2),
+            'carbohydrate_g': round(rnd.uniform(0, 90), 1),
+            'sugar_g': round(rnd.uniform(0, 60), 1),
+            'sodium_mg': round(rnd.uniform(0, 1200), 1),
+        }
+
+    def _name(self, index):
+        first, second = _NAME_PARTS
+        return f'{self.random.choice(first)}{self.random.choice(second)} {index}'
+
+    # --- 各資料表 ---
+
+    def _users(self):
+        from werkzeug.security import generate_password_hash
+        # 所有使用者共用同一組密碼，雜湊只計算一次
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        self.user_ids = list(range(1, self.params['users'] + 1))
+        return self._insert(User, [
+            {'id': user_id, 'username': f'bench{user_id}', 'email': f'bench{user_id}@example.com',
+             'password_hash': password_hash}
+            for user_id in self.user_ids
+        ])
+
+    def _ingredients(self):
+        rows = []
+        for index in range(1, self.params['tfda_ingredients'] + 1):
+            nutrients = self._nutrients()
+            record = {'tfda_id': f'B{index:06d}', 'food_name': self._name(index), **nutrients}
+            self.tfda_records.append(record)
+            rows.append({'id': index, 'source': 'TFDA', 'cost_per_unit': 0, 'unit_name': 'g', **record})
+        next_id = len(rows) + 1
+        for user_id in self.user_ids:
+            own = []
+            for _ in range(self.params['user_ingredients']):
+                rows.append({
+                    'id': next_id, 'food_name': self._name(next_id), 'source': 'USER', 'user_id': user_id,
+                    'cost_per_unit': round(self.random.uniform(0.01, 2), 3), 'unit_name': 'g', **self._nutrients(),
+                })
+                own.append(next_id)
+                next_id += 1
+            self.ingredient_ids_by_user[user_id] = own
+        return self._insert(Ingredient, rows)
+
+    def _prices(self):
+        """每位使用者對常用食材的長期價格紀錄 (每隔數天一筆，價格隨時間小幅波動)。"""
+        rnd = self.random
+        rows = []
+        tfda_ids = range(1, self.params['tfda_ingredients'] + 1)
+        for user_id in self.user_ids:
+            priced = rnd.sample(tfda_ids, min(self.params['priced_ingredients'], len(tfda_ids)))
+            self.ingredient_ids_by_user[user_id] = priced + self.ingredient_ids_by_user[user_id]
+            for ingredient_id in priced:
+                unit, quantity = rnd.choice(_UNITS)
+                price = rnd.uniform(30, 800)
+                date = BASE_DATE
+                for _ in range(self.params['prices_per_ingredient']):
+                    date -= timedelta(days=rnd.randint(2, 10))
+                    price = max(1.0, price * rnd.uniform(0.92, 1.08))
+                    rows.append({
+                        'ingredient_id': ingredient_id, 'user_id': user_id, 'source': rnd.choice(('Manual', '市場', '網購')),
+                        'price': round(price, 1), 'quantity': quantity, 'unit': unit, 'purchase_date': date,
+                    })
+        return self._insert(IngredientPrice, rows)
+
+    def _recipes(self):
+        rnd = self.random
+        recipes, items = [], []
+        for recipe_id in range(1, self.params['recipes'] + 1):
+            user_id = self.user_ids[(recipe_id - 1) % len(self.user_ids)]
+            own_recipes = self.recipe_ids_by_user.setdefault(user_id, [])
+            recipes.append({
+                'id': recipe_id, 'recipe_name': f'食譜 {recipe_id}', 'user_id': user_id,
+                'serving_weight_g': 100.0, 'servings_count': rnd.randint(1, 24),
+                'final_weight_g': round(rnd.uniform(300, 3000), 1) if rnd.random() < 0.5 else None,
+                'label_options': {},
+            })
+            pantry = self.ingredient_ids_by_user[user_id]
+            for ingredient_id in rnd.sample(pantry, min(rnd.randint(MIN_ITEMS, MAX_ITEMS), len(pantry))):
+                # 只引用較早建立的食譜作為子食譜，不會形成循環
+                if own_recipes and rnd.random() < SUB_RECIPE_RATIO:
+                    items.append({'recipe_id': recipe_id, 'sub_recipe_id': rnd.choice(own_recipes),
+                                  'quantity_g': round(rnd.uniform(50, 400), 1)})
+                else:
+                    items.append({'recipe_id': recipe_id, 'ingredient_id': ingredient_id,
+                                  'quantity_g': round(rnd.uniform(1, 500), 1)})
+            own_recipes.append(recipe_id)
+        return self._insert(Recipe, recipes), self._insert(RecipeItem, items)
+
+    def _products(self):
+        rnd = self.random
+        rows = []
+        for product_id in range(1, self.params['products'] + 1):
+            user_id = self.user_ids[(product_id - 1) % len(self.user_ids)]
+            rows.append({
+                'id': product_id, 'product_name': f'產品 {product_id}', 'user_id': user_id,
+                'recipe_id': rnd.choice(self.recipe_ids_by_user[user_id]),
+                'selling_price': rnd.randint(40, 600), 'stock_quantity': rnd.randint(0, 200),
+                'batch_size': rnd.randint(1, 30), 'bake_power_w': rnd.choice((0, 1500, 3000)),
+                'bake_time_min': rnd.randint(0, 60), 'production_time_hr': round(rnd.uniform(0, 4), 1),
+            })
+            self.product_ids_by_user.setdefault(user_id, []).append(product_id)
+        return self._insert(Product, rows)
+
+    def _orders(self):
+        rnd = self.random
+        count = 0
+        for user_id in self.user_ids:
+            product_ids = self.product_ids_by_user.get(user_id)
+            if not product_ids:
+                continue
+            orders = []
+            for index in range(self.params['orders'] // len(self.user_ids)):
+                order_date = BASE_DATE - timedelta(minutes=rnd.randint(0, 180 * 24 * 60))
+                orders.append({
+                    'idempotency_key': f'bench-{user_id}-{index}',
+                    'order_date': order_date.isoformat(),
+                    'items': [{'product_id': product_id, 'quantity': rnd.randint(1, 4)}
+                              for product_id in rnd.sample(product_ids, min(rnd.randint(1, 5), len(product_ids)))],
+                })
+            for start in range(0, len(orders), 5000):
+                count += len(ingest_orders(orders[start:start + 5000], user_id).created)
+        return count
+
+    # --- TFDA 匯出檔 ---
+
+    def write_tfda_export(self, path, changed_ratio=0.0):
+        """
+        把食材目錄寫成 TFDA 匯出格式的 JSON (每個分析項一列)。
+        changed_ratio 為內容改變的食材比例，用來模擬資料更新後的重新同步。
+        """
+        rnd = random.Random(self.seed + 1)
+        rows = []
+        for record in self.tfda_records:
+            changed = rnd.random() < changed_ratio
+            for item, column in TFDA_ITEMS.items():
+                value = record[column] * (1.1 if changed else 1)
+                rows.append({'整合編號': record['tfda_id'], '樣品名稱': record['food_name'],
+                             '分析項': item, '每100克含量': f'{value:.2f}'})
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump(rows, fp, ensure_ascii=False)
+        return len(self.tfda_records)
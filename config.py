@@ -3,6 +3,16 @@ import os
 # 取得專案的根目錄路徑
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def _optional_limit(value, default):
+    """環境變數中的上限值：未設定時為 default，'none' 或 '0' 表示不限制 (None)。"""
+    if not value:
+        return default
+    if value.strip().lower() == 'none':
+        return None
+    return int(value) or None
+
+
 class Config:
     """
     應用程式的基礎設定類別。
@@ -14,7 +24,100 @@ class Config:
     # 資料庫的連接 URI
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
+
+    # --- 資料庫引擎設定檔 (見 app/database.py) ---
+    # sqlite 或 server；未設定時依連線字串判斷
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or None
+    # 唯讀副本的連線字串；GET 請求的查詢會送到這裡
+    DATABASE_READ_URI = os.environ.get('DATABASE_READ_URI') or None
+    # SQLite 檔案資料庫：等候寫入鎖的毫秒數、記憶體對映大小 (位元組) 與同步模式
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    # 設為 1 時把 SQLite 檔案資料庫切換為 WAL 模式 (讀取不會擋住寫入)；
+    # journal_mode 會永久寫入資料庫檔案並產生 -wal / -shm 檔，因此預設不切換
+    SQLITE_WAL = os.environ.get('SQLITE_WAL') == '1'
+    # SQLite 檔案資料庫沒有副本時，GET 請求改用同一檔案的唯讀連線 (設為 0 關閉)
+    SQLITE_READ_ONLY_CONNECTION = (os.environ.get('SQLITE_READ_ONLY_CONNECTION') or '1') != '0'
+    # 伺服器資料庫的連線池大小、額外連線數、等候秒數與連線回收秒數
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 10)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 20)
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800)
         
+    # TFDA 匯入程式完成後會更新此檔案的修改時間，通知執行中的 app 重新載入食材搜尋索引
+    TFDA_IMPORT_STAMP = os.environ.get('TFDA_IMPORT_STAMP') or os.path.join(basedir, 'tfda_import.stamp')
+
+    # 食材自動完成查詢結果的快取秒數
+    AUTOCOMPLETE_CACHE_TTL = float(os.environ.get('AUTOCOMPLETE_CACHE_TTL') or 30.0)
+    # 自動完成索引的跨行程失效標記 (作法同 NUTRITION_CACHE_STAMP)：提交食材異動的行程更新此檔案，
+    # 其他行程查詢時發現改變就重新載入使用者的食材索引。設為空字串停用 (只適用於單一行程)
+    AUTOCOMPLETE_STAMP = os.environ.get('AUTOCOMPLETE_STAMP', os.path.join(basedir, 'autocomplete.stamp'))
+
+    # 食譜營養與成本計算快取最多保留的食譜數
+    NUTRITION_CACHE_SIZE = int(os.environ.get('NUTRITION_CACHE_SIZE') or 1024)
+    # 快取存在各個行程的記憶體中，ORM 寫入事件只會讓執行寫入的行程失效；
+    # 提交異動的行程會更新此檔案的修改時間，其他行程 (同一台機器上的 worker) 查詢時發現改變就清空快取。
+    # 設為空字串停用 (只適用於單一行程)；多台機器分別執行時需指向共用的檔案系統
+    NUTRITION_CACHE_STAMP = os.environ.get('NUTRITION_CACHE_STAMP', os.path.join(basedir, 'nutrition_cache.stamp'))
+    # 食材價格試算 (what-if) 快取成本模型的使用者數
+    WHAT_IF_MODEL_CACHE_SIZE = int(os.environ.get('WHAT_IF_MODEL_CACHE_SIZE') or 16)
+
+    # 食材或價格變動後，受影響的產品數不超過此值時在同一個交易中立即重新計算成本，
+    # 否則先標記為待計算
+    COST_RECOMPUTE_INLINE_LIMIT = int(os.environ.get('COST_RECOMPUTE_INLINE_LIMIT') or 200)
+    # 待計算的產品數達到此值時改用多個行程平行計算；行程數預設為 CPU 核心數
+    COST_RECOMPUTE_POOL_THRESHOLD = int(os.environ.get('COST_RECOMPUTE_POOL_THRESHOLD') or 2000)
+    COST_RECOMPUTE_WORKERS = int(os.environ.get('COST_RECOMPUTE_WORKERS') or 0) or None
+    # 一次 commit 中被儲存的食譜不超過此值時立即重算營養與成本快照，否則先標記為過期
+    RECIPE_SNAPSHOT_INLINE_LIMIT = int(os.environ.get('RECIPE_SNAPSHOT_INLINE_LIMIT') or 200)
+
+    # --- SQL 統計 (見 app/sql_instrumentation.py) ---
+    # 端點預設的查詢次數預算 (環境變數設為 none 或 0 時為 None，表示不限制)；
+    # 個別端點可在 SQL_QUERY_BUDGETS 中以端點名稱覆寫
+    SQL_QUERY_BUDGET = _optional_limit(os.environ.get('SQL_QUERY_BUDGET'), 50)
+    SQL_QUERY_BUDGETS = {}
+    # 同一請求中同一形狀的查詢出現這麼多次時視為疑似 N+1
+    SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD') or 5)
+    # 超過預算時引發例外而不只是記錄警告 (測試時開啟)
+    SQL_STRICT_QUERY_BUDGET = os.environ.get('SQL_STRICT_QUERY_BUDGET') == '1'
+    # 在回應中加上 Server-Timing 標頭 (查詢次數與資料庫耗時)
+    SQL_SERVER_TIMING = (os.environ.get('SQL_SERVER_TIMING') or '1') != '0'
+
+    # --- 效能指標 (見 app/metrics.py) ---
+    # 多個 worker 行程時各行程累計值的存放目錄 (每次部署前清空)；未設定時 /metrics 只回報目前行程
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or None
+    # 各行程寫出累計值的間隔秒數
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL') or 5.0)
+    # Prometheus 抓取 /metrics 時使用的 Authorization: Bearer <token>；未設定時只有管理員登入後可存取
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+    # 管理員帳號 (以逗號分隔的使用者名稱)，可使用 /admin 頁面
+    ADMIN_USERNAMES = frozenset(filter(None, (os.environ.get('ADMIN_USERNAMES') or '').split(',')))
+
+    # --- 單一請求剖析 (見 app/profiling.py) ---
+    # 管理員以 X-Profile 標頭或 _profile 參數觸發；設為 0 完全關閉
+    PROFILER_ENABLED = (os.environ.get('PROFILER_ENABLED') or '1') != '0'
+    # 剖析結果的存放目錄 (預設為 instance/profiles) 與保留的份數
+    PROFILER_DIR = os.environ.get('PROFILER_DIR') or None
+    PROFILER_MAX_FILES = int(os.environ.get('PROFILER_MAX_FILES') or 50)
+
+    # 食材價格列表中「近期最低／平均每公克成本」統計的天數
+    PRICE_SUMMARY_DAYS = int(os.environ.get('PRICE_SUMMARY_DAYS') or 90)
+
+    # 列表 API (食譜、產品、價格) 每頁的預設筆數與上限
+    LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE') or 50)
+    LIST_PAGE_SIZE_MAX = int(os.environ.get('LIST_PAGE_SIZE_MAX') or 200)
+
+    # 訂單批次寫入 API：每次請求最多的訂單數，以及每批 (每個交易) 寫入的訂單數
+    ORDER_INGEST_MAX_ORDERS = int(os.environ.get('ORDER_INGEST_MAX_ORDERS') or 5000)
+    ORDER_INGEST_BATCH_SIZE = int(os.environ.get('ORDER_INGEST_BATCH_SIZE') or 500)
+
+    # 銷售報表的營業日以此時區的日期計算
+    SALES_TIMEZONE = os.environ.get('SALES_TIMEZONE') or 'Asia/Taipei'
+    # 銷售報表未指定日期範圍時顯示最近幾天
+    SALES_REPORT_DAYS = int(os.environ.get('SALES_REPORT_DAYS') or 30)
+
     # 關閉 SQLAlchemy 的事件通知系統以節省資源
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
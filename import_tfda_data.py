@@ -1,96 +1,358 @@
-# --- 100% 完整程式碼 (最終版 v4 - 正確欄位對應版) ---
+# --- 100% 完整程式碼 (v6 - 串流匯入版) ---
+# 用法：
+#   python import_tfda_data.py                      從 TFDA API 串流下載並同步
+#   python import_tfda_data.py --file export.json   讀取本機匯出檔
+#   cat export.json | python import_tfda_data.py --file -
 
 import requests
-import pandas as pd
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
 import sqlite3
+import sys
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from config import Config
+from app.metrics import REGISTRY, timed
 
 TFDA_API_URL = "https://data.fda.gov.tw/opendata/exportDataList.do?method=openData&InfoId=20"
 DB_FILE = 'app.db'
 
-def import_data():
-    print("步驟 1/3: 開始從 API 獲取最新的食品營養資料...")
-    try:
+# 每批寫入暫存表的筆數
+CHUNK_SIZE = 500
+
+# --- 修改點：使用最新的欄位名稱來建立對應 ---
+ITEM_COLUMNS = {
+    '熱量': 'calories_kcal', '粗蛋白': 'protein_g', '粗脂肪': 'fat_g',
+    '飽和脂肪': 'saturated_fat_g', '反式脂肪': 'trans_fat_g',
+    '總碳水化合物': 'carbohydrate_g', '糖質總量': 'sugar_g', '鈉': 'sodium_mg'
+}
+
+NUTRIENT_COLUMNS = [
+    'calories_kcal', 'protein_g', 'fat_g', 'saturated_fat_g',
+    'trans_fat_g', 'carbohydrate_g', 'sugar_g', 'sodium_mg'
+]
+
+
+def content_hash(food_name, *nutrients):
+    """以名稱與營養素數值計算內容雜湊，用來判斷資料是否真的有變動。"""
+    parts = [food_name or ''] + [f"{float(value or 0):.6f}" for value in nutrients]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def iter_json_array(fp, chunk_size=64 * 1024):
+    """
+    逐一讀出 JSON 陣列中的物件 (增量解析)。
+    一次只讀入 chunk_size 個字元，緩衝區最多只保留一個尚未讀完的物件，
+    因此記憶體用量與整份資料的大小無關。
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # 跳過空白與分隔的逗號
+        while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ',')):
+            position += 1
+
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("TFDA 資料格式錯誤：最外層必須是 JSON 陣列")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # 物件可能剛好在緩衝區結尾被截斷 (例如數字)，尚未讀到結尾時再多讀一些確認
+                if end < len(buffer) or eof:
+                    yield obj
+                    position = end
+                    continue
+        elif eof:
+            raise ValueError("TFDA 資料格式錯誤：JSON 陣列未正確結束")
+
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def group_records(rows):
+    """
+    將 TFDA 的原始資料列 (每個分析項一列) 依「整合編號」分組，組成每項食材一筆的紀錄。
+    TFDA 匯出資料中同一食材的資料列是連續的，因此只需保留目前這一組；
+    換到下一個編號時就輸出完成的紀錄。重複的分析項取平均值 (與 pivot_table 相同)，
+    缺少的分析項為 None，寫入時會與先前的資料合併後再補 0。
+    """
+    current_id = None
+    current_name = None
+    sums = {}
+    counts = {}
+
+    def finish():
+        record = {'tfda_id': current_id, 'food_name': current_name}
+        for item, column in ITEM_COLUMNS.items():
+            record[column] = sums[item] / counts[item] if counts.get(item) else None
+        return record
+
+    for row in rows:
+        row = {str(key).strip(): value for key, value in row.items()}
+        item = row.get('分析項')
+        if item not in ITEM_COLUMNS:
+            continue
+        tfda_id = str(row.get('整合編號'))
+        if tfda_id != current_id:
+            if current_id is not None:
+                yield finish()
+            current_id, current_name = tfda_id, row.get('樣品名稱')
+            sums, counts = {}, {}
+        try:
+            value = float(row.get('每100克含量'))
+        except (TypeError, ValueError):
+            value = 0.0
+        if math.isnan(value):
+            value = 0.0
+        sums[item] = sums.get(item, 0.0) + value
+        counts[item] = counts.get(item, 0) + 1
+
+    if current_id is not None:
+        yield finish()
+
+
+@contextmanager
+def open_source(path=None):
+    """
+    開啟 TFDA 資料來源 (文字串流)：未指定時以串流方式下載 API 資料，
+    '-' 代表標準輸入，其他則為本機檔案路徑。
+    """
+    if path is None:
         headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(TFDA_API_URL, headers=headers)
+        response = requests.get(TFDA_API_URL, headers=headers, stream=True)
         response.raise_for_status()
-        df = pd.DataFrame(response.json())
-        print(f" -> 資料獲取成功！已讀取 {len(df)} 筆原始資料。")
+        response.raw.decode_content = True
+        try:
+            yield io.TextIOWrapper(response.raw, encoding='utf-8-sig')
+        finally:
+            response.close()
+    elif path == '-':
+        yield io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig')
+    else:
+        with open(path, encoding='utf-8-sig') as fp:
+            yield fp
+
+
+# 資料是邊下載邊寫入暫存表，這個階段的耗時包含下載與解析
+@timed('tfda_import.stage')
+def _stage_records(conn, records):
+    """
+    將紀錄分批以 executemany 寫入暫存表，回傳寫入筆數。
+    同一編號再次出現時與先前的資料合併 (只覆蓋這次有值的營養素)。
+    """
+    columns = ['tfda_id', 'food_name'] + NUTRIENT_COLUMNS
+    insert_sql = f"""
+        INSERT INTO tfda_staging ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT(tfda_id) DO UPDATE SET
+            {', '.join(f'{column} = COALESCE(excluded.{column}, {column})' for column in NUTRIENT_COLUMNS)}
+    """
+    staged = 0
+    batch = []
+    for record in records:
+        batch.append(tuple(record.get(column) for column in columns))
+        if len(batch) >= CHUNK_SIZE:
+            conn.executemany(insert_sql, batch)
+            staged += len(batch)
+            batch = []
+            print(f" -> 已暫存 {staged} 筆資料...")
+    if batch:
+        conn.executemany(insert_sql, batch)
+        staged += len(batch)
+    return staged
+
+
+@timed('tfda_import.sync')
+def sync_records(conn, records):
+    """
+    在單一交易中把紀錄同步到 ingredients：
+    先批次寫入暫存表，再以 INSERT ... ON CONFLICT(tfda_id) DO UPDATE 一次完成新增與更新，
+    內容雜湊沒有改變的食材完全不會被寫入。回傳各類筆數的統計。
+    """
+    conn.create_function('tfda_content_hash', 1 + len(NUTRIENT_COLUMNS), content_hash, deterministic=True)
+    nutrient_list = ', '.join(NUTRIENT_COLUMNS)
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"""
+            CREATE TEMP TABLE tfda_staging (
+                tfda_id TEXT PRIMARY KEY,
+                food_name TEXT,
+                {', '.join(f'{column} REAL' for column in NUTRIENT_COLUMNS)},
+                content_hash TEXT
+            )
+        """)
+        _stage_records(conn, records)
+        # 所有批次都寫入後，缺少的營養素補 0 並計算內容雜湊
+        filled = [f'COALESCE({column}, 0)' for column in NUTRIENT_COLUMNS]
+        conn.execute(f"""
+            UPDATE tfda_staging SET
+                {', '.join(f'{column} = {value}' for column, value in zip(NUTRIENT_COLUMNS, filled))},
+                content_hash = tfda_content_hash(food_name, {', '.join(filled)})
+        """)
+
+        counts = {'staged': conn.execute("SELECT COUNT(*) FROM tfda_staging").fetchone()[0]}
+        counts['inserted'], counts['updated'], counts['unchanged'] = conn.execute("""
+            SELECT
+                COALESCE(SUM(i.id IS NULL), 0),
+                COALESCE(SUM(i.id IS NOT NULL AND i.content_hash IS NOT s.content_hash), 0),
+                COALESCE(SUM(i.id IS NOT NULL AND i.content_hash IS s.content_hash), 0)
+            FROM tfda_staging AS s
+            LEFT JOIN ingredients AS i ON i.tfda_id = s.tfda_id
+        """).fetchone()
+
+        # 直接使用內容有變動的食材的食譜，加上 (以遞迴 CTE 沿子食譜往上找) 間接使用它們的食譜
+        conn.execute("""
+            CREATE TEMP TABLE tfda_affected_recipes AS
+            WITH RECURSIVE affected(recipe_id) AS (
+                SELECT ri.recipe_id FROM recipe_items AS ri
+                JOIN ingredients AS i ON i.id = ri.ingredient_id
+                JOIN tfda_staging AS s ON s.tfda_id = i.tfda_id
+                WHERE i.content_hash IS NOT s.content_hash
+                UNION
+                SELECT ri.recipe_id FROM recipe_items AS ri
+                JOIN affected AS a ON ri.sub_recipe_id = a.recipe_id
+            )
+            SELECT recipe_id FROM affected
+        """)
+        # 這些食譜的營養與成本快照標記為過期 (與 app.recipe_snapshots.mark_recipes_stale 相同，不改變 updated_at)
+        counts['stale_recipes'] = conn.execute("""
+            UPDATE recipes SET snapshot_computed_at = NULL
+            WHERE snapshot_computed_at IS NOT NULL
+              AND id IN (SELECT recipe_id FROM tfda_affected_recipes)
+        """).rowcount
+        # 這些食譜的下游產品，成本標記為待重新計算 (食材 → 食譜 → 產品)
+        counts['stale_products'] = conn.execute("""
+            UPDATE products SET cost_computed_at = NULL
+            WHERE recipe_id IN (SELECT recipe_id FROM tfda_affected_recipes)
+        """).rowcount
+
+        conn.execute(f"""
+            INSERT INTO ingredients (
+                tfda_id, food_name, source, created_at, updated_at,
+                {nutrient_list}, cost_per_unit, unit_name, content_hash
+            )
+            SELECT tfda_id, food_name, 'TFDA', ?, ?, {nutrient_list}, 0, 'g', content_hash
+            FROM tfda_staging WHERE true
+            ON CONFLICT(tfda_id) DO UPDATE SET
+                food_name = excluded.food_name,
+                {', '.join(f'{column} = excluded.{column}' for column in NUTRIENT_COLUMNS)},
+                content_hash = excluded.content_hash,
+                updated_at = excluded.updated_at
+            WHERE ingredients.content_hash IS NOT excluded.content_hash
+        """, (now, now))
+
+        # 已不在 TFDA 資料中的食材：沒有被食譜或價格紀錄引用的直接移除，有引用的保留
+        removed_condition = """
+            source = 'TFDA' AND tfda_id IS NOT NULL
+            AND tfda_id NOT IN (SELECT tfda_id FROM tfda_staging)
+        """
+        referenced_condition = """
+            (id IN (SELECT ingredient_id FROM recipe_items)
+             OR id IN (SELECT ingredient_id FROM ingredient_prices))
+        """
+        counts['retained'] = conn.execute(
+            f"SELECT COUNT(*) FROM ingredients WHERE {removed_condition} AND {referenced_condition}"
+        ).fetchone()[0]
+        counts['removed'] = conn.execute(
+            f"DELETE FROM ingredients WHERE {removed_condition} AND NOT {referenced_condition}"
+        ).rowcount
+
+        conn.execute("DROP TABLE tfda_affected_recipes")
+        conn.execute("DROP TABLE tfda_staging")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return counts
+
+
+def import_data(path=None, db_file=DB_FILE, recompute_costs=True):
+    # 各階段耗時寫入 app 的多行程指標目錄，由 /metrics 一併匯出
+    REGISTRY.configure(Config.METRICS_MULTIPROC_DIR)
+    try:
+        _import_data(path, db_file, recompute_costs)
+    finally:
+        REGISTRY.flush()
+
+def _import_data(path, db_file, recompute_costs):
+    source_name = 'TFDA API' if path is None else ('標準輸入' if path == '-' else path)
+    print(f"步驟 1/2: 開始以串流方式讀取 {source_name} 的食品營養資料，並依整合編號分組...")
+    print(f"步驟 2/2: 邊讀取邊分批同步到資料庫 '{db_file}'...")
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        with open_source(path) as fp:
+            counts = sync_records(conn, group_records(iter_json_array(fp)))
     except Exception as e:
-        print(f"處理 API 回應時發生錯誤: {e}")
-        return
-
-    print("步驟 2/3: 開始進行資料重塑 (Pivot) 與清洗...")
-    
-    df.columns = df.columns.str.strip()
-
-    # --- 修改點：使用您提供的、最新的、正確的分析項名稱 ---
-    nutrient_items = [
-        '熱量', '粗蛋白', '粗脂肪', '飽和脂肪', 
-        '反式脂肪', '總碳水化合物', '糖質總量', '鈉'
-    ]
-    df_filtered = df[df['分析項'].isin(nutrient_items)].copy()
-    
-    df_filtered.loc[:, '每100克含量'] = pd.to_numeric(df_filtered['每100克含量'], errors='coerce').fillna(0)
-
-    df_pivoted = df_filtered.pivot_table(
-        index=['整合編號', '樣品名稱'], 
-        columns='分析項', 
-        values='每100克含量'
-    ).reset_index()
-
-    # --- 修改點：使用最新的欄位名稱來建立對應 ---
-    column_mapping = {
-        '整合編號': 'tfda_id', '樣品名稱': 'food_name', '熱量': 'calories_kcal',
-        '粗蛋白': 'protein_g', '粗脂肪': 'fat_g', '飽和脂肪': 'saturated_fat_g',
-        '反式脂肪': 'trans_fat_g', '總碳水化合物': 'carbohydrate_g',
-        '糖質總量': 'sugar_g', '鈉': 'sodium_mg'
-    }
-    df_pivoted.rename(columns=column_mapping, inplace=True)
-
-    for db_col in column_mapping.values():
-        if db_col not in df_pivoted.columns:
-            df_pivoted[db_col] = 0
-            
-    print(" -> 資料重塑與清洗完成！")
-
-    print(f"步驟 3/3: 開始將 {len(df_pivoted)} 筆資料同步到資料庫 '{DB_FILE}'...")
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    update_count = 0
-    insert_count = 0
-    for index, row in df_pivoted.iterrows():
-        cursor.execute("SELECT id FROM ingredients WHERE tfda_id = ?", (str(row['tfda_id']),))
-        result = cursor.fetchone()
-        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-
-        data_tuple_insert = (
-            str(row['tfda_id']), row.get('food_name'), now, now,
-            row.get('calories_kcal', 0), row.get('protein_g', 0), row.get('fat_g', 0),
-            row.get('saturated_fat_g', 0), row.get('trans_fat_g', 0), row.get('carbohydrate_g', 0),
-            row.get('sugar_g', 0), row.get('sodium_mg', 0), 0
-        )
-        data_tuple_update = (
-            row.get('food_name'), row.get('calories_kcal', 0), row.get('protein_g', 0),
-            row.get('fat_g', 0), row.get('saturated_fat_g', 0), row.get('trans_fat_g', 0),
-            row.get('carbohydrate_g', 0), row.get('sugar_g', 0), row.get('sodium_mg', 0),
-            now, str(row['tfda_id'])
-        )
-
-        if result:
-            update_count += 1
-            cursor.execute("UPDATE ingredients SET food_name=?, calories_kcal=?, protein_g=?, fat_g=?, saturated_fat_g=?, trans_fat_g=?, carbohydrate_g=?, sugar_g=?, sodium_mg=?, updated_at=? WHERE tfda_id = ?", data_tuple_update)
-        else:
-            insert_count += 1
-            cursor.execute("INSERT INTO ingredients (tfda_id, food_name, source, created_at, updated_at, calories_kcal, protein_g, fat_g, saturated_fat_g, trans_fat_g, carbohydrate_g, sugar_g, sodium_mg, cost_per_unit) VALUES (?, ?, 'TFDA', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", data_tuple_insert)
-        
-        if (index + 1) % 100 == 0:
-            print(f" -> 已處理 {index + 1} / {len(df_pivoted)} 筆資料...")
-    conn.commit()
-    conn.close()
+        # sync_records 在單一交易中執行，發生錯誤時資料庫不會有任何變動
+        print(f"匯入 TFDA 資料時發生錯誤，已取消本次同步: {e}", file=sys.stderr)
+        # 以非 0 的結束碼結束，排程或 CI 才能察覺同步失敗
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    if counts['inserted'] or counts['updated'] or counts['removed']:
+        touch_import_stamp()
     print("\n匯入作業完成！")
-    print(f"總共新增了 {insert_count} 筆新食材。")
-    print(f"總共更新了 {update_count} 筆現有食材。")
+    print(f"共讀取 {counts['staged']} 筆食材資料。")
+    print(f"總共新增了 {counts['inserted']} 筆新食材。")
+    print(f"總共更新了 {counts['updated']} 筆內容有變動的食材。")
+    print(f"共有 {counts['unchanged']} 筆食材內容未變動，未寫入資料庫。")
+    print(f"總共移除了 {counts['removed']} 筆已不在 TFDA 資料中的食材。")
+    if counts['retained']:
+        print(f"另有 {counts['retained']} 筆已下架的食材仍被食譜或價格紀錄使用，予以保留。")
+    if counts['stale_recipes']:
+        print(f"共有 {counts['stale_recipes']} 個食譜使用到變動的食材，營養與成本快照已標記為過期。")
+    if counts['stale_products']:
+        print(f"共有 {counts['stale_products']} 項產品使用到變動的食材，成本已標記為待重新計算。")
+        if recompute_costs:
+            recompute_product_costs(db_file)
+
+@timed('tfda_import.recompute_costs')
+def recompute_product_costs(db_file):
+    """以 app 的成本計算重新計算待計算的產品 (數量多時會以多個行程平行計算)。"""
+    from app import create_app
+    from app.costing import recompute_stale_products
+
+    class ImportConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(db_file)
+
+    app = create_app(ImportConfig)
+    with app.app_context():
+        count = recompute_stale_products()
+    print(f"已重新計算 {count} 項產品的成本。")
+
+def touch_import_stamp():
+    """更新匯入標記檔的時間，讓執行中的 app 重新載入食材搜尋索引。"""
+    with open(Config.TFDA_IMPORT_STAMP, 'a'):
+        os.utime(Config.TFDA_IMPORT_STAMP, None)
 
 if __name__ == '__main__':
-    import_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='同步 TFDA 食品營養成分資料庫到 ingredients 資料表。')
+    parser.add_argument('--file', help="改為讀取本機的 TFDA 匯出 JSON 檔案，'-' 代表標準輸入")
+    parser.add_argument('--db', default=DB_FILE, help=f"SQLite 資料庫檔案 (預設: {DB_FILE})")
+    parser.add_argument('--no-recompute', action='store_true',
+                        help="只將受影響產品的成本標記為待計算，不立即重新計算 (之後可執行 flask products recompute-costs)")
+    args = parser.parse_args()
+    import_data(args.file, args.db, recompute_costs=not args.no_recompute)
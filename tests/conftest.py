@@ -0,0 +1,38 @@
+# tests/conftest.py
+import os
+
+import pytest
+
+from app import create_app, db
+from config import Config
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        TFDA_IMPORT_STAMP = str(tmp_path / 'tfda_import.stamp')
+        NUTRITION_CACHE_STAMP = str(tmp_path / 'nutrition_cache.stamp')
+        AUTOCOMPLETE_STAMP = str(tmp_path / 'autocomplete.stamp')
+        METRICS_MULTIPROC_DIR = None
+        PROFILER_DIR = str(tmp_path / 'profiles')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def db_path(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+
+
+@pytest.fixture
+def fixture_path():
+    return lambda name: os.path.join(FIXTURES, name)
@@ -0,0 +1,65 @@
+# tests/factories.py
+# 測試資料的建立函式 (使用者、食材、食譜、產品與價格紀錄)
+from datetime import datetime, timezone
+
+from app import db
+from app.models import Ingredient, IngredientPrice, Product, Recipe, RecipeItem, User, refresh_latest_prices
+
+
+def make_user(username='tester', **fields):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        user = User(username=username, email=f'{username}@example.com', **fields)
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def make_ingredient(user, name, cost_per_unit=0, **fields):
+    ingredient = Ingredient(food_name=name, source='USER', creator=user, cost_per_unit=cost_per_unit, **fields)
+    db.session.add(ingredient)
+    db.session.commit()
+    return ingredient
+
+
+def make_recipe(user, name, components, **fields):
+    """components 為 [(Ingredient 或 Recipe, 公克數), ...]。"""
+    recipe = Recipe(recipe_name=name, author=user, **{'servings_count': 1, **fields})
+    for component, quantity_g in components:
+        if isinstance(component, Recipe):
+            recipe.ingredients.append(RecipeItem(sub_recipe=component, quantity_g=quantity_g))
+        else:
+            recipe.ingredients.append(RecipeItem(ingredient=component, quantity_g=quantity_g))
+    db.session.add(recipe)
+    db.session.commit()
+    return recipe
+
+
+def make_product(user, recipe, name=None, **fields):
+    product = Product(product_name=name or recipe.recipe_name, creator=user, recipe=recipe,
+                      **{'batch_size': 1, 'selling_price': 0, **fields})
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def add_price(user, ingredient, price, quantity, unit='g', purchase_date=None, commit=True):
+    """新增一筆價格紀錄並更新最新價格彙總 (與新增價格頁相同的流程)。"""
+    entry = IngredientPrice(
+        ingredient=ingredient, user=user, source='Manual', price=price, quantity=quantity, unit=unit,
+        purchase_date=purchase_date or datetime.now(timezone.utc)
+    )
+    db.session.add(entry)
+    db.session.flush()
+    refresh_latest_prices({(user.id, ingredient.id)})
+    if commit:
+        db.session.commit()
+    return entry
+
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
@@ -0,0 +1,41 @@
+# tests/test_bulk_import.py
+# 食材價格批次匯入：逐列錯誤報告
+import io
+
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.models import IngredientLatestPrice, IngredientPrice, User
+from app.pricing.bulk_import import import_price_file
+
+CSV = """食材名稱,來源,購買價格,購買總數量,數量單位
+無鹽奶油,Manual,250,500,g
+低筋麵粉,全聯福利中心,"1,200",25,kg
+砂糖,Manual,abc,1,kg
+鮮奶油,Manual,inf,1,L
+雞蛋,Manual,60,-inf,個
+可可粉,Manual,120,1,把
+抹茶粉,路邊攤,300,100,g
+,,,,
+"""
+
+
+def test_bad_rows_are_reported_and_good_rows_imported(app):
+    user = User(username='tester', email='tester@example.com')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+
+    report = import_price_file(FileStorage(io.BytesIO(CSV.encode('utf-8')), filename='prices.csv'), user)
+
+    assert (report.total_rows, report.imported, report.created_ingredients) == (7, 2, 2)
+    assert report.errors == [
+        {'row': 4, 'message': '購買價格必須是數字'},
+        {'row': 5, 'message': '購買價格必須是有限的數字'},
+        {'row': 6, 'message': '購買總數量必須是有限的數字'},
+        {'row': 7, 'message': '無法辨識的單位「把」'},
+        {'row': 8, 'message': '無法辨識的來源「路邊攤」'},
+    ]
+    prices = IngredientPrice.query.order_by(IngredientPrice.id).all()
+    assert [(price.price, price.quantity, price.unit) for price in prices] == [(250, 500, 'g'), (1200, 25, 'kg')]
+    assert IngredientLatestPrice.query.count() == 2
@@ -0,0 +1,72 @@
+# tests/test_costing.py
+# 產品成本的自動重新計算 (commit 前立即計算或標記為待計算) 與 recompute_stale_products
+import pytest
+
+from app import db
+from app.costing import recompute_stale_products
+from app.models import Product
+from tests.factories import add_price, make_ingredient, make_product, make_recipe, make_user
+
+
+@pytest.fixture
+def butter(app):
+    user = make_user()
+    return make_ingredient(user, '無鹽奶油', cost_per_unit=50)
+
+
+def products_using(ingredient, count):
+    products = []
+    for index in range(count):
+        recipe = make_recipe(ingredient.creator, f'餅乾 {index}', [(ingredient, 100 * (index + 1))])
+        products.append(make_product(ingredient.creator, recipe))
+    return products
+
+
+def cost_state(product):
+    product = db.session.get(Product, product.id)
+    return product.calculated_cost, product.cost_computed_at
+
+
+def test_price_change_updates_dependent_products_inline(butter):
+    products = products_using(butter, 3)
+    assert all(cost_state(product)[1] is None for product in products)
+
+    add_price(butter.creator, butter, price=300, quantity=1, unit='kg')
+
+    for index, product in enumerate(products):
+        cost, computed_at = cost_state(product)
+        # 300 元 / 1000 g，每個產品的食譜用量為 100 g、200 g、300 g
+        assert cost == pytest.approx(0.3 * 100 * (index + 1))
+        assert computed_at is not None
+
+
+def test_price_change_over_the_inline_limit_marks_products_stale(app, butter):
+    products = products_using(butter, 3)
+    add_price(butter.creator, butter, price=100, quantity=1, unit='kg')
+    assert all(cost_state(product)[1] is not None for product in products)
+
+    app.config['COST_RECOMPUTE_INLINE_LIMIT'] = 2
+    add_price(butter.creator, butter, price=300, quantity=1, unit='kg')
+    assert all(cost_state(product)[1] is None for product in products)
+    # 標記為待計算時保留舊的成本，直到重新計算為止
+    assert cost_state(products[0])[0] == pytest.approx(10.0)
+
+    assert recompute_stale_products() == 3
+    for index, product in enumerate(products):
+        cost, computed_at = cost_state(product)
+        assert cost == pytest.approx(0.3 * 100 * (index + 1))
+        assert computed_at is not None
+    assert recompute_stale_products() == 0
+
+
+def test_recompute_with_process_pool_matches_inline_calculation(app, butter):
+    app.config['COST_RECOMPUTE_INLINE_LIMIT'] = 0
+    products = products_using(butter, 4)
+    add_price(butter.creator, butter, price=300, quantity=1, unit='kg')
+
+    app.config['COST_RECOMPUTE_POOL_THRESHOLD'] = 1
+    assert recompute_stale_products(workers=2) == 4
+    for index, product in enumerate(products):
+        cost, computed_at = cost_state(product)
+        assert cost == pytest.approx(0.3 * 100 * (index + 1))
+        assert computed_at is not None
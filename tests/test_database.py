@@ -0,0 +1,29 @@
+# tests/test_database.py
+# 讀寫分流 (app.database.RoutingSession) 的測試
+from app import db
+from app.database import READ_BIND_KEY, sqlite_profile, use_primary
+
+
+def test_get_requests_read_from_replica(app):
+    with app.test_request_context('/', method='GET'):
+        assert db.session.get_bind() is db.engines[READ_BIND_KEY]
+    with app.test_request_context('/', method='POST'):
+        assert db.session.get_bind() is db.engine
+
+
+def test_use_primary_routes_get_requests_to_primary(app):
+    @use_primary
+    def view():
+        return db.session.get_bind()
+
+    with app.test_request_context('/', method='GET'):
+        assert view() is db.engine
+
+
+def test_wal_is_only_enabled_when_configured(app):
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'delete'
+
+    config = dict(app.config, SQLITE_WAL=True)
+    assert sqlite_profile(config)[1]['journal_mode'] == 'WAL'
+    assert 'journal_mode' not in sqlite_profile(config, read_only=True)[1]
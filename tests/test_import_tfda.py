@@ -0,0 +1,177 @@
+# tests/test_import_tfda.py
+# TFDA 匯入程式的離線測試 (資料來源為 tests/fixtures/tfda_sample.json)
+import io
+import json
+import sqlite3
+
+import pytest
+
+import import_tfda_data
+from app import db
+from app.models import Ingredient, Product, Recipe, RecipeItem, User
+from app.recipe_snapshots import snapshot_totals
+
+
+def load_records(path):
+    with open(path, encoding='utf-8-sig') as fp:
+        return list(import_tfda_data.group_records(import_tfda_data.iter_json_array(fp)))
+
+
+def sync(db_path, records):
+    db.session.commit()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        counts = import_tfda_data.sync_records(conn, iter(records))
+    finally:
+        conn.close()
+    db.session.expire_all()
+    return counts
+
+
+def make_product(name, components):
+    """建立使用 components ([(Ingredient 或 Recipe, 公克數), ...]) 的食譜與產品，回傳 (食譜, 產品)。"""
+    user = User.query.filter_by(username='tester').first()
+    if user is None:
+        user = User(username='tester', email='tester@example.com')
+        user.set_password('secret')
+        db.session.add(user)
+    recipe = Recipe(recipe_name=name, author=user, servings_count=1)
+    for component, quantity_g in components:
+        if isinstance(component, Recipe):
+            recipe.ingredients.append(RecipeItem(sub_recipe=component, quantity_g=quantity_g))
+        else:
+            recipe.ingredients.append(RecipeItem(ingredient=component, quantity_g=quantity_g))
+    product = Product(product_name=name, creator=user, recipe=recipe, batch_size=1)
+    db.session.add_all([recipe, product])
+    db.session.commit()
+    return recipe, product
+
+
+def cost_is_stale(product):
+    return db.session.get(Product, product.id).cost_computed_at is None
+
+
+# --- 讀取與分組 ---
+
+@pytest.mark.parametrize('chunk_size', [7, 64, 64 * 1024])
+def test_iter_json_array_matches_json_load(fixture_path, chunk_size):
+    path = fixture_path('tfda_sample.json')
+    with open(path, encoding='utf-8') as fp:
+        expected = json.load(fp)
+    with open(path, encoding='utf-8') as fp:
+        assert list(import_tfda_data.iter_json_array(fp, chunk_size=chunk_size)) == expected
+
+
+@pytest.mark.parametrize('content', ['{"a": 1}', '[{"a": 1}, {"a": 2}'])
+def test_iter_json_array_rejects_malformed_input(content):
+    with pytest.raises(ValueError):
+        list(import_tfda_data.iter_json_array(io.StringIO(content), chunk_size=4))
+
+
+def test_group_records(fixture_path):
+    records = {record['tfda_id']: record for record in load_records(fixture_path('tfda_sample.json'))}
+    assert list(records) == ['A0100101', 'B0200201', 'C0300301']
+    assert records['A0100101']['food_name'] == '大麥仁'
+    assert records['A0100101']['protein_g'] == pytest.approx(8.6)
+    # 重複的分析項取平均
+    assert records['B0200201']['calories_kcal'] == pytest.approx(64.0)
+    # 缺少的分析項為 None，無法解析的數值為 0
+    assert records['C0300301']['protein_g'] is None
+    assert records['C0300301']['sodium_mg'] == 0.0
+
+
+# --- 同步 ---
+
+def test_sync_inserts_new_ingredients(app, db_path, fixture_path):
+    counts = sync(db_path, load_records(fixture_path('tfda_sample.json')))
+    assert (counts['staged'], counts['inserted'], counts['updated'], counts['unchanged']) == (3, 3, 0, 0)
+
+    butter = Ingredient.query.filter_by(tfda_id='C0300301').one()
+    assert butter.source == 'TFDA'
+    assert butter.calories_kcal == pytest.approx(733.0)
+    assert butter.protein_g == 0
+    assert butter.content_hash
+
+
+def test_resync_without_changes_writes_nothing(app, db_path, fixture_path):
+    records = load_records(fixture_path('tfda_sample.json'))
+    sync(db_path, records)
+    barley = Ingredient.query.filter_by(tfda_id='A0100101').one()
+    _, product = make_product('大麥飯', [(barley, 100)])
+
+    counts = sync(db_path, records)
+    assert (counts['inserted'], counts['updated'], counts['unchanged']) == (0, 0, 3)
+    assert counts['stale_products'] == counts['stale_recipes'] == 0
+    assert not cost_is_stale(product)
+
+
+def test_changed_ingredient_marks_products_stale(app, db_path, fixture_path):
+    records = load_records(fixture_path('tfda_sample.json'))
+    sync(db_path, records)
+    barley = Ingredient.query.filter_by(tfda_id='A0100101').one()
+    milk = Ingredient.query.filter_by(tfda_id='B0200201').one()
+    _, uses_barley = make_product('大麥飯', [(barley, 100)])
+    _, uses_milk = make_product('鮮奶', [(milk, 200)])
+
+    changed = [dict(record, calories_kcal=400.0) if record['tfda_id'] == 'A0100101' else record
+               for record in records]
+    counts = sync(db_path, changed)
+    assert (counts['inserted'], counts['updated'], counts['unchanged']) == (0, 1, 2)
+    assert counts['stale_products'] == 1
+    assert cost_is_stale(uses_barley)
+    assert not cost_is_stale(uses_milk)
+    assert db.session.get(Ingredient, barley.id).calories_kcal == pytest.approx(400.0)
+
+
+def test_removed_ingredients_are_deleted_unless_referenced(app, db_path, fixture_path):
+    records = load_records(fixture_path('tfda_sample.json'))
+    sync(db_path, records)
+    barley = Ingredient.query.filter_by(tfda_id='A0100101').one()
+    make_product('大麥飯', [(barley, 100)])
+
+    counts = sync(db_path, [record for record in records if record['tfda_id'] == 'B0200201'])
+    assert (counts['removed'], counts['retained']) == (1, 1)
+    assert Ingredient.query.filter_by(tfda_id='A0100101').count() == 1
+    assert Ingredient.query.filter_by(tfda_id='C0300301').count() == 0
+
+
+def test_changed_ingredient_marks_products_using_it_through_sub_recipes_stale(app, db_path, fixture_path):
+    records = load_records(fixture_path('tfda_sample.json'))
+    sync(db_path, records)
+    milk = Ingredient.query.filter_by(tfda_id='B0200201').one()
+    barley = Ingredient.query.filter_by(tfda_id='A0100101').one()
+    cream, _ = make_product('奶餡', [(milk, 300)])
+    filling, _ = make_product('內餡', [(cream, 100), (barley, 50)])
+    _, cake = make_product('蛋糕', [(filling, 200)])
+
+    changed = [dict(record, fat_g=5.0) if record['tfda_id'] == 'B0200201' else record for record in records]
+    counts = sync(db_path, changed)
+    assert counts['stale_products'] == 3
+    assert cost_is_stale(cake)
+
+
+def test_changed_ingredient_invalidates_recipe_snapshots(app, db_path, fixture_path):
+    records = load_records(fixture_path('tfda_sample.json'))
+    sync(db_path, records)
+    milk = Ingredient.query.filter_by(tfda_id='B0200201').one()
+    barley = Ingredient.query.filter_by(tfda_id='A0100101').one()
+    cream, _ = make_product('奶餡', [(milk, 300)])
+    cake, _ = make_product('蛋糕', [(cream, 100), (barley, 50)])
+    rice, _ = make_product('大麥飯', [(barley, 100)])
+    assert all(snapshot_totals(recipe) is not None for recipe in (cream, cake, rice))
+
+    changed = [dict(record, fat_g=5.0) if record['tfda_id'] == 'B0200201' else record for record in records]
+    counts = sync(db_path, changed)
+    assert counts['stale_recipes'] == 2
+    assert snapshot_totals(db.session.get(Recipe, cream.id)) is None
+    assert snapshot_totals(db.session.get(Recipe, cake.id)) is None
+    assert snapshot_totals(db.session.get(Recipe, rice.id)) is not None
+
+
+def test_failed_import_exits_with_nonzero_status(app, db_path, tmp_path):
+    malformed = tmp_path / 'malformed.json'
+    malformed.write_text('{"a": 1}', encoding='utf-8')
+    with pytest.raises(SystemExit) as excinfo:
+        import_tfda_data.import_data(str(malformed), db_path, recompute_costs=False)
+    assert excinfo.value.code == 1
+    assert Ingredient.query.count() == 0
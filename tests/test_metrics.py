@@ -0,0 +1,115 @@
+# tests/test_metrics.py
+# /metrics 的存取控制、Prometheus 文字格式與多行程檔案的加總
+import json
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.metrics import MetricsRegistry, render
+from tests.factories import login, make_user
+
+BUCKETS = (0.1, 1.0, math.inf)
+
+
+@pytest.fixture
+def client(app):
+    app.config['ADMIN_USERNAMES'] = frozenset({'admin'})
+    return app.test_client()
+
+
+def test_metrics_denied_by_default(client):
+    assert client.get('/metrics').status_code == 403
+    login(client, make_user('baker'))
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_token(app, client):
+    app.config['METRICS_TOKEN'] = 's3cret'
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE http_request_duration_seconds histogram' in response.get_data(as_text=True)
+
+
+def test_metrics_admin_without_token(client):
+    login(client, make_user('admin'))
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_bucket{endpoint=' in response.get_data(as_text=True)
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry(buckets=BUCKETS)
+    registry.observe('app_operation_duration_seconds', 0.05, operation='search')
+    registry.observe('app_operation_duration_seconds', 0.5, operation='search')
+    registry.observe('app_operation_duration_seconds', 2.0, operation='search')
+    registry.inc('app_sql_queries_total', 3, endpoint='recipes.index')
+    registry.set_gauge('app_cache_entries', 7, cache='nutrition')
+    registry.inc('custom_total', label='a "quoted"\nvalue')
+
+    assert render(registry.collect()) == '\n'.join([
+        '# HELP app_sql_queries_total 端點執行的 SQL 查詢總數',
+        '# TYPE app_sql_queries_total counter',
+        'app_sql_queries_total{endpoint="recipes.index"} 3',
+        '# TYPE custom_total counter',
+        'custom_total{label="a \\"quoted\\"\\nvalue"} 1',
+        '# HELP app_cache_entries 快取目前的項目數',
+        '# TYPE app_cache_entries gauge',
+        'app_cache_entries{cache="nutrition"} 7',
+        '# HELP app_operation_duration_seconds 熱點函式與匯入階段的執行時間',
+        '# TYPE app_operation_duration_seconds histogram',
+        'app_operation_duration_seconds_bucket{operation="search",le="0.1"} 1',
+        'app_operation_duration_seconds_bucket{operation="search",le="1.0"} 2',
+        'app_operation_duration_seconds_bucket{operation="search",le="+Inf"} 3',
+        'app_operation_duration_seconds_sum{operation="search"} 2.55',
+        'app_operation_duration_seconds_count{operation="search"} 3',
+    ]) + '\n'
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def worker_registry(directory, pid, buckets=BUCKETS):
+    """模擬其他 worker 行程：以指定的 pid 寫出自己的檔案。"""
+    registry = MetricsRegistry(buckets=buckets)
+    registry.configure(str(directory))
+    registry._pid = pid
+    return registry
+
+
+def test_multiprocess_files_are_merged(tmp_path):
+    live = worker_registry(tmp_path, os.getppid())
+    exited = worker_registry(tmp_path, exited_pid())
+    # 部署前未清空目錄留下的舊檔案：區間設定不同
+    stale = worker_registry(tmp_path, exited_pid(), buckets=(0.5, math.inf))
+    for registry, seconds in ((live, 0.05), (exited, 0.5), (stale, 0.2)):
+        registry.observe('http_request_duration_seconds', seconds, endpoint='main.index', method='GET', status=200)
+        registry.inc('app_sql_queries_total', 2, endpoint='main.index')
+        registry.set_gauge('app_cache_entries', 10, cache='nutrition')
+        registry.flush()
+    assert len(list(tmp_path.glob('metrics_*.json'))) == 3
+
+    current = MetricsRegistry(buckets=BUCKETS)
+    current.configure(str(tmp_path))
+    current.set_gauge('app_cache_entries', 1, cache='nutrition')
+    state = current.collect()
+
+    labels = (('endpoint', 'main.index'), ('method', 'GET'), ('status', '200'))
+    # 計數器包含已結束的行程
+    assert state['counters'][('app_sql_queries_total', (('endpoint', 'main.index'),))] == 6
+    # 量表只加總仍存活的行程 (live 與目前的行程)
+    assert state['gauges'][('app_cache_entries', (('cache', 'nutrition'),))] == 11
+    # 區間不同的舊檔案不加入直方圖
+    assert state['histograms'][('http_request_duration_seconds', labels)] == [1, 1, 0, pytest.approx(0.55)]
+    # 目前的行程也寫出了自己的檔案
+    with open(tmp_path / f'metrics_{os.getpid()}.json', encoding='utf-8') as fp:
+        assert json.load(fp)['gauges'] == [['app_cache_entries', [['cache', 'nutrition']], 1]]
@@ -0,0 +1,30 @@
+# tests/test_nutrition_cache.py
+# 營養計算快取的跨行程失效 (以兩個共用標記檔的快取模擬兩個 worker)
+from app.nutrition_cache import NutritionCache
+
+TOTALS = {'total_weight_g': 100.0}
+
+
+def fill(cache, recipe_id, ingredient_id=10):
+    _, generation = cache.get_many([recipe_id])
+    cache.put_many([(recipe_id, 1, {ingredient_id}, set(), TOTALS)], generation)
+
+
+def test_publish_clears_other_processes(tmp_path):
+    stamp = str(tmp_path / 'nutrition_cache.stamp')
+    worker_a, worker_b = NutritionCache(shared_stamp_path=stamp), NutritionCache(shared_stamp_path=stamp)
+    fill(worker_a, 1)
+    fill(worker_b, 2, ingredient_id=20)
+
+    worker_b.invalidate({('ingredient', 10)})
+    worker_b.publish()
+    assert worker_a.get_many([1])[0] == {}
+    # 發出通知的行程只讓受影響的食譜失效，其他內容保留
+    assert worker_b.get_many([2])[0] == {2: TOTALS}
+
+
+def test_without_shared_stamp_entries_stay_cached(tmp_path):
+    cache = NutritionCache()
+    fill(cache, 1)
+    cache.publish()
+    assert cache.get_many([1])[0] == {1: TOTALS}
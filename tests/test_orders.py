@@ -0,0 +1,111 @@
+# tests/test_orders.py
+# 訂單批次寫入：冪等、庫存扣除、引用檢查與售出當時的產品成本
+import pytest
+
+from app import db
+from app.costing import mark_products_stale
+from app.models import Ingredient, Order, OrderItem, Product, Recipe, RecipeItem, User
+from app.orders.ingest import ingest_orders
+
+
+def make_product(username, name='奶油餅乾', stock=10):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        user = User(username=username, email=f'{username}@example.com')
+        user.set_password('secret')
+        db.session.add(user)
+    butter = Ingredient(food_name=f'無鹽奶油 {name}', source='USER', creator=user, cost_per_unit=50)
+    recipe = Recipe(recipe_name=name, author=user, servings_count=1)
+    recipe.ingredients.append(RecipeItem(ingredient=butter, quantity_g=100))
+    product = Product(product_name=name, creator=user, recipe=recipe, batch_size=1, selling_price=120,
+                      stock_quantity=stock)
+    db.session.add_all([butter, recipe, product])
+    db.session.commit()
+    return product
+
+
+def order(key, *items):
+    return {'idempotency_key': key, 'items': [{'product_id': product_id, 'quantity': quantity}
+                                              for product_id, quantity in items]}
+
+
+def stock_of(product):
+    return db.session.get(Product, product.id).stock_quantity
+
+
+@pytest.fixture
+def product(app):
+    return make_product('tester')
+
+
+def test_resent_batch_creates_no_duplicates(product):
+    orders = [order('pos-1', (product.id, 1)), order('pos-2', (product.id, 2))]
+    first = ingest_orders(orders, product.user_id)
+    assert [entry['index'] for entry in first.created] == [0, 1]
+
+    again = ingest_orders(orders, product.user_id)
+    assert again.created == [] and again.errors == []
+    assert sorted((entry['idempotency_key'], entry['id']) for entry in again.duplicates) == \
+        sorted((entry['idempotency_key'], entry['id']) for entry in first.created)
+    assert Order.query.count() == 2
+    assert stock_of(product) == 7
+
+
+def test_repeated_key_in_one_request_is_written_once(product):
+    result = ingest_orders([order('pos-1', (product.id, 1)), order('pos-1', (product.id, 1))], product.user_id)
+    assert len(result.created) == 1
+    assert result.duplicates == [{'index': 1, 'idempotency_key': 'pos-1', 'id': result.created[0]['id']}]
+    assert Order.query.count() == 1
+    assert stock_of(product) == 9
+
+
+def test_stock_is_decremented_once_per_product_across_orders(product):
+    other = make_product('tester', name='巧克力餅乾', stock=5)
+    result = ingest_orders([
+        order('pos-1', (product.id, 2), (other.id, 1)),
+        order('pos-2', (product.id, 3)),
+        order('pos-3', (other.id, 4), (product.id, 1)),
+    ], product.user_id)
+    assert len(result.created) == 3
+    assert stock_of(product) == 10 - 6
+    # 庫存不足仍照常寫入，庫存成為負數
+    assert stock_of(other) == 5 - 5
+    assert OrderItem.query.count() == 5
+
+
+def test_products_of_other_users_are_rejected(product):
+    stranger = make_product('stranger', name='別人的餅乾')
+    result = ingest_orders([order('pos-1', (stranger.id, 1)), order('pos-2', (product.id, 1))], product.user_id)
+    assert [entry['idempotency_key'] for entry in result.created] == ['pos-2']
+    assert result.errors == [{'index': 0, 'idempotency_key': 'pos-1', 'message': f'找不到產品：{stranger.id}'}]
+    assert stock_of(stranger) == 10
+
+
+def test_invalid_orders_do_not_affect_the_rest_of_the_batch(product):
+    result = ingest_orders([
+        order('pos-1', (product.id, 1)),
+        {'idempotency_key': 'pos-2', 'items': []},
+        order('pos-3', (product.id, 0)),
+        {'items': [{'product_id': product.id, 'quantity': 1}]},
+        order('pos-5', (product.id, 2)),
+    ], product.user_id)
+    assert [entry['idempotency_key'] for entry in result.created] == ['pos-1', 'pos-5']
+    assert [error['index'] for error in result.errors] == [1, 2, 3]
+    assert Order.query.count() == 2
+    assert stock_of(product) == 7
+
+
+def test_stale_product_cost_is_recomputed_before_recording_the_sale(product):
+    # 模擬食材價格變動後尚未重新計算的產品：成本欄位仍是舊值
+    db.session.execute(db.update(Product).where(Product.id == product.id).values(calculated_cost=1.0))
+    mark_products_stale([product.id])
+    db.session.commit()
+
+    result = ingest_orders([order('pos-1', (product.id, 2))], product.user_id)
+    assert len(result.created) == 1
+
+    item = OrderItem.query.one()
+    refreshed = db.session.get(Product, product.id)
+    assert refreshed.cost_computed_at is not None
+    assert item.cost_at_sale == pytest.approx(refreshed.calculated_cost)
+    assert item.cost_at_sale != pytest.approx(1.0)
@@ -0,0 +1,101 @@
+# tests/test_pagination.py
+# 列表 API (食譜、產品、價格) 的 keyset 分頁：排序值相同的資料列跨頁時不重複也不遺漏，竄改的游標回傳 400
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app import db
+from app.models import Product, Recipe
+from tests.factories import add_price, login, make_ingredient, make_product, make_recipe, make_user
+
+SAME_TIME = datetime(2026, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client(app):
+    """7 個食譜、產品與有價格的食材，名稱兩兩相同，其中 4 筆的修改時間 (購買日期) 也相同。"""
+    user = make_user()
+    other = make_user('other')
+    for index in range(7):
+        name = f'品項 {index // 2}'
+        ingredient = make_ingredient(user, name)
+        add_price(user, ingredient, price=10, quantity=100, purchase_date=SAME_TIME if index < 4 else None)
+        make_product(user, make_recipe(user, name, [(ingredient, 100)]))
+    # 其他使用者的資料不應出現在列表中
+    make_product(other, make_recipe(other, '品項 0', [(make_ingredient(other, '品項 0'), 100)]))
+
+    for model in (Recipe, Product):
+        ids = db.session.scalars(db.select(model.id).where(model.user_id == user.id).order_by(model.id).limit(4))
+        db.session.execute(db.update(model).where(model.id.in_(list(ids))).values(updated_at=SAME_TIME))
+    db.session.commit()
+    return login(app.test_client(), user)
+
+
+@pytest.fixture
+def empty_client(app):
+    return login(app.test_client(), make_user())
+
+
+def collect(client, url, key, **params):
+    ids, cursor = [], None
+    while True:
+        response = client.get(url, query_string={**params, 'limit': 2, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        assert len(data['items']) <= 2
+        ids.extend(item[key] for item in data['items'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            return ids
+
+
+ENDPOINTS = [
+    ('/recipes/api/recipes', 'id', ['updated', 'name']),
+    ('/products/api/products', 'id', ['name', 'updated']),
+    ('/pricing/api/prices', 'ingredient_id', ['name', 'purchase_date']),
+]
+
+
+@pytest.mark.parametrize('url, key, sort', [
+    (url, key, sort) for url, key, sorts in ENDPOINTS for sort in sorts
+])
+def test_pages_have_no_duplicates_or_gaps(client, url, key, sort):
+    first_page = client.get(url, query_string={'sort': sort, 'limit': 100}).get_json()
+    expected = [item[key] for item in first_page['items']]
+    assert len(set(expected)) == 7 and first_page['next_cursor'] is None
+
+    assert collect(client, url, key, sort=sort) == expected
+
+
+def cursor_of(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+TAMPERED_CURSORS = [
+    'not-a-cursor',
+    '%%%',
+    cursor_of(['name', 'x']),
+    cursor_of({'s': 'name'}),
+    cursor_of({'s': 'other', 'v': ['品項 0', 1]}),
+    cursor_of({'s': 'name', 'v': ['品項 0']}),
+    cursor_of({'s': 'name', 'v': [{'a': 1}, 1]}),
+    cursor_of({'s': 'name', 'v': ['品項 0', [1]]}),
+    cursor_of({'s': 'updated', 'v': [['2026-06-01'], 1]}),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+]
+
+
+@pytest.mark.parametrize('url, sort', [
+    (url, sort) for url, _, sorts in ENDPOINTS for sort in sorts
+])
+def test_tampered_cursor_returns_400(empty_client, url, sort):
+    for cursor in TAMPERED_CURSORS:
+        response = empty_client.get(url, query_string={'sort': sort, 'cursor': cursor})
+        assert response.status_code == 400, cursor
+        assert response.get_json()['status'] == 'error'
+
+
+def test_unknown_sort_returns_400(empty_client):
+    assert empty_client.get('/recipes/api/recipes', query_string={'sort': 'price'}).status_code == 400
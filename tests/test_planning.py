@@ -0,0 +1,99 @@
+# tests/test_planning.py
+# 生產計畫的用料展開 (ProductionPlanner)：子食譜展開、批次換算、電費與人力、採購清單
+import pytest
+
+from app import db
+from app.models import Product
+from app.planning import ProductionPlanner
+from tests.factories import add_price, make_ingredient, make_product, make_recipe, make_user
+
+
+@pytest.fixture
+def egg_tart(app):
+    """
+    卡士達 (牛奶 400 g + 糖 100 g，成品 400 g) 200 g + 麵粉 200 g + 奶油 100 g，食譜 4 份；產品一批 6 個。
+    展開後每份食譜：麵粉 200、奶油 100、牛奶 200、糖 50 g，每批為 1.5 倍。
+    """
+    app.config['ELECTRICITY_COST_PER_KWH'] = 4.0
+    app.config['LABOR_COST_PER_HOUR'] = 200.0
+    user = make_user()
+    flour = make_ingredient(user, '低筋麵粉')
+    butter = make_ingredient(user, '無鹽奶油')
+    milk = make_ingredient(user, '鮮奶', density_g_per_ml=1.0)
+    # 沒有價格紀錄，使用預設成本 4 元 / 100 g
+    sugar = make_ingredient(user, '細砂糖', cost_per_unit=4)
+    custard = make_recipe(user, '卡士達', [(milk, 400), (sugar, 100)], final_weight_g=400)
+    tart = make_recipe(user, '蛋塔', [(flour, 200), (butter, 100), (custard, 200)], servings_count=4)
+    product = make_product(user, tart, batch_size=6, bake_power_w=2000, bake_time_min=30, production_time_hr=1.5)
+
+    add_price(user, flour, price=50, quantity=1, unit='kg')
+    add_price(user, butter, price=300, quantity=500, unit='g')
+    add_price(user, milk, price=90, quantity=1000, unit='ml')
+    return user, product
+
+
+def test_plan_expands_sub_recipes_and_batches(egg_tart):
+    user, product = egg_tart
+    result = ProductionPlanner.for_user(user.id, [product.id]).plan({product.id: 10})
+
+    # 10 個需要 2 批 (共 12 個)
+    # 每批食材：麵粉 300×0.05 + 奶油 150×0.6 + 牛奶 300×0.09 + 糖 75×0.04 = 135
+    # 每批電費：2 kW × 0.5 h × 4 = 4，人力：1.5 h × 200 = 300
+    planned, = result['products']
+    assert (planned['planned_quantity'], planned['batches'], planned['produced_quantity']) == (10, 2, 12)
+    assert planned['ingredient_cost'] == pytest.approx(270)
+    assert planned['electricity_cost'] == pytest.approx(8)
+    assert planned['labor_cost'] == pytest.approx(600)
+    assert planned['total_cost'] == pytest.approx(878)
+    assert result['totals'] == pytest.approx(
+        {'ingredient_cost': 270, 'electricity_cost': 8, 'labor_cost': 600, 'total_cost': 878}
+    )
+    # 與儲存的平均單位成本一致
+    calculated_cost = db.session.get(Product, product.id).calculated_cost
+    assert calculated_cost == pytest.approx(878 / 12)
+
+    # 依成本由高到低排列；糖沒有價格紀錄，無法換算成購買單位
+    shopping = [
+        (item['food_name'], item['grams'], item['purchase_unit'], item['purchase_amount'], item['packages'],
+         item['cost'], item['cost_source'])
+        for item in result['shopping_list']
+    ]
+    assert shopping == [
+        ('無鹽奶油', pytest.approx(300), 'g', pytest.approx(300), 1, pytest.approx(180), 'price'),
+        ('鮮奶', pytest.approx(600), 'ml', pytest.approx(600), 1, pytest.approx(54), 'price'),
+        ('低筋麵粉', pytest.approx(600), 'kg', pytest.approx(0.6), 1, pytest.approx(30), 'price'),
+        ('細砂糖', pytest.approx(150), None, None, None, pytest.approx(6), 'default'),
+    ]
+
+
+def test_plan_skips_products_of_other_users_and_zero_quantities(egg_tart):
+    user, product = egg_tart
+    other = make_user('other')
+    planner = ProductionPlanner.for_user(other.id, [product.id])
+    assert planner.product_ids == []
+
+    result = ProductionPlanner.for_user(user.id, [product.id]).plan({product.id: 0})
+    assert result['products'] == [] and result['shopping_list'] == []
+    assert result['totals']['total_cost'] == 0
+
+
+@pytest.mark.parametrize('servings_count', [0, None])
+def test_missing_servings_count_counts_as_one_serving(servings_count):
+    jobs = [{
+        'product_id': 1,
+        'items': [(10, 100.0, 0.5, 0.0)],
+        'parameters': {
+            'servings_count': servings_count, 'batch_size': 2, 'bake_power_w': None, 'bake_time_min': None,
+            'production_time_hr': None, 'electricity_cost_per_kwh': 4.0, 'labor_cost_per_hour': 200.0,
+        },
+    }]
+    planner = ProductionPlanner([(1, '奶油餅乾')], jobs, {10: ('無鹽奶油', None, None, 'g', 1000.0)})
+    result = planner.plan({1: 3})
+
+    planned, = result['products']
+    # 一批 2 個，每批用 1 份食譜的 2 倍 (200 g)；3 個需要 2 批
+    assert planned['batches'] == 2
+    assert planned['ingredient_cost'] == pytest.approx(200)
+    assert planned['electricity_cost'] == planned['labor_cost'] == 0
+    item, = result['shopping_list']
+    assert (item['grams'], item['packages']) == (pytest.approx(400), 1)
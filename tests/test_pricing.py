@@ -0,0 +1,85 @@
+# tests/test_pricing.py
+# 食材成本計算方式 (ingredient_latest_price 的彙總欄位) 與價格新增、修改、刪除後的同步
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import db
+from app.models import IngredientLatestPrice, IngredientPrice, Product
+from tests.factories import add_price, login, make_ingredient, make_product, make_recipe, make_user
+
+TODAY = datetime(2026, 6, 30, tzinfo=timezone.utc)
+
+# (幾天前, 價格, 公克數)；每公克成本依序為 0.1、0.3、0.2、0.4
+PRICE_HISTORY = [
+    (100, 100, 1000),
+    (20, 300, 1000),
+    (10, 100, 500),
+    (0, 400, 1000),
+]
+
+
+def aggregate_row(user, ingredient):
+    return db.session.get(IngredientLatestPrice, (user.id, ingredient.id))
+
+
+@pytest.mark.parametrize('strategy, expected_cost_per_gram', [
+    ('latest', 0.4),
+    # 最新購買日往前 30 天內：(0.3 + 0.2 + 0.4) / 3，100 天前的紀錄不計
+    ('moving_average', 0.3),
+    # 總金額 900 / 總公克數 3500
+    ('weighted_average', 900 / 3500),
+    # 最近 2 次購買 (0.4、0.2) 中的最低價
+    ('recent_minimum', 0.2),
+])
+def test_costing_strategy(app, strategy, expected_cost_per_gram):
+    user = make_user(costing_strategy=strategy, costing_window_days=30, costing_window_purchases=2)
+    butter = make_ingredient(user, '無鹽奶油', cost_per_unit=50)
+    product = make_product(user, make_recipe(user, '奶油餅乾', [(butter, 100)]))
+
+    for days_ago, price, grams in PRICE_HISTORY:
+        add_price(user, butter, price=price, quantity=grams, purchase_date=TODAY - timedelta(days=days_ago))
+
+    row = aggregate_row(user, butter)
+    assert row.purchase_count == 4
+    assert row.cost_per_gram_for(strategy) == pytest.approx(expected_cost_per_gram)
+    assert db.session.get(Product, product.id).calculated_cost == pytest.approx(expected_cost_per_gram * 100)
+
+
+def test_add_edit_delete_price_keeps_aggregate_in_sync(app):
+    user = make_user()
+    butter = make_ingredient(user, '無鹽奶油')
+    client = login(app.test_client(), user)
+
+    def post_price(url, price, quantity):
+        data = {'ingredient_name': '無鹽奶油', 'source': 'Manual', 'price': price, 'quantity': quantity, 'unit': 'kg'}
+        response = client.post(url, json=data)
+        assert response.status_code == 200, response.get_json()
+
+    post_price('/pricing/add', 200, 1)
+    first = IngredientPrice.query.one()
+    assert aggregate_row(user, butter).latest_cost_per_gram == pytest.approx(0.2)
+
+    post_price('/pricing/add', 500, 2)
+    second = IngredientPrice.query.filter(IngredientPrice.id != first.id).one()
+    db.session.expire_all()
+    row = aggregate_row(user, butter)
+    assert (row.price_id, row.purchase_count) == (second.id, 2)
+    assert row.latest_cost_per_gram == pytest.approx(0.25)
+    assert row.weighted_avg_cost_per_gram == pytest.approx(700 / 3000)
+
+    post_price(f'/pricing/edit/{second.id}', 600, 2)
+    db.session.expire_all()
+    row = aggregate_row(user, butter)
+    assert row.latest_cost_per_gram == pytest.approx(0.3)
+    assert row.weighted_avg_cost_per_gram == pytest.approx(800 / 3000)
+
+    assert client.post(f'/pricing/delete/{second.id}').status_code == 302
+    db.session.expire_all()
+    row = aggregate_row(user, butter)
+    assert (row.price_id, row.purchase_count) == (first.id, 1)
+    assert row.latest_cost_per_gram == pytest.approx(0.2)
+
+    assert client.post(f'/pricing/delete/{first.id}').status_code == 302
+    db.session.expire_all()
+    assert aggregate_row(user, butter) is None
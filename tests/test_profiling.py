@@ -0,0 +1,58 @@
+# tests/test_profiling.py
+# 管理員以 X-Profile 標頭觸發的單一請求剖析
+import os
+import pstats
+
+import pytest
+
+from tests.factories import login, make_user
+
+
+@pytest.fixture
+def client(app):
+    app.config['ADMIN_USERNAMES'] = frozenset({'admin'})
+    return app.test_client()
+
+
+def profile_files(app):
+    directory = app.config['PROFILER_DIR']
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def test_profile_header_ignored_for_non_admin(app, client):
+    assert client.get('/', headers={'X-Profile': '1'}).headers.get('X-Profile-Id') is None
+    login(client, make_user('baker'))
+    response = client.get('/', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert profile_files(app) == []
+
+
+def test_admin_request_writes_profile(app, client):
+    login(client, make_user('admin'))
+    assert 'X-Profile-Id' not in client.get('/').headers
+
+    response = client.get('/?_profile=1')
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+    assert profile_files(app) == [f'{profile_id}.json', f'{profile_id}.prof']
+
+    stats = pstats.Stats(os.path.join(app.config['PROFILER_DIR'], f'{profile_id}.prof'))
+    assert stats.total_calls > 0
+    recent, = app.extensions['request_profiler'].recent()
+    assert (recent['id'], recent['endpoint'], recent['status'], recent['user']) == (profile_id, 'main.index', 200, 'admin')
+
+    detail = client.get(f'/admin/profiles/{profile_id}')
+    assert detail.status_code == 200
+    assert client.get('/admin/profiles/..%2Fsecret').status_code == 404
+
+
+def test_old_profiles_are_pruned(app, client):
+    app.config['PROFILER_MAX_FILES'] = 2
+    login(client, make_user('admin'))
+    profile_ids = [client.get('/', headers={'X-Profile': '1'}).headers['X-Profile-Id'] for _ in range(4)]
+
+    assert len(set(profile_ids)) == 4
+    kept = sorted(profile_ids)[-2:]
+    assert profile_files(app) == sorted(f'{profile_id}{extension}' for profile_id in kept for extension in ('.json', '.prof'))
+    assert [profile['id'] for profile in app.extensions['request_profiler'].recent()] == kept[::-1]
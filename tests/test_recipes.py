@@ -0,0 +1,70 @@
+# tests/test_recipes.py
+# 食譜的營養計算 (批次與單一食譜一致) 與營養標示預覽 API 的輸入驗證
+import pytest
+
+from app.models import Recipe, calculate_nutrition_bulk
+from app.nutrition_cache import get_nutrition_cache
+from tests.factories import add_price, login, make_ingredient, make_recipe, make_user
+
+
+@pytest.fixture
+def recipes(app):
+    """兩位使用者的食譜：共用的子食譜、兩層子食譜、同一食材各自的價格，以及沒有項目的食譜。"""
+    baker, other = make_user('baker'), make_user('other')
+    flour = make_ingredient(baker, '低筋麵粉', cost_per_unit=5, calories_kcal=360, protein_g=8, carbohydrate_g=76)
+    butter = make_ingredient(baker, '無鹽奶油', cost_per_unit=50, calories_kcal=740, fat_g=82, saturated_fat_g=52)
+    sugar = make_ingredient(baker, '細砂糖', cost_per_unit=4, calories_kcal=387, carbohydrate_g=100, sugar_g=100)
+    add_price(baker, butter, price=300, quantity=500)
+    add_price(other, butter, price=450, quantity=500)
+
+    dough = make_recipe(baker, '塔皮', [(flour, 200), (butter, 100), (sugar, 50)], final_weight_g=320)
+    filling = make_recipe(baker, '奶油餡', [(butter, 100), (sugar, 100), (dough, 40)])
+    return [
+        dough,
+        filling,
+        make_recipe(baker, '奶油塔', [(dough, 160), (filling, 60), (sugar, 5)], servings_count=4),
+        make_recipe(other, '奶酥', [(butter, 80), (sugar, 40)]),
+        make_recipe(baker, '空食譜', []),
+    ]
+
+
+def test_bulk_nutrition_matches_single_recipe(app, recipes):
+    cache = get_nutrition_cache()
+    cache.clear()
+    bulk = calculate_nutrition_bulk(recipes)
+
+    for recipe in recipes:
+        cache.clear()
+        assert bulk[recipe.id] == pytest.approx(recipe.calculate_nutrition()), recipe.recipe_name
+    # 其他使用者以自己的價格計算
+    print(bulk[recipes[2].id])
+
+
+@pytest.mark.parametrize('ingredients', [
+    5,
+    ['bad'],
+    [{'ingredient_id': 1}],
+    [{'ingredient_id': 1, 'quantity_g': None}],
+    [{'ingredient_id': 1, 'quantity_g': 'abc'}],
+    [{'ingredient_id': 'x', 'quantity_g': 10}],
+    [{'sub_recipe_id': [1], 'quantity_g': 10}],
+    [{'sub_recipe_id': 999, 'quantity_g': 10}],
+])
+def test_preview_label_rejects_malformed_items(app, recipes, ingredients):
+    client = login(app.test_client(), recipes[0].author)
+    response = client.post('/recipes/api/recipe/preview_label', json={'ingredients': ingredients})
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+def test_preview_label(app, recipes):
+    client = login(app.test_client(), recipes[0].author)
+    assert client.post('/recipes/api/recipe/preview_label', json={'servings_count': 'two'}).status_code == 400
+
+    dough = recipes[0]
+    response = client.post('/recipes/api/recipe/preview_label', json={
+        'recipe_name': '預覽', 'servings_count': 2,
+        'ingredients': [{'sub_recipe_id': dough.id, 'quantity_g': 100}, {'ingredient_id': None, 'quantity_g': 0}],
+    })
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['ingredients'].startswith('成分：')
@@ -0,0 +1,21 @@
+# tests/test_search.py
+# 自動完成索引的跨行程同步 (另建一個共用標記檔的服務模擬其他 worker)
+from app import db
+from app.models import Ingredient, User
+from app.search import AutocompleteService
+
+
+def test_committed_ingredients_reach_other_processes(app):
+    user = User(username='tester', email='tester@example.com')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+
+    other_worker = AutocompleteService(shared_stamp_path=app.config['AUTOCOMPLETE_STAMP'])
+    other_worker.warm_user(user.id)
+    assert other_worker.search('抹茶', user.id, source='USER') == []
+
+    # 這個 app 的服務在 commit 後更新標記，另一個行程的 overlay 隨之失效
+    db.session.add(Ingredient(food_name='抹茶粉', source='USER', creator=user))
+    db.session.commit()
+    assert [item['name'] for item in other_worker.search('抹茶', user.id, source='USER')] == ['抹茶粉']
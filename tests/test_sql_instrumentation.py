@@ -0,0 +1,21 @@
+# tests/test_sql_instrumentation.py
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from config import _optional_limit
+
+
+def test_failed_statements_do_not_leak_start_times(app):
+    with db.engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM no_such_table'))
+        connection.execute(text('SELECT 1'))
+        assert connection.info.get('query_start_time') == []
+
+
+@pytest.mark.parametrize('value, expected', [(None, 50), ('', 50), ('80', 80), ('0', None), ('None', None)])
+def test_query_budget_setting(value, expected):
+    assert _optional_limit(value, 50) == expected
@@ -0,0 +1,34 @@
+# tests/test_units.py
+# 購買單位換算：Python 與 SQL 版本的結果必須一致
+import pytest
+from sqlalchemy import literal, select
+
+from app import db
+from app.units import cost_per_gram, cost_per_gram_sql, grams_per_unit
+
+CASES = [
+    # (單位, 密度, 每件重量, 每單位公克數)
+    ('kg', None, None, 1000.0),
+    (' 公克 ', None, None, 1.0),
+    ('ml', 0.92, None, 0.92),
+    ('杯', 1.4, None, 336.0),
+    ('ml', None, None, None),
+    ('L', 0, None, None),
+    ('個', None, 55.0, 55.0),
+    ('打', None, None, None),
+    ('把', None, None, None),
+]
+
+
+@pytest.mark.parametrize('unit, density, piece_weight, grams', CASES)
+def test_grams_per_unit(unit, density, piece_weight, grams):
+    assert grams_per_unit(unit, density, piece_weight) == (pytest.approx(grams) if grams else None)
+
+
+@pytest.mark.parametrize('unit, density, piece_weight, grams', CASES)
+def test_cost_per_gram_sql_matches_python(app, unit, density, piece_weight, grams):
+    expected = cost_per_gram(120.0, 2, unit, density, piece_weight)
+    actual = db.session.scalar(select(cost_per_gram_sql(
+        literal(120.0), literal(2), literal(unit), literal(density), literal(piece_weight)
+    )))
+    assert actual == (pytest.approx(expected) if expected is not None else None)
@@ -0,0 +1,61 @@
+# tests/test_what_if.py
+# 食材價格試算：輸入驗證與成本模型的快取
+import pytest
+
+from app import db
+from app.models import Ingredient, Product, Recipe, RecipeItem, User
+from app.what_if import get_portfolio_model
+
+
+@pytest.fixture
+def product(app):
+    user = User(username='tester', email='tester@example.com')
+    user.set_password('secret')
+    butter = Ingredient(food_name='無鹽奶油', source='USER', creator=user, cost_per_unit=50)
+    recipe = Recipe(recipe_name='奶油餅乾', author=user, servings_count=1)
+    recipe.ingredients.append(RecipeItem(ingredient=butter, quantity_g=100))
+    product = Product(product_name='奶油餅乾', creator=user, recipe=recipe, batch_size=1, selling_price=120)
+    db.session.add_all([user, butter, recipe, product])
+    db.session.commit()
+    return product
+
+
+@pytest.fixture
+def client(app, product):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(product.user_id)
+        session['_fresh'] = True
+    return client
+
+
+def test_model_is_reused_until_its_inputs_change(product):
+    model = get_portfolio_model(product.user_id)
+    assert get_portfolio_model(product.user_id) is model
+    assert model.unit_costs[0] == pytest.approx(0.5)
+
+    # 產品參數改變
+    product.selling_price = 150
+    db.session.commit()
+    model = get_portfolio_model(product.user_id)
+    assert model.selling_prices[0] == pytest.approx(150)
+
+    # 食材的預設成本改變 (經由營養計算快取的世代)
+    Ingredient.query.filter_by(food_name='無鹽奶油').one().cost_per_unit = 80
+    db.session.commit()
+    model = get_portfolio_model(product.user_id)
+    assert model.unit_costs[0] == pytest.approx(0.8)
+    assert get_portfolio_model(product.user_id) is model
+
+
+@pytest.mark.parametrize('percent', ['NaN', 'Infinity', '-inf'])
+def test_what_if_rejects_non_finite_percentages(client, percent):
+    response = client.post('/products/api/what_if', json={'changes': {'1': percent}})
+    assert response.status_code == 400
+
+
+def test_what_if(client):
+    response = client.post('/products/api/what_if', json={'changes': {'1': 10}})
+    assert response.status_code == 200
+    scenario = response.get_json()['scenarios'][0]['products'][0]
+    assert scenario['cost_change'] == pytest.approx(5.0)